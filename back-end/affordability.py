@@ -0,0 +1,23 @@
+import numpy as np
+
+# Mortgage maths from calculator/calculator.js, vectorized
+
+FEE_SHARE = 0.3  # share of the monthly salary that goes to the mortgage
+MONTHLY_RATE = 0.00375  # 4.5% a year
+
+
+def months_to_buy(price, monthly_salary, fee_share: float = FEE_SHARE, monthly_rate=MONTHLY_RATE) -> np.ndarray:
+    """
+    Months of repayments to pay off `price` with a monthly fee of `monthly_salary * fee_share`:
+        months = -log(1 - price * r / fee) / log(1 + r)
+    Inputs broadcast against each other. Where the fee doesn't even cover the interest
+    (price * r >= fee) the result is inf; NaN inputs give NaN.
+    """
+    price = np.asarray(price, dtype=float)
+    fee = np.asarray(monthly_salary, dtype=float) * fee_share
+    rate = np.asarray(monthly_rate, dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = price * rate / fee
+        months = -np.log1p(-x) / np.log1p(rate)
+    return np.where(x >= 1, np.inf, months)
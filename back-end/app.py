@@ -1,18 +1,114 @@
-from fastapi import FastAPI, Query, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Query, HTTPException, Depends, Header
+from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 import pandas as pd
 from pathlib import Path
-from prophet import Prophet
+from contextlib import asynccontextmanager
+import os
+import threading
 import numpy as np
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Optional
 from chatbot_service import ChatbotService
-from forecast_model import prep_prophet_df, fit_forecast_prophet
-
-app = FastAPI()
+from metrics import REGISTRY, MetricsMiddleware, process_memory
+from profiling import ProfilingMiddleware, profiling_enabled, profile_authorized, read_index
+from tracing import TracingMiddleware, TracedRoute, tracing_enabled, trace_debug_enabled, exporter as trace_exporter
+from rate_limit import rate_limit
+from forecast_model import borough_forecast, fit_stats, cache_report, DEFAULT_ENGINE
+from forecast_model import load_tuned_settings, tuned_report
+from shared_store import get_forecast_store
+from startup import Startup
+from reconcile import london_forecast, london_mean, DEFAULT_METHOD as RECONCILE_DEFAULT
+from data_store import load_dataset, json_matrix
+from query_store import load_query_store
+from rankings import get_ranking_table
+from rental_data import load_rents, rent_vs_buy, BEDROOMS
+from scenarios import log_params, simulate, cached_simulation
+from affordability import months_to_buy, FEE_SHARE, MONTHLY_RATE
+
+# Startup stages (see lifespan below): required ones abort startup when they fail
+startup = Startup({
+    "data_load": True,
+    "model_params": False,
+    "rent_load": False,
+    "llm_client": False,
+    "index_build": False,
+    "forecast_warmup": False,
+})
+
+# Filled in by the data_load / rent_load stages
+data = None
+rents = None
+query = None
+df = None
+boroughs = []
+borough_map = {}
+chatbot_service = ChatbotService(lazy=True)
+
+
+def _load_data():
+    global data, query, df, boroughs, borough_map
+    data = load_dataset()
+    query = load_query_store(data)
+    df = data.df
+    boroughs = data.boroughs
+    borough_map = data.borough_map  # exact lookup (case-insensitive)
+
+    forecast_store = get_forecast_store()
+    if forecast_store is not None:
+        forecast_store.prune(data.version)  # forecasts of an older data file
+
+
+def _load_model_params():
+    load_tuned_settings(data_version=data.version)
+
+
+def _load_rents():
+    global rents
+    rents = load_rents(data)
+
+
+def _build_indexes():
+    get_ranking_table(data)
+    chatbot_service.load_data(data, rents)
+
+
+def _warm_forecasts():
+    """
+    FORECAST_WARMUP=london (default) builds the London overview forecasts, which fits every
+    borough's forecast they are reconciled from, then adds the London forecast to the chat
+    context; =none skips (the first chat request builds it). With the shared store only the
+    first worker actually fits.
+    """
+    if os.getenv("FORECAST_WARMUP", "london").lower() == "none":
+        return
+    for metric in ("house_price", "annual_income"):
+        london_forecast(data, metric, 6)
+    chatbot_service.load_forecast()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.run("data_load", _load_data)
+    startup.run("model_params", _load_model_params)
+    startup.run("rent_load", _load_rents)
+    startup.run("llm_client", chatbot_service.init_llm)
+    startup.run("index_build", _build_indexes)
+    # Warm-up runs after the server starts listening: /healthz answers, /readyz waits for it
+    threading.Thread(target=startup.run, args=("forecast_warmup", _warm_forecasts), daemon=True).start()
+    yield
+    if chatbot_service.llm is not None:
+        chatbot_service.llm.close()
+    trace_exporter.close()
+
+
+# Per-client token buckets on the expensive routes (rate_limit.py); other routes pass through
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(rate_limit)])
+if tracing_enabled():
+    app.router.route_class = TracedRoute  # endpoint / serialize spans (tracing.py)
 
 # Add CORS middleware
 app.add_middleware(
@@ -22,30 +118,17 @@ app.add_middleware(
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+if tracing_enabled():
+    app.add_middleware(TracingMiddleware)  # outermost: request IDs and sampled traces
 
 BASE_DIR = Path(__file__).resolve().parent
-DATA_FILE = BASE_DIR / "data" / "merged_final.xlsx"
-DATA_SHEET = "merged_annual_long"
 
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
 
-# Load once
-# -------------------------
-df = pd.read_excel(DATA_FILE, sheet_name=DATA_SHEET)
-chatbot_service = ChatbotService()
-
-df["year"] = pd.to_numeric(df["year"], errors="coerce")
-df["Area"] = df["Area"].astype(str).str.strip()
-df["house_price"] = pd.to_numeric(df["house_price"], errors="coerce")
-df["annual_income"] = pd.to_numeric(df["annual_income"], errors="coerce")
-
-df = df.dropna(subset=["year", "Area", "house_price", "annual_income"]).copy()
-df["year"] = df["year"].astype(int)
-
-boroughs = sorted(df["Area"].unique().tolist())
-borough_map = {b.lower(): b for b in boroughs}  # exact lookup (case-insensitive)
-
 
 @app.get("/", response_class=HTMLResponse)
 def home(request: Request):
@@ -53,6 +136,66 @@ def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request, "boroughs": boroughs})
 
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving; includes the startup stage report."""
+    return {"status": "ok", **startup.report()}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 once every startup stage has finished (503 before), so traffic only reaches warm workers."""
+    report = startup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of the in-process metrics."""
+    process_memory()  # refresh the process_memory_bytes gauge
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+if profiling_enabled():
+    @app.get("/api/debug/profiles")
+    def profiles(x_profile: Optional[str] = Header(None)):
+        """Most recent request profiles (newest first); needs the X-Profile token."""
+        if not profile_authorized(x_profile):
+            raise HTTPException(status_code=404, detail="Not Found")
+        return {"profiles": read_index(Path(os.getenv("PROFILE_DIR", "profiles")))}
+
+
+# Traces can include query strings and borough names, so they are only served when opted in
+if tracing_enabled() and trace_debug_enabled():
+    @app.get("/api/debug/traces")
+    def traces(
+        limit: int = Query(50, ge=1, le=500),
+        route: Optional[str] = Query(None, description="Route template, e.g. /api/forecast"),
+        min_ms: Optional[float] = Query(None, ge=0),
+    ):
+        """Most recent sampled request traces (newest first), with their spans."""
+        return {**trace_exporter.stats(), "traces": trace_exporter.recent(limit, route, min_ms)}
+
+    @app.get("/api/debug/traces/{request_id}")
+    def trace(request_id: str):
+        found = trace_exporter.get(request_id)
+        if found is None:
+            raise HTTPException(status_code=404, detail="No trace for this request ID (not sampled, or no longer buffered)")
+        return found
+
+
+@app.get("/api/memory")
+def memory():
+    """Memory held by this worker: process RSS, the dataset arrays (and which are shared mmaps), caches."""
+    return {
+        "pid": os.getpid(),
+        "process": process_memory(),
+        "dataset": data.memory_report() if data is not None else None,
+        "forecast_cache": cache_report(),
+        "chat_context_chars": chatbot_service.index.context_chars() if chatbot_service.index is not None else 0,
+    }
+
+
 @app.get("/api/boroughs")
 def get_boroughs():
     return {"boroughs": boroughs}
@@ -63,14 +206,7 @@ def get_boroughs():
 # ----------------------------
 @app.get("/api/overview")
 def overview():
-    yearly = (
-        df.groupby("year", as_index=False)
-        .agg(
-            house_price=("house_price", "mean"),
-            annual_income=("annual_income", "mean"),
-        )
-        .sort_values("year")
-    )
+    yearly = london_mean(data)
 
     return {
         "title": "London overview (mean across boroughs)",
@@ -84,38 +220,30 @@ def overview():
 # Overview Forecast: London average with Prophet predictions
 # ----------------------------
 @app.get("/api/overview-forecast")
-def overview_forecast(years_ahead: int = Query(6, ge=1, le=20)):
-    """Forecast London-wide averages (mean across all boroughs)."""
+def overview_forecast(
+    years_ahead: int = Query(6, ge=1, le=20),
+    reconcile: Optional[str] = Query(None, pattern="^(bottom_up|mint|direct)$",
+                                     description="How London is derived from the borough forecasts"),
+    engine: Optional[str] = Query(None, pattern="^(prophet|joint)$", description="Forecast engine (default FORECAST_ENGINE)"),
+):
+    """
+    Forecast London-wide averages (mean across all boroughs), built from the cached borough
+    forecasts so it agrees with them (see reconcile.py).
+    """
     # Calculate yearly averages
-    yearly = (
-        df.groupby("year", as_index=False)
-        .agg(
-            house_price=("house_price", "mean"),
-            annual_income=("annual_income", "mean"),
-        )
-        .sort_values("year")
-    )
-    
-    # Prepare for Prophet
-    hp_ts = prep_prophet_df(yearly, "house_price")
-    hp_fc = fit_forecast_prophet(hp_ts, years_ahead=years_ahead)
-    
-    inc_ts = prep_prophet_df(yearly, "annual_income")
-    inc_fc = fit_forecast_prophet(inc_ts, years_ahead=years_ahead)
-    
-    # Convert ds -> year for frontend
-    hp_fc["year"] = hp_fc["ds"].dt.year
-    inc_fc["year"] = inc_fc["ds"].dt.year
+    yearly = london_mean(data)
+    method = reconcile or RECONCILE_DEFAULT
+    engine = engine or DEFAULT_ENGINE
+
+    # Reconciled forecasts (cached per data version)
+    hp_fc = london_forecast(data, "house_price", years_ahead, method, engine)
+    inc_fc = london_forecast(data, "annual_income", years_ahead, method, engine)
     
     # Historical data
     hist_years = yearly["year"].tolist()
     hist_hp = yearly["house_price"].round(0).tolist()
     hist_inc = yearly["annual_income"].round(0).tolist()
     
-    # Forecast data
-    hp_out = hp_fc.sort_values("year")
-    inc_out = inc_fc.sort_values("year")
-    
     return {
         "title": "London overview forecast (mean across boroughs)",
         "history": {
@@ -124,20 +252,22 @@ def overview_forecast(years_ahead: int = Query(6, ge=1, le=20)):
             "annual_income": hist_inc,
         },
         "forecast": {
-            "years": hp_out["year"].tolist(),
+            "years": hp_fc["year"].tolist(),
             "house_price": {
-                "yhat": hp_out["yhat"].round(0).tolist(),
-                "lower": hp_out["yhat_lower"].round(0).tolist(),
-                "upper": hp_out["yhat_upper"].round(0).tolist(),
+                "yhat": hp_fc["yhat"].round(0).tolist(),
+                "lower": hp_fc["yhat_lower"].round(0).tolist(),
+                "upper": hp_fc["yhat_upper"].round(0).tolist(),
             },
             "annual_income": {
-                "yhat": inc_out["yhat"].round(0).tolist(),
-                "lower": inc_out["yhat_lower"].round(0).tolist(),
-                "upper": inc_out["yhat_upper"].round(0).tolist(),
+                "yhat": inc_fc["yhat"].round(0).tolist(),
+                "lower": inc_fc["yhat_lower"].round(0).tolist(),
+                "upper": inc_fc["yhat_upper"].round(0).tolist(),
             },
         },
         "meta": {
             "years_ahead": years_ahead,
+            "reconciliation": method,
+            "engine": engine,
             "note": "Projections are trend-based (Prophet on log-scale). Not causal; uncertainty grows with horizon."
         }
     }
@@ -149,73 +279,42 @@ def overview_forecast(years_ahead: int = Query(6, ge=1, le=20)):
 # ----------------------------
 @app.get("/api/series")
 def series(borough: str = Query(...)):
-    key = borough.strip().lower()
-    if not key:
-        raise HTTPException(status_code=400, detail="Empty borough")
-
-    # 1) exact match
-    if key in borough_map:
-        bname = borough_map[key]
-    else:
-        # 2) partial match
-        matches = [b for b in boroughs if key in b.lower()]
-        if not matches:
-            raise HTTPException(status_code=404, detail="Borough not found")
-
-        # If multiple matches, choose the shortest (often the most specific)
-        # You can change this behavior if you want.
-        matches = sorted(matches, key=len)
-        bname = matches[0]
+    # exact match, then partial match
+    bname = data.resolve(borough)
 
-    d = df[df["Area"] == bname].sort_values("year")
+    d = query.series(bname)
 
     return {
         "title": bname,
-        "years": d["year"].tolist(),
+        "years": d["years"],
         "house_price": d["house_price"].round(0).tolist(),
         "annual_income": d["annual_income"].round(0).tolist(),
     }
 
 
 @app.get("/api/forecast")
-def forecast(borough: str = Query(...), years_ahead: int = Query(6, ge=1, le=20)):
-    key = borough.strip().lower()
-    if not key:
-        raise HTTPException(status_code=400, detail="Empty borough")
-
+def forecast(
+    borough: str = Query(...),
+    years_ahead: int = Query(6, ge=1, le=20),
+    engine: Optional[str] = Query(None, pattern="^(prophet|joint)$", description="Forecast engine (default FORECAST_ENGINE)"),
+):
     # Reusar tu lógica de match
-    if key in borough_map:
-        bname = borough_map[key]
-    else:
-        matches = [b for b in boroughs if key in b.lower()]
-        if not matches:
-            raise HTTPException(status_code=404, detail="Borough not found")
-        matches = sorted(matches, key=len)
-        bname = matches[0]
+    bname = data.resolve(borough)
+    engine = engine or DEFAULT_ENGINE
 
-    d = df[df["Area"] == bname].sort_values("year").copy()
+    d = data.rows(bname)
 
     # --- Precio ---
-    hp_ts = prep_prophet_df(d, "house_price")
-    hp_fc = fit_forecast_prophet(hp_ts, years_ahead=years_ahead)
+    hp_fc = borough_forecast(data, bname, "house_price", years_ahead, engine)
 
     # --- Income ---
-    inc_ts = prep_prophet_df(d, "annual_income")
-    inc_fc = fit_forecast_prophet(inc_ts, years_ahead=years_ahead)
-
-    # Convertir ds -> year para el front
-    hp_fc["year"] = hp_fc["ds"].dt.year
-    inc_fc["year"] = inc_fc["ds"].dt.year
+    inc_fc = borough_forecast(data, bname, "annual_income", years_ahead, engine)
 
     # Histórico (en escala original)
     hist_years = d["year"].tolist()
     hist_hp = d["house_price"].round(0).tolist()
     hist_inc = d["annual_income"].round(0).tolist()
 
-    # Forecast (redondeado para UI)
-    hp_out = hp_fc.sort_values("year")
-    inc_out = inc_fc.sort_values("year")
-
     return {
         "title": f"{bname} forecast",
         "history": {
@@ -224,31 +323,390 @@ def forecast(borough: str = Query(...), years_ahead: int = Query(6, ge=1, le=20)
             "annual_income": hist_inc,
         },
         "forecast": {
-            "years": hp_out["year"].tolist(),  # mismo eje temporal
+            "years": hp_fc["year"].tolist(),  # mismo eje temporal
             "house_price": {
-                "yhat": hp_out["yhat"].round(0).tolist(),
-                "lower": hp_out["yhat_lower"].round(0).tolist(),
-                "upper": hp_out["yhat_upper"].round(0).tolist(),
+                "yhat": hp_fc["yhat"].round(0).tolist(),
+                "lower": hp_fc["yhat_lower"].round(0).tolist(),
+                "upper": hp_fc["yhat_upper"].round(0).tolist(),
             },
             "annual_income": {
-                "yhat": inc_out["yhat"].round(0).tolist(),
-                "lower": inc_out["yhat_lower"].round(0).tolist(),
-                "upper": inc_out["yhat_upper"].round(0).tolist(),
+                "yhat": inc_fc["yhat"].round(0).tolist(),
+                "lower": inc_fc["yhat_lower"].round(0).tolist(),
+                "upper": inc_fc["yhat_upper"].round(0).tolist(),
             },
         },
         "meta": {
             "years_ahead": years_ahead,
+            "engine": engine,
             "note": "Projections are trend-based (Prophet on log-scale). Not causal; uncertainty grows with horizon."
         }
     }
 
 
+@app.get("/api/forecast/fits")
+def forecast_fit_stats():
+    """
+    Prophet fits done by this worker: cold, warm-started or refit, and the time warm starts saved.
+    `settings` is the tuned settings file in use (tune_prophet.py).
+    """
+    return {**fit_stats(), "settings": tuned_report(data.version)}
+
+
+# ----------------------------
+# Affordability: years-to-buy for a salary grid x all boroughs x all years
+# ----------------------------
+MAX_SALARIES = 200
+
+
+def _salary_grid(salaries: Optional[str], salary_min: int, salary_max: int, salary_step: int) -> np.ndarray:
+    # Sizes are checked before any array is built, so a wide range or long list is cheap to reject
+    too_many = HTTPException(status_code=400, detail=f"Provide between 1 and {MAX_SALARIES} positive salaries")
+    if salaries:
+        parts = [s for s in salaries.split(",") if s.strip()]
+        if len(parts) > MAX_SALARIES:
+            raise too_many
+        try:
+            grid = np.array([float(s) for s in parts])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="salaries must be a comma-separated list of numbers")
+    else:
+        if salary_max < salary_min:
+            raise HTTPException(status_code=400, detail="salary_max must be >= salary_min")
+        if (salary_max - salary_min) // salary_step + 1 > MAX_SALARIES:
+            raise too_many
+        grid = np.arange(salary_min, salary_max + 1, salary_step, dtype=float)
+    if grid.size == 0 or (grid <= 0).any():
+        raise too_many
+    return grid
+
+
+@app.get("/api/affordability")
+def affordability(
+    salaries: Optional[str] = Query(None, description="Comma-separated annual salaries, overrides the range"),
+    salary_min: int = Query(20000, ge=1000),
+    salary_max: int = Query(150000, ge=1000),
+    salary_step: int = Query(10000, ge=1000),
+    source: str = Query("history", pattern="^(history|forecast)$"),
+    years_ahead: int = Query(6, ge=1, le=20),
+    engine: Optional[str] = Query(None, pattern="^(prophet|joint)$", description="Forecast engine (default FORECAST_ENGINE)"),
+):
+    """
+    Months needed to buy the average house in every borough and year, for each salary,
+    using the calculator formula (30% of monthly salary, 4.5% a year). Null = never / no data.
+    Matrices are indexed [salary][borough][year].
+    """
+    grid = _salary_grid(salaries, salary_min, salary_max, salary_step)
+
+    if source == "history":
+        years = data.years
+        prices = data.matrices["house_price"]  # (years, boroughs)
+    else:
+        last_year = int(data.years[-1])
+        years = np.arange(last_year + 1, last_year + years_ahead + 1)
+        prices = np.empty((len(years), len(boroughs)))
+        for j, b in enumerate(boroughs):
+            fc = borough_forecast(data, b, "house_price", years_ahead, engine)
+            fc = fc[fc["year"] > last_year]
+            prices[:, j] = fc["yhat"].to_numpy()[: len(years)]
+
+    # (salaries, 1, 1) against (1, boroughs, years) -> (salaries, boroughs, years)
+    months = months_to_buy(prices.T[None, :, :], grid[:, None, None] / 12)
+
+    return {
+        "source": source,
+        "salaries": grid.round(0).tolist(),
+        "boroughs": boroughs,
+        "years": years.tolist(),
+        "months": json_matrix(np.floor(months), 0),  # whole months / years, as the calculator shows them
+        "years_to_buy": json_matrix(np.floor(months / 12), 0),
+        "meta": {
+            "engine": (engine or DEFAULT_ENGINE) if source == "forecast" else None,
+            "fee_share": FEE_SHARE,
+            "annual_rate": round(MONTHLY_RATE * 12, 4),
+            "note": "Repayment of the average house price at 30% of monthly salary. Null means the payment never covers the interest, or no data.",
+        },
+    }
+
+
+# ----------------------------
+# Rankings: price-to-income ratio per year across boroughs (1 = most affordable)
+# ----------------------------
+@app.get("/api/rankings")
+def rankings():
+    """Full year x borough matrices of ratio, rank, percentile and year-over-year change."""
+    table = get_ranking_table(data)
+    return {**table.matrices(), "meta": {"data_version": table.version}}
+
+
+@app.get("/api/rankings/{year}")
+def rankings_year(year: int, n: int = Query(5, ge=1, le=50)):
+    """Most and least affordable boroughs in one year."""
+    table = get_ranking_table(data)
+    if table.row(year) is None:
+        raise HTTPException(status_code=404, detail="Year not found")
+
+    most, least = table.top_bottom(year, n)
+    return {
+        "year": year,
+        "most_affordable": most,
+        "least_affordable": least,
+        "meta": {"boroughs_ranked": int(table.n_valid[table.row(year)]), "data_version": table.version},
+    }
+
+
+# ----------------------------
+# Scenarios: Monte Carlo probability that each borough is affordable by year X
+# ----------------------------
+@app.get("/api/scenarios")
+def scenarios(
+    years_ahead: int = Query(6, ge=1, le=20),
+    boroughs_filter: Optional[str] = Query(None, alias="boroughs", description="Comma-separated boroughs (default all)"),
+    paths: int = Query(2000, ge=100, le=50000),
+    annual_rate: float = Query(0.045, gt=0, le=0.25),
+    rate_sd: float = Query(0.0, ge=0, le=0.1),
+    income_growth: float = Query(0.0, ge=-0.2, le=0.2, description="Extra yearly income growth on top of the forecast"),
+    rho: float = Query(0.5, ge=-1, le=1, description="Correlation of price and income shocks"),
+    salary: Optional[float] = Query(None, gt=0, description="Buyer's annual salary today (default: borough income)"),
+    max_years: int = Query(25, ge=1, le=40),
+    seed: int = Query(42, ge=0),
+    budget_ms: float = Query(500, ge=10, le=10000),
+    engine: Optional[str] = Query(None, pattern="^(prophet|joint)$", description="Forecast engine (default FORECAST_ENGINE)"),
+):
+    engine = engine or DEFAULT_ENGINE
+    names = boroughs
+    if boroughs_filter:
+        names = list(dict.fromkeys(data.resolve(b) for b in boroughs_filter.split(",") if b.strip()))
+    last_year = int(data.years[-1])
+
+    def run():
+        hp_fcs, inc_fcs = [], []
+        for b in names:
+            hp_fcs.append(borough_forecast(data, b, "house_price", years_ahead, engine))
+            inc_fcs.append(borough_forecast(data, b, "annual_income", years_ahead, engine))
+        mu_p, sd_p = log_params(hp_fcs, last_year, years_ahead)
+        mu_i, sd_i = log_params(inc_fcs, last_year, years_ahead)
+
+        cols = [data.column(b) for b in names]
+        last_income = pd.DataFrame(data.matrices["annual_income"][:, cols]).ffill().iloc[-1].to_numpy()
+
+        return simulate(
+            mu_p, sd_p, mu_i, sd_i, last_income,
+            paths=paths, seed=seed, annual_rate=annual_rate, rate_sd=rate_sd, income_growth=income_growth,
+            rho=rho, salary=salary, max_years=max_years, budget_ms=budget_ms,
+        )
+
+    key = (data.version, engine, tuple(names), years_ahead, paths, annual_rate, rate_sd, income_growth, rho, salary, max_years, seed)
+    result = cached_simulation(key, run)
+
+    return {
+        "boroughs": names,
+        "years": list(range(last_year + 1, last_year + years_ahead + 1)),
+        "p_affordable": json_matrix(result["p_affordable"], 3),
+        "p_affordable_by": json_matrix(result["p_affordable_by"], 3),
+        "meta": {
+            "paths": result["paths"],
+            "seed": seed,
+            "engine": engine,
+            "elapsed_ms": round(result["elapsed_ms"], 1),
+            "budget_ms": budget_ms,
+            "within_budget": result["within_budget"],
+            "assumptions": {
+                "annual_rate": annual_rate,
+                "rate_sd": rate_sd,
+                "income_growth": income_growth,
+                "rho": rho,
+                "salary": salary,
+                "max_years": max_years,
+            },
+            "note": "Affordable = repayable within max_years at 30% of monthly income. Paths are drawn from the Prophet forecast bands; matrices are [borough][year].",
+        },
+    }
+
+
+# ----------------------------
+# Rents: monthly rent by borough and bedrooms, and rent vs buy
+# ----------------------------
+def _require_rents():
+    if rents is None:
+        raise HTTPException(status_code=503, detail="Rental data not available")
+    return rents
+
+
+@app.get("/api/rent")
+def rent(borough: Optional[str] = Query(None)):
+    table = _require_rents()
+    selected = [data.resolve(borough)] if borough else None
+    return {"bedrooms": list(BEDROOMS), "rents": table.rows(selected), "source": table.source}
+
+
+@app.get("/api/rent/vs-buy")
+def rent_versus_buy(
+    salary: Optional[float] = Query(None, gt=0, description="Annual salary (default: each borough's income)"),
+    deposit: float = Query(0.1, ge=0, lt=1),
+    term_years: int = Query(25, ge=5, le=40),
+    annual_rate: float = Query(0.045, gt=0, le=0.25),
+):
+    """Rent vs mortgage cost for every borough x bedroom count, as [borough][bedroom] matrices."""
+    table = _require_rents()
+    prices = pd.DataFrame(data.matrices["house_price"]).ffill().iloc[-1].to_numpy()
+    incomes = pd.DataFrame(data.matrices["annual_income"]).ffill().iloc[-1].to_numpy()
+    monthly_income = np.full(len(boroughs), salary / 12) if salary else incomes / 12
+
+    cmp = rent_vs_buy(table.rents, table.avg, prices, monthly_income, deposit, term_years, annual_rate)
+    rows = np.flatnonzero(table.available)
+    return {
+        "boroughs": [boroughs[j] for j in rows],
+        "bedrooms": list(BEDROOMS),
+        "rent": json_matrix(table.rents[rows]),
+        "mortgage_payment": json_matrix(cmp["mortgage_payment"][rows]),
+        "estimated_price": json_matrix(cmp["house_price"][rows]),
+        "deposit": json_matrix(cmp["deposit"][rows]),
+        "rent_burden": json_matrix(cmp["rent_burden"][rows], 3),
+        "mortgage_burden": json_matrix(cmp["mortgage_burden"][rows], 3),
+        "buy_minus_rent": json_matrix(cmp["buy_minus_rent"][rows]),
+        "meta": {
+            "salary": salary,
+            "deposit": deposit,
+            "term_years": term_years,
+            "annual_rate": annual_rate,
+            "note": "Burdens are shares of monthly income (salary, or the borough's latest income). Prices per bedroom count are the borough's latest average price scaled by that bedroom count's rent relative to the average rent.",
+        },
+    }
+
+
+# ----------------------------
+# Compare: several boroughs side by side on a shared year axis
+# ----------------------------
+COMPARE_METRICS = ("house_price", "annual_income", "ratio")
+
+
+@app.get("/api/compare")
+def compare(
+    boroughs_param: str = Query(..., alias="boroughs", description="Comma-separated borough names"),
+    metrics: str = Query("house_price,annual_income,ratio"),
+    from_year: Optional[int] = Query(None),
+    to_year: Optional[int] = Query(None),
+):
+    """
+    Year-aligned [borough][year] matrices for each metric, sliced from the precomputed
+    year x borough arrays. Missing values are null and listed in `gaps`.
+    """
+    names, unresolved = data.resolve_many(boroughs_param.split(","))
+    if not names:
+        raise HTTPException(status_code=404, detail="Borough not found")
+
+    wanted = [m.strip() for m in metrics.split(",") if m.strip()]
+    unknown = [m for m in wanted if m not in COMPARE_METRICS]
+    if unknown or not wanted:
+        raise HTTPException(status_code=400, detail=f"metrics must be among {', '.join(COMPARE_METRICS)}")
+
+    if from_year is not None and to_year is not None and from_year > to_year:
+        raise HTTPException(status_code=400, detail="from_year must be <= to_year")
+
+    lo = np.searchsorted(data.years, from_year) if from_year is not None else 0
+    hi = np.searchsorted(data.years, to_year, side="right") if to_year is not None else len(data.years)
+    cols = [data.column(b) for b in names]
+
+    out = {}
+    missing = np.zeros((len(names), hi - lo), dtype=bool)
+    for m in wanted:
+        source = get_ranking_table(data).ratio if m == "ratio" else data.matrices[m]
+        block = source[lo:hi, cols].T  # (boroughs, years)
+        missing |= np.isnan(block)
+        out[m] = json_matrix(block, 2 if m == "ratio" else 0)
+
+    years = data.years[lo:hi]
+    return {
+        "boroughs": names,
+        "years": years.tolist(),
+        "metrics": out,
+        "gaps": {names[i]: years[missing[i]].tolist() for i in np.flatnonzero(missing.any(axis=1))},
+        "unresolved": unresolved,
+    }
+
+
+# ----------------------------
+# Query: safe filter / aggregate queries over the SQLite copy of the dataset (query_store.py)
+# ----------------------------
+QUERY_METRIC = "^(house_price|annual_income|ratio)$"
+
+
+def _query_payload(columns: list, rows: list, sql: str, unresolved: list = None) -> dict:
+    rows = [[round(v, 4) if isinstance(v, float) else v for v in row] for row in rows]
+    return {"columns": columns, "rows": rows, "unresolved": unresolved or [], "meta": {"sql": sql}}
+
+
+@app.get("/api/query")
+def query_rows(
+    metric: str = Query("ratio", pattern=QUERY_METRIC),
+    agg: Optional[str] = Query(None, pattern="^(avg|min|max|sum|count)$"),
+    group_by: Optional[str] = Query(None, pattern="^(area|year)$"),
+    boroughs_param: Optional[str] = Query(None, alias="boroughs", description="Comma-separated boroughs (default all)"),
+    from_year: Optional[int] = Query(None),
+    to_year: Optional[int] = Query(None),
+    min_value: Optional[float] = Query(None),
+    max_value: Optional[float] = Query(None),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Rows (area, year, value) of one metric, filtered by borough, year range and value range, or an
+    aggregate of them (overall, or per area / per year). E.g. boroughs by mean ratio since 2015:
+    /api/query?metric=ratio&agg=avg&group_by=area&from_year=2015&order=desc
+    """
+    areas, unresolved = data.resolve_many(boroughs_param.split(",")) if boroughs_param else (None, [])
+    if boroughs_param and not areas:
+        raise HTTPException(status_code=404, detail="Borough not found")
+    columns, rows, sql = query.filter(metric, agg, group_by, areas, from_year, to_year, min_value, max_value, order, limit)
+    return _query_payload(columns, rows, sql, unresolved)
+
+
+@app.get("/api/query/change")
+def query_change(
+    from_year: int = Query(...),
+    to_year: int = Query(...),
+    metric: str = Query("ratio", pattern=QUERY_METRIC),
+    min_change_pct: Optional[float] = Query(None),
+    max_change_pct: Optional[float] = Query(None),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Change of a metric per borough between two years, e.g. boroughs where the ratio rose more than
+    50% between 2002 and 2022: /api/query/change?from_year=2002&to_year=2022&min_change_pct=50
+    """
+    columns, rows, sql = query.change(metric, from_year, to_year, min_change_pct, max_change_pct, order, limit)
+    return _query_payload(columns, rows, sql)
+
+
+CHAT_MAX_MESSAGE_CHARS = int(os.getenv("CHAT_MAX_MESSAGE_CHARS", "2000"))
+
+
 class ChatRequest(BaseModel):
-    message: str
+    message: str = Field(max_length=CHAT_MAX_MESSAGE_CHARS)
+    session_id: Optional[str] = Field(None, max_length=64)
 
 @app.post("/api/chat")
 def chat(request: ChatRequest):
-    response = chatbot_service.get_response(request.message)
-    return {"response": response}
+    session = chatbot_service.sessions.get(request.session_id)
+    response, prompt_stats = chatbot_service.respond(request.message, session)
+    return {"response": response, "session_id": session.session_id, "prompt": prompt_stats}
+
+
+@app.get("/api/chat/cache")
+def chat_cache_stats():
+    return chatbot_service.cache.stats()
+
+
+@app.get("/api/chat/sessions")
+def chat_session_stats():
+    return chatbot_service.sessions.stats()
+
+
+@app.get("/api/chat/llm")
+def chat_llm_stats():
+    if chatbot_service.llm is None:
+        return {"backend": None}
+    return chatbot_service.llm.stats()
 
 
@@ -0,0 +1,106 @@
+"""
+Request coalescing check: fires identical forecast requests at the same moment and counts the
+fits that actually ran (forecast cache misses).
+
+    python benchmarks/coalescing.py [--concurrency 16]
+
+Scenarios use fresh boroughs and a 5-year horizon (startup caches 6), so nothing is cached beforehand:
+  prophet      N x /api/forecast for one borough          -> 2 fits (price + income)
+  joint        N x /api/forecast?engine=joint             -> 2 fits (one joint fit per metric)
+  mixed        N requests spread over 4 boroughs          -> 8 fits
+  uncoalesced  the prophet scenario with coalescing off   -> up to 2 x N fits (for comparison)
+
+Limits in thresholds.json ("coalescing") make the script exit 1 if more fits ran than expected,
+if any request failed, or if concurrent callers got different bodies.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from common import report, wait_ready
+
+os.environ.setdefault("SHARED_CACHE_DIR", "")
+os.environ.setdefault("FORECAST_WARMUP", "none")
+os.environ.setdefault("LLM_BACKEND", "mock")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")  # one client hammering every route
+
+import httpx
+import app as api
+import forecast_model
+from metrics import FORECAST_CACHE
+
+COLUMNS = ("requests", "fits", "coalesced", "errors", "distinct_bodies", "wall_ms")
+
+
+class NoCoalescing:
+    def do(self, key, fn):
+        return fn(), False
+
+    def in_flight(self):
+        return 0
+
+
+async def burst(client, paths: list) -> dict:
+    """Send every path at once; fits and coalesced calls are read off the forecast cache counter."""
+    misses = FORECAST_CACHE.value(result="miss")
+    coalesced = FORECAST_CACHE.value(result="coalesced")
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(client.get(p) for p in paths))
+    wall = (time.perf_counter() - start) * 1000
+
+    bodies = {}
+    for p, r in zip(paths, responses):
+        bodies.setdefault(p, set()).add(r.content)
+    return {
+        "requests": len(paths),
+        "fits": int(FORECAST_CACHE.value(result="miss") - misses),
+        "coalesced": int(FORECAST_CACHE.value(result="coalesced") - coalesced),
+        "errors": sum(r.status_code >= 400 for r in responses),
+        "distinct_bodies": max(len(b) for b in bodies.values()),
+        "wall_ms": round(wall, 1),
+    }
+
+
+async def run(n: int) -> dict:
+    transport = httpx.ASGITransport(app=api.app)
+    async with api.app.router.lifespan_context(api.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        await asyncio.to_thread(wait_ready, api.startup)
+        b = iter(api.data.boroughs)
+        results = {}
+
+        print("running prophet...", file=sys.stderr)
+        results["prophet"] = await burst(client, [f"/api/forecast?borough={next(b)}&years_ahead=5"] * n)
+
+        print("running joint...", file=sys.stderr)
+        results["joint"] = await burst(client, [f"/api/forecast?borough={next(b)}&years_ahead=5&engine=joint"] * n)
+
+        print("running mixed...", file=sys.stderr)
+        group = [next(b) for _ in range(4)]
+        results["mixed"] = await burst(client, [f"/api/forecast?borough={group[i % 4]}&years_ahead=5" for i in range(n)])
+
+        print("running uncoalesced...", file=sys.stderr)
+        coalescing = forecast_model._in_flight
+        forecast_model._in_flight = NoCoalescing()
+        try:
+            results["uncoalesced"] = await burst(client, [f"/api/forecast?borough={next(b)}&years_ahead=5"] * n)
+        finally:
+            forecast_model._in_flight = coalescing
+        return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16, help="Simultaneous requests per scenario")
+    parser.add_argument("--baseline", type=Path, help="Earlier coalescing result file to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.concurrency))
+    params = {"concurrency": args.concurrency, "shared_cache": bool(os.environ["SHARED_CACHE_DIR"])}
+    return report("coalescing", results, COLUMNS, params, args.baseline)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+# Shared helpers for the benchmark scripts: timing, result files and threshold checks
+
+BENCH_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+THRESHOLDS_FILE = BENCH_DIR / "thresholds.json"
+
+# The scripts import the back-end modules directly (app, forecast_model, ...)
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def wait_ready(startup, timeout: float = 600):
+    """Block until the app's startup stages (incl. the background forecast warm-up) have finished."""
+    deadline = time.monotonic() + timeout
+    while not startup.ready:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"app not ready after {timeout}s: {startup.report()}")
+        time.sleep(0.1)
+
+
+def summarize(samples_ms) -> dict:
+    """Latency summary in milliseconds."""
+    s = np.asarray(samples_ms, dtype=float)
+    return {
+        "n": int(s.size),
+        "min_ms": round(float(s.min()), 3),
+        "median_ms": round(float(np.median(s)), 3),
+        "mean_ms": round(float(s.mean()), 3),
+        "p50_ms": round(float(np.percentile(s, 50)), 3),
+        "p95_ms": round(float(np.percentile(s, 95)), 3),
+        "p99_ms": round(float(np.percentile(s, 99)), 3),
+        "max_ms": round(float(s.max()), 3),
+    }
+
+
+def bench(fn, repeat: int = 5, number: int = 10) -> dict:
+    """Time `fn()` as `repeat` rounds of `number` calls; each sample is the mean call time of one round."""
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+    return {**summarize(samples), "repeat": repeat, "number": number}
+
+
+def load_thresholds(kind: str) -> dict:
+    if not THRESHOLDS_FILE.exists():
+        return {}
+    return json.loads(THRESHOLDS_FILE.read_text()).get(kind, {})
+
+
+def check(results: dict, kind: str, baseline: Path = None) -> list:
+    """
+    Compare results with the absolute limits in thresholds.json and, when a baseline result
+    file is given, with `max_regression` (relative slow-down allowed per checked stat).
+    Returns a list of human-readable failures.
+    """
+    config = load_thresholds(kind)
+    limits = config.get("limits", {})
+    max_regression = config.get("max_regression")
+    base = json.loads(baseline.read_text())["results"] if baseline else {}
+
+    failures = []
+    for name, stats in results.items():
+        for stat, limit in limits.get(name, {}).items():
+            value = stats.get(stat)
+            if value is not None and value > limit:
+                failures.append(f"{name}: {stat} {value:.2f} > limit {limit}")
+            before = base.get(name, {}).get(stat)
+            if max_regression is not None and value is not None and before:
+                if value > before * (1 + max_regression):
+                    failures.append(f"{name}: {stat} {value:.2f} is {value / before - 1:+.0%} vs baseline {before:.2f}")
+    return failures
+
+
+def save(kind: str, results: dict, params: dict, failures: list) -> Path:
+    """Write results/<kind>-<commit>.json and results/<kind>-latest.json."""
+    commit = git_commit()
+    payload = {
+        "kind": kind,
+        "commit": commit,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "params": params,
+        "results": results,
+        "failures": failures,
+    }
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"{kind}-{commit}.json"
+    text = json.dumps(payload, indent=2)
+    path.write_text(text)
+    (RESULTS_DIR / f"{kind}-latest.json").write_text(text)
+    return path
+
+
+def report(kind: str, results: dict, columns: tuple, params: dict, baseline: Path = None) -> int:
+    """Print a table, save the JSON and return the exit code (1 when a threshold failed)."""
+    width = max(len(name) for name in results) + 2
+    cols = [max(12, len(c) + 2) for c in columns]
+    print(f"{'':{width}}" + "".join(f"{c:>{w}}" for c, w in zip(columns, cols)))
+    for name, stats in results.items():
+        print(f"{name:{width}}" + "".join(f"{stats.get(c, ''):>{w}}" for c, w in zip(columns, cols)))
+
+    failures = check(results, kind, baseline)
+    path = save(kind, results, params, failures)
+    print(f"\nSaved {path.relative_to(BACKEND_DIR)}")
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
@@ -0,0 +1,103 @@
+"""
+Forecast engine benchmark: one Prophet fit per borough series against the joint engine.
+
+Both engines forecast every borough of each metric from a cold start. Reports the wall time of
+each, and the accuracy of each on the last `--holdout` years when fitted on the years before.
+
+    python benchmarks/engines.py [--holdout 3] [--boroughs Camden,Hackney]
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from common import report
+
+os.environ.setdefault("SHARED_CACHE_DIR", "")
+
+from data_store import load_dataset, METRICS
+from forecast_model import prep_prophet_df, fit_forecast_prophet, INTERVAL_WIDTH
+from joint_model import forecast_joint
+
+COLUMNS = ("prophet_ms", "joint_ms", "speedup", "prophet_mape", "joint_mape")
+
+
+def prophet_loop(years, values, years_ahead):
+    """yhat (series, years + future) from one Prophet fit per column, NaN for series that can't be fitted."""
+    out = np.full((values.shape[1], len(years) + years_ahead), np.nan)
+    for j in range(values.shape[1]):
+        df_ts = prep_prophet_df(pd.DataFrame({"year": years, "value": values[:, j]}), "value")
+        if len(df_ts) < 8:
+            continue
+        fc = fit_forecast_prophet(df_ts, years_ahead)
+        idx = np.searchsorted(np.arange(years[0], years[-1] + years_ahead + 1), fc["ds"].dt.year.to_numpy())
+        out[j, idx] = fc["yhat"].to_numpy()
+    return out
+
+
+def joint(years, values, years_ahead):
+    return forecast_joint(years, values, years_ahead, interval=INTERVAL_WIDTH)["yhat"]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    res = fn(*args)
+    return res, (time.perf_counter() - start) * 1000
+
+
+def mape(pred, actual):
+    """Mean absolute % error over the cells with both a value and a prediction."""
+    ok = ~np.isnan(pred) & ~np.isnan(actual)
+    return float(np.mean(np.abs(pred[ok] / actual[ok] - 1)) * 100)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years-ahead", type=int, default=6)
+    parser.add_argument("--holdout", type=int, default=3, help="Years held out for the accuracy check")
+    parser.add_argument("--boroughs", help="Comma-separated boroughs (default all)")
+    parser.add_argument("--baseline", type=Path, help="Earlier engines result file to compare against")
+    args = parser.parse_args()
+
+    data = load_dataset()
+    names = [data.resolve(b) for b in args.boroughs.split(",")] if args.boroughs else data.boroughs
+    cols = [data.column(b) for b in names]
+    years = np.asarray(data.years)
+    train = len(years) - args.holdout
+
+    results = {}
+    totals = {"prophet_ms": 0.0, "joint_ms": 0.0}
+    for metric in METRICS:
+        values = np.asarray(data.matrices[metric], dtype=float)[:, cols]
+        _, prophet_ms = timed(prophet_loop, years, values, args.years_ahead)
+        _, joint_ms = timed(joint, years, values, args.years_ahead)
+
+        actual = values[train:].T
+        p_hold = prophet_loop(years[:train], values[:train], args.holdout)[:, train:]
+        j_hold = joint(years[:train], values[:train], args.holdout)[:, train:]
+
+        totals["prophet_ms"] += prophet_ms
+        totals["joint_ms"] += joint_ms
+        results[metric] = {
+            "series": len(names),
+            "prophet_ms": round(prophet_ms, 1),
+            "joint_ms": round(joint_ms, 1),
+            "speedup": round(prophet_ms / joint_ms, 1),
+            "prophet_mape": round(mape(p_hold, actual), 2),
+            "joint_mape": round(mape(j_hold, actual), 2),
+        }
+        print(f"{metric:14} prophet {prophet_ms:8.1f} ms  joint {joint_ms:6.1f} ms", file=sys.stderr)
+
+    results["all"] = {
+        "series": len(names) * len(METRICS),
+        **{k: round(v, 1) for k, v in totals.items()},
+        "speedup": round(totals["prophet_ms"] / totals["joint_ms"], 1),
+    }
+    params = {"years_ahead": args.years_ahead, "holdout": args.holdout, "boroughs": len(names)}
+    return report("engines", results, COLUMNS, params, args.baseline)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
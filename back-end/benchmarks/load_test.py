@@ -0,0 +1,138 @@
+"""
+In-process load test: drives every API route through the ASGI app (no network, no server)
+with the mock LLM backend, and reports per-route p50/p95/p99 latency and throughput.
+
+    python benchmarks/load_test.py [--concurrency 8] [--requests 100] [--routes /api/series,/api/forecast]
+
+The app's startup stages run first and the test waits for readiness (like an orchestrator would).
+The first request to each route is then timed separately as `cold_ms` (forecast fits, cache
+fills); the percentiles cover the steady state that follows.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from common import report, summarize, wait_ready
+
+os.environ.setdefault("LLM_BACKEND", "mock")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")  # one client hammering every route
+os.environ.setdefault("LLM_MOCK_LATENCY_MS", "50")
+
+import httpx
+import app as api
+
+CHAT_MESSAGES = (
+    "Is Camden affordable on a 50k salary?",
+    "Compare rents in Hackney and Islington",
+    "What is the London house price forecast?",
+    "Which borough is cheapest to buy in?",
+)
+
+# (name, method, path, body) - one entry per route
+ROUTES = (
+    ("/", "GET", "/", None),
+    ("/healthz", "GET", "/healthz", None),
+    ("/readyz", "GET", "/readyz", None),
+    ("/metrics", "GET", "/metrics", None),
+    ("/api/memory", "GET", "/api/memory", None),
+    ("/api/boroughs", "GET", "/api/boroughs", None),
+    ("/api/overview", "GET", "/api/overview", None),
+    ("/api/overview-forecast", "GET", "/api/overview-forecast?years_ahead=6", None),
+    ("/api/series", "GET", "/api/series?borough=Camden", None),
+    ("/api/forecast", "GET", "/api/forecast?borough=Camden&years_ahead=6", None),
+    ("/api/forecast/fits", "GET", "/api/forecast/fits", None),
+    ("/api/affordability", "GET", "/api/affordability", None),
+    ("/api/affordability?source=forecast", "GET", "/api/affordability?source=forecast&salaries=40000,60000", None),
+    ("/api/rankings", "GET", "/api/rankings", None),
+    ("/api/rankings/{year}", "GET", "/api/rankings/2020?n=5", None),
+    ("/api/scenarios", "GET", "/api/scenarios?boroughs=Camden,Hackney&paths=1000", None),
+    ("/api/rent", "GET", "/api/rent", None),
+    ("/api/rent/vs-buy", "GET", "/api/rent/vs-buy?salary=55000", None),
+    ("/api/compare", "GET", "/api/compare?boroughs=Camden,Hackney,Westminster", None),
+    ("/api/query", "GET", "/api/query?metric=ratio&agg=avg&group_by=area&from_year=2015&order=desc", None),
+    ("/api/query/change", "GET", "/api/query/change?from_year=2002&to_year=2022&min_change_pct=50", None),
+    ("/api/chat", "POST", "/api/chat", "chat"),
+    ("/api/chat/cache", "GET", "/api/chat/cache", None),
+    ("/api/chat/sessions", "GET", "/api/chat/sessions", None),
+    ("/api/chat/llm", "GET", "/api/chat/llm", None),
+)
+
+COLUMNS = ("cold_ms", "p50_ms", "p95_ms", "p99_ms", "rps", "errors")
+
+
+def uncovered_routes() -> list:
+    """App routes with no entry in ROUTES, so new endpoints are not silently left out."""
+    covered = {name.split("?")[0] for name, *_ in ROUTES}
+    paths = {getattr(r, "path", None) for r in api.app.routes if getattr(r, "methods", None)}
+    return sorted(p for p in paths if p and p not in covered and not p.startswith(("/docs", "/openapi", "/redoc", "/api/debug")))
+
+
+async def call(client: httpx.AsyncClient, method: str, path: str, body, i: int) -> tuple:
+    json_body = {"message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)]} if body == "chat" else body
+    start = time.perf_counter()
+    resp = await client.request(method, path, json=json_body)
+    return (time.perf_counter() - start) * 1000, resp.status_code
+
+
+async def drive(client, method: str, path: str, body, requests: int, concurrency: int) -> dict:
+    cold_ms, status = await call(client, method, path, body, 0)
+    latencies, errors = [], int(status >= 400)
+    counter = iter(range(1, requests + 1))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            ms, code = await call(client, method, path, body, i)
+            latencies.append(ms)
+            errors += code >= 400
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return {**summarize(latencies), "cold_ms": round(cold_ms, 1), "rps": round(requests / wall, 1),
+            "errors": errors, "status": status}
+
+
+async def run(routes, requests: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=api.app)
+    async with api.app.router.lifespan_context(api.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        await asyncio.to_thread(wait_ready, api.startup)
+        results = {}
+        for name, method, path, body in routes:
+            print(f"running {name}...", file=sys.stderr)
+            results[name] = await drive(client, method, path, body, requests, concurrency)
+        return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per route after the cold one")
+    parser.add_argument("--routes", help="Comma-separated route names to run (default all)")
+    parser.add_argument("--baseline", type=Path, help="Earlier load result file to compare against")
+    args = parser.parse_args()
+
+    routes = ROUTES
+    if args.routes:
+        wanted = set(args.routes.split(","))
+        routes = [r for r in ROUTES if r[0] in wanted]
+    for path in uncovered_routes():
+        print(f"WARNING: route {path} is not covered by the load test", file=sys.stderr)
+
+    start = time.perf_counter()
+    results = asyncio.run(run(routes, args.requests, args.concurrency))
+    wall = time.perf_counter() - start
+    total = sum(r["n"] + 1 for r in results.values())
+
+    params = {"concurrency": args.concurrency, "requests": args.requests,
+              "llm_backend": os.environ["LLM_BACKEND"], "llm_mock_latency_ms": os.environ.get("LLM_MOCK_LATENCY_MS"),
+              "total_requests": total, "wall_s": round(wall, 2), "overall_rps": round(total / wall, 1)}
+    print(f"{total} requests in {wall:.1f}s ({total / wall:.1f} req/s) at concurrency {args.concurrency}\n")
+    return report("load", results, COLUMNS, params, args.baseline)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+Micro-benchmarks for the hot helpers behind the API.
+
+    python benchmarks/micro.py [--repeat 5] [--baseline benchmarks/results/micro-<commit>.json]
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+from common import bench, report, wait_ready
+
+os.environ.setdefault("LLM_BACKEND", "mock")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+import app as api
+from forecast_model import prep_prophet_df, fit_forecast_prophet
+
+COLUMNS = ("median_ms", "min_ms", "p95_ms", "number")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--borough", default="Camden")
+    parser.add_argument("--baseline", type=Path, help="Earlier micro result file to compare against")
+    args = parser.parse_args()
+
+    with TestClient(api.app):  # runs the lifespan startup stages
+        wait_ready(api.startup)
+        return run(args)
+
+
+def run(args) -> int:
+    data = api.data
+    borough = data.resolve(args.borough)
+    d = data.rows(borough)
+    prepared = prep_prophet_df(d, "house_price")
+    queries = [b.lower() for b in data.boroughs] + [b[:5].upper() for b in data.boroughs]
+
+    def render(payload):
+        return JSONResponse(content=jsonable_encoder(payload)).body
+
+    cases = {
+        "prep_prophet_df": (lambda: prep_prophet_df(d, "house_price"), 50),
+        "fit_forecast_prophet": (lambda: fit_forecast_prophet(prepared, years_ahead=6), 1),
+        "resolve_borough": (lambda: [data.resolve(q) for q in queries], 50),
+        "resolve_many": (lambda: data.resolve_many(queries), 50),
+        "series_payload": (lambda: render(api.series(borough)), 50),
+        "overview_payload": (lambda: render(api.overview()), 20),
+    }
+
+    results = {}
+    for name, (fn, number) in cases.items():
+        print(f"running {name}...", file=sys.stderr)
+        results[name] = bench(fn, repeat=args.repeat, number=number)
+
+    params = {"repeat": args.repeat, "borough": borough, "resolve_queries": len(queries)}
+    return report("micro", results, COLUMNS, params, args.baseline)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Query store benchmark: the SQLite query layer (query_store.py) against the same query in pandas
+over the in-memory dataset.
+
+    python benchmarks/query.py [--repeat 5] [--number 50]
+
+Queries:
+  series     one borough's rows                       (/api/series)
+  overview   mean price and income per year           (/api/overview stays on the dense matrices)
+  year       every borough's ratio in one year, sorted (/api/query?from_year=Y&to_year=Y)
+  filter     rows of 3 boroughs since 2015 with ratio >= 10
+  group      mean ratio per borough since 2015        (/api/query?agg=avg&group_by=area)
+  change     ratio change per borough, 2002 -> 2022   (/api/query/change)
+
+Each row reports the median call time of both, and whether they returned the same values.
+Limits in thresholds.json ("query") apply to the SQL side.
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+import numpy as np
+from common import bench, report
+
+os.environ.setdefault("SHARED_CACHE_DIR", "")
+
+from data_store import load_dataset
+from query_store import load_query_store
+from reconcile import london_mean
+
+COLUMNS = ("pandas_ms", "sql_ms", "speedup", "same")
+# Not in QueryStore: /api/overview stays on the matrices, this only shows how SQL compares
+OVERVIEW_SQL = "SELECT year, AVG(house_price), AVG(annual_income) FROM observations GROUP BY year ORDER BY year"
+BOROUGHS = ["Camden", "Hackney", "Westminster"]
+
+
+def frame(data):
+    """The long table with the ratio column the SQL copy stores."""
+    df = data.df.copy()
+    df["ratio"] = df["house_price"].astype(float) / df["annual_income"].astype(float)
+    return df
+
+
+def pandas_queries(data, df) -> dict:
+    def series():
+        d = data.rows("Camden")
+        return d["year"].tolist(), d["house_price"].to_numpy(dtype=float)
+
+    def overview():
+        m = london_mean(data)
+        return m["year"].tolist(), m["house_price"].to_numpy(dtype=float)
+
+    def year():
+        d = df[df["year"] == 2020].dropna(subset=["ratio"]).sort_values(["ratio", "Area"])
+        return d["Area"].astype(str).tolist(), d["ratio"].to_numpy()
+
+    def filter_():
+        d = df[df["Area"].isin(BOROUGHS) & (df["year"] >= 2015) & (df["ratio"] >= 10)]
+        d = d.sort_values(["ratio", "Area", "year"])
+        return d["Area"].astype(str).tolist(), d["ratio"].to_numpy()
+
+    def group():
+        d = df[df["year"] >= 2015].dropna(subset=["ratio"]).groupby("Area", observed=True)["ratio"].mean()
+        d = d.sort_values(ascending=False)
+        return d.index.astype(str).tolist(), d.to_numpy()
+
+    def change():
+        wide = df.pivot(index="Area", columns="year", values="ratio")[[2002, 2022]].dropna()
+        pct = (wide[2022] / wide[2002] - 1) * 100
+        pct = pct.sort_values(ascending=False)
+        return pct.index.astype(str).tolist(), pct.to_numpy()
+
+    return {"series": series, "overview": overview, "year": year, "filter": filter_, "group": group, "change": change}
+
+
+def sql_queries(query) -> dict:
+    def rows(columns_rows_sql, value_col):
+        _, rows, _ = columns_rows_sql
+        return [r[0] for r in rows], np.array([r[value_col] for r in rows], dtype=float)
+
+    def series():
+        d = query.series("Camden")
+        return d["years"], d["house_price"]
+
+    def overview():
+        years, price, _ = zip(*query.execute(OVERVIEW_SQL))
+        return list(years), np.array(price, dtype=float)
+
+    return {
+        "series": series,
+        "overview": overview,
+        "year": lambda: rows(query.filter("ratio", from_year=2020, to_year=2020), 2),
+        "filter": lambda: rows(query.filter("ratio", areas=BOROUGHS, from_year=2015, min_value=10), 2),
+        "group": lambda: rows(query.filter("ratio", agg="avg", group_by="area", from_year=2015, order="desc"), 1),
+        "change": lambda: rows(query.change("ratio", 2002, 2022), 4),
+    }
+
+
+def same(a, b) -> bool:
+    return list(a[0]) == list(b[0]) and np.allclose(a[1], b[1], rtol=1e-6)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=50)
+    parser.add_argument("--baseline", type=Path, help="Earlier query result file to compare against")
+    args = parser.parse_args()
+
+    data = load_dataset()
+    query = load_query_store(data)
+    pandas_fns, sql_fns = pandas_queries(data, frame(data)), sql_queries(query)
+
+    results = {}
+    for name, pandas_fn in pandas_fns.items():
+        sql_fn = sql_fns[name]
+        p = bench(pandas_fn, args.repeat, args.number)["median_ms"]
+        s = bench(sql_fn, args.repeat, args.number)["median_ms"]
+        results[name] = {
+            "pandas_ms": p,
+            "sql_ms": s,
+            "speedup": round(p / s, 1) if s else None,
+            "same": same(pandas_fn(), sql_fn()),
+        }
+    params = {"repeat": args.repeat, "number": args.number, "shared_cache": bool(os.environ["SHARED_CACHE_DIR"])}
+    code = report("query", results, COLUMNS, params, args.baseline)
+    if not all(r["same"] for r in results.values()):
+        print("MISMATCH " + ", ".join(n for n, r in results.items() if not r["same"]))
+        code = 1
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
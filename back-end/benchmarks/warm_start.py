@@ -0,0 +1,77 @@
+"""
+Warm-start refit benchmark: simulates the annual refresh for every borough and metric.
+
+For each series it fits the history without its last `--drop` years (the previous release),
+then fits the full history twice: from a cold start and warm-started from the previous fit.
+Reports fit times, the savings, and how far the warm forecast is from the cold one.
+
+    python benchmarks/warm_start.py [--drop 1] [--boroughs Camden,Hackney]
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+import numpy as np
+from common import report
+
+os.environ.setdefault("SHARED_CACHE_DIR", "")
+
+from data_store import load_dataset, METRICS
+from forecast_model import prep_prophet_df, fit_prophet_model, predict_prophet, model_params, warm_start_init
+
+COLUMNS = ("cold_ms", "warm_ms", "saved_pct", "max_diff_pct")
+
+
+def timed_fit(df_ts, init=None):
+    start = time.perf_counter()
+    m = fit_prophet_model(df_ts, init)
+    return m, (time.perf_counter() - start) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drop", type=int, default=1, help="Years missing from the previous release")
+    parser.add_argument("--years-ahead", type=int, default=6)
+    parser.add_argument("--boroughs", help="Comma-separated boroughs (default all)")
+    parser.add_argument("--baseline", type=Path, help="Earlier warm_start result file to compare against")
+    args = parser.parse_args()
+
+    data = load_dataset()
+    names = [data.resolve(b) for b in args.boroughs.split(",")] if args.boroughs else data.boroughs
+
+    rows = []
+    for b in names:
+        d = data.rows(b)
+        for metric in METRICS:
+            df_ts = prep_prophet_df(d, metric)
+            previous, _ = timed_fit(df_ts.iloc[: -args.drop])
+
+            cold, cold_ms = timed_fit(df_ts)
+            warm, warm_ms = timed_fit(df_ts, warm_start_init(model_params(previous), len(df_ts)))
+
+            cold_fc = predict_prophet(cold, args.years_ahead)["yhat"].to_numpy()
+            warm_fc = predict_prophet(warm, args.years_ahead)["yhat"].to_numpy()
+            diff = np.max(np.abs(warm_fc / cold_fc - 1)) * 100
+            rows.append((b, metric, cold_ms, warm_ms, diff))
+            print(f"{b:24} {metric:14} cold {cold_ms:7.1f} ms  warm {warm_ms:7.1f} ms  diff {diff:.3f}%", file=sys.stderr)
+
+    results = {}
+    for metric in METRICS + ("all",):
+        sel = [r for r in rows if metric in ("all", r[1])]
+        cold = sum(r[2] for r in sel)
+        warm = sum(r[3] for r in sel)
+        results[metric] = {
+            "series": len(sel),
+            "cold_ms": round(cold, 1),
+            "warm_ms": round(warm, 1),
+            "saved_ms": round(cold - warm, 1),
+            "saved_pct": round((1 - warm / cold) * 100, 1),
+            "max_diff_pct": round(max(r[4] for r in sel), 3),
+        }
+    params = {"drop": args.drop, "years_ahead": args.years_ahead, "boroughs": len(names)}
+    return report("warm_start", results, COLUMNS, params, args.baseline)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
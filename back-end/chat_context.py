@@ -0,0 +1,193 @@
+import hashlib
+import re
+import pandas as pd
+from data_store import normalize_area
+
+# Retrieval for the chatbot prompt: only the rows a question needs
+
+YEAR_RE = re.compile(r"\b(19[89]\d|20\d\d)\b")
+
+METRIC_KEYWORDS = {
+    "house_price": ("price", "prices", "house", "houses", "home", "homes", "property", "flat", "buy", "buying", "mortgage", "cost"),
+    "annual_income": ("income", "incomes", "salary", "salaries", "earn", "earning", "earnings", "wage", "wages", "pay"),
+    "ratio": ("ratio", "afford", "affordable", "affordability", "multiple"),
+    "rent": ("rent", "rents", "rental", "renting", "tenant", "tenants", "letting", "lettings", "bed", "bedroom", "bedrooms"),
+}
+
+AREA_STOPWORDS = {"and", "upon", "the", "of"}
+
+MAX_FULL_HISTORY_BOROUGHS = 3  # above this, only recent years per borough
+RECENT_YEARS = 5
+CHEAPEST_RENTS = 5
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+class AreaIndex:
+    """Finds borough mentions in free text using full names and unambiguous name tokens."""
+
+    def __init__(self, areas):
+        self.areas = sorted(set(areas))
+        self._by_phrase = {normalize_area(a): a for a in self.areas}
+
+        token_areas = {}
+        for area in self.areas:
+            for tok in normalize_area(area).split():
+                if tok in AREA_STOPWORDS or len(tok) < 4:
+                    continue
+                token_areas.setdefault(tok, set()).add(area)
+        # Only keep tokens that point at a single borough ("kensington" yes, "thames" no)
+        self._by_token = {t: next(iter(a)) for t, a in token_areas.items() if len(a) == 1}
+
+        phrases = sorted(self._by_phrase, key=len, reverse=True)
+        self._phrase_re = re.compile(r"\b(" + "|".join(re.escape(p) for p in phrases) + r")\b") if phrases else None
+
+    def find(self, text: str) -> list:
+        """Return boroughs mentioned in `text`, in order of first appearance."""
+        norm = normalize_area(text)
+        found = {}
+        if self._phrase_re is not None:
+            for m in self._phrase_re.finditer(norm):
+                found.setdefault(self._by_phrase[m.group(1)], m.start())
+        pos = 0
+        for tok in norm.split():
+            area = self._by_token.get(tok)
+            if area is not None:
+                found.setdefault(area, norm.find(tok, pos))
+            pos += len(tok) + 1
+        return sorted(found, key=found.get)
+
+    def resolve(self, name: str):
+        """Exact (normalized) lookup of a single borough name, or None."""
+        return self._by_phrase.get(normalize_area(name))
+
+
+class ChatContextIndex:
+    """
+    Pre-renders the data context once and assembles a per-question slice of it:
+    rows for the boroughs/years mentioned, a compact London summary and matching rents.
+    """
+
+    def __init__(self, df: pd.DataFrame, rent_entries: dict = None, forecast_text: str = ""):
+        d = df.sort_values(["Area", "year"])
+        self.index = AreaIndex(d["Area"].unique().tolist())
+        self.years = sorted(d["year"].unique().tolist())
+        self.latest_year = self.years[-1] if self.years else None
+        self.forecast_text = forecast_text.strip()
+
+        ratio = d["house_price"] / d["annual_income"]
+        self._rows = {}
+        for area, year, price, income, r in zip(d["Area"], d["year"], d["house_price"], d["annual_income"], ratio):
+            self._rows.setdefault(area, {})[int(year)] = f"{int(year)} | {area} | £{price:,.0f} | £{income:,.0f} | {r:.1f}x"
+
+        yearly = d.groupby("year").agg(house_price=("house_price", "mean"), annual_income=("annual_income", "mean"))
+        self._london = {
+            int(y): f"{int(y)}: mean price £{p:,.0f}, mean income £{i:,.0f} ({p / i:.1f}x)"
+            for y, p, i in zip(yearly.index, yearly["house_price"], yearly["annual_income"])
+        }
+
+        # Rental entries keyed by dataset borough name ("Barking and Dagenham" -> "Barking & Dagenham")
+        self._rents = {}
+        self._rent_avg = {}
+        for name, (text, avg) in (rent_entries or {}).items():
+            area = self.index.resolve(name) or name
+            self._rents[area] = text
+            if avg is not None:
+                self._rent_avg[area] = avg
+
+        self.version = self._version()
+
+    def _version(self) -> str:
+        # Changes whenever any of the rendered context changes (used to key cached replies)
+        digest = hashlib.sha1()
+        for area in sorted(self._rows):
+            digest.update("\n".join(self._rows[area].values()).encode())
+        for text in (*self._london.values(), *sorted(self._rents.values()), self.forecast_text):
+            digest.update(text.encode())
+        return digest.hexdigest()[:12]
+
+    def set_forecast(self, forecast_text: str):
+        """Add the London forecast once it is available (it needs Prophet fits, so it comes after the index)."""
+        self.forecast_text = forecast_text.strip()
+        self.version = self._version()
+
+    def context_chars(self) -> int:
+        """Characters of pre-rendered context held by the index."""
+        texts = (*(t for rows in self._rows.values() for t in rows.values()), *self._london.values(), *self._rents.values())
+        return sum(len(t) for t in texts) + len(self.forecast_text)
+
+    def detect(self, message: str) -> dict:
+        """Boroughs, years and metrics a message refers to."""
+        words = set(re.findall(r"[a-z]+", message.lower()))
+        metrics = [m for m, kws in METRIC_KEYWORDS.items() if words.intersection(kws)]
+        years = sorted({int(y) for y in YEAR_RE.findall(message)})
+        return {"boroughs": self.index.find(message), "years": years, "metrics": metrics}
+
+    def build(self, message: str, extra_boroughs=()) -> tuple:
+        """Return (context text, detection info) for a single question."""
+        info = self.detect(message)
+        boroughs = list(info["boroughs"])
+        for b in extra_boroughs:
+            if b not in boroughs:
+                boroughs.append(b)
+        info["boroughs"] = boroughs
+        years = info["years"]
+
+        parts = [self._london_block(years)]
+        if self.forecast_text:
+            parts.append("FORECAST (London mean house price, Prophet):\n" + self.forecast_text)
+        if boroughs:
+            parts.append(self._borough_block(boroughs, years))
+        else:
+            parts.append(self._snapshot_block())
+
+        if boroughs or "rent" in info["metrics"]:
+            rent_block = self._rent_block(boroughs)
+            if rent_block:
+                parts.append(rent_block)
+
+        return "\n\n".join(parts), info
+
+    def _london_block(self, years) -> str:
+        wanted = {self.years[0], self.latest_year} | {y for y in years if y in self._london}
+        lines = [self._london[y] for y in sorted(wanted)]
+        return "LONDON SUMMARY (mean across boroughs):\n" + "\n".join(lines)
+
+    def _borough_block(self, boroughs, years) -> str:
+        lines = ["BOROUGH DATA (year | area | house price | annual income | price-to-income):"]
+        for b in boroughs:
+            rows = self._rows.get(b, {})
+            if years:
+                wanted = [y for y in years if y in rows]
+                if self.latest_year in rows and self.latest_year not in wanted:
+                    wanted.append(self.latest_year)
+            elif len(boroughs) <= MAX_FULL_HISTORY_BOROUGHS:
+                wanted = list(rows)
+            else:
+                wanted = list(rows)[-RECENT_YEARS:]
+            lines.extend(rows[y] for y in sorted(wanted))
+        return "\n".join(lines)
+
+    def _snapshot_block(self) -> str:
+        lines = [f"ALL BOROUGHS IN {self.latest_year} (area | house price | annual income | price-to-income):"]
+        for area in self.index.areas:
+            row = self._rows[area].get(self.latest_year)
+            if row:
+                lines.append(row.split(" | ", 1)[1])
+        return "\n".join(lines)
+
+    def _rent_block(self, boroughs) -> str:
+        if boroughs:
+            entries = [self._rents[b] for b in boroughs if b in self._rents]
+        else:
+            cheapest = sorted(self._rent_avg, key=self._rent_avg.get)[:CHEAPEST_RENTS]
+            entries = [self._rents[b] for b in cheapest]
+            if self._rent_avg:
+                london_avg = sum(self._rent_avg.values()) / len(self._rent_avg)
+                entries.append(f"London average rent across boroughs: £{london_avg:,.0f}")
+        if not entries:
+            return ""
+        return "RENTAL PRICES BY BOROUGH (monthly, £):\n" + "\n".join(entries)
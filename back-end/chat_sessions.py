@@ -0,0 +1,336 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from pathlib import Path
+from shared_store import file_lock
+
+# Server-side chat sessions: a structured summary of what the user told us + the last few turns
+
+MAX_TURNS = 4
+MAX_TURN_CHARS = 400
+MAX_BOROUGHS = 5
+SESSION_OVERHEAD_BYTES = 512  # rough per-session cost of the objects themselves
+SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")  # the uuid4().hex IDs we hand out
+
+AMOUNT = r"£?\s*(\d+(?:[.,]\d+)*)\s*(k|m|thousand|million)?\b"
+SALARY_RE = re.compile(r"\b(?:salary|income|earn(?:s|ing)?|make|paid|household income|wage)\b[^\d£]{0,25}" + AMOUNT)
+SALARY_ON_RE = re.compile(r"\bon (?:a |about |around )?" + AMOUNT + r"(?!\s*(?:bed|year|month))")
+BUDGET_RE = re.compile(r"\b(?:budget|max(?:imum)?(?: price)?|up to|spend|afford up to|price of|deposit of)\b[^\d£]{0,25}" + AMOUNT)
+BEDROOMS_RE = re.compile(r"\b(\d|one|two|three|four|five)[\s-]*(?:bed|beds|bedroom|bedrooms|br)\b")
+WORD_NUMBERS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5}
+
+
+def parse_amount(number: str, suffix: str = None) -> float:
+    """'50,000' -> 50000, ('50', 'k') -> 50000, ('1.2', 'm') -> 1200000."""
+    value = float(number.replace(",", ""))
+    if suffix in ("k", "thousand"):
+        value *= 1_000
+    elif suffix in ("m", "million"):
+        value *= 1_000_000
+    return value
+
+
+def extract_facts(message: str) -> dict:
+    """Salary, budget and bedrooms stated in a single message (only the keys found)."""
+    text = message.lower()
+    facts = {}
+
+    m = SALARY_RE.search(text) or SALARY_ON_RE.search(text)
+    if m:
+        salary = parse_amount(m.group(1), m.group(2))
+        if 1_000 <= salary <= 10_000_000:
+            facts["salary"] = salary
+
+    m = BUDGET_RE.search(text)
+    if m:
+        budget = parse_amount(m.group(1), m.group(2))
+        if budget >= 10_000:
+            facts["budget"] = budget
+
+    m = BEDROOMS_RE.search(text)
+    if m:
+        facts["bedrooms"] = WORD_NUMBERS.get(m.group(1)) or int(m.group(1))
+    elif "studio" in text:
+        facts["bedrooms"] = 0
+
+    return facts
+
+
+def valid_session_id(session_id: str):
+    """`session_id` if it has the form of an ID we issue, else None (a new session is started)."""
+    return session_id if session_id and SESSION_ID_RE.match(session_id) else None
+
+
+class ChatSession:
+    def __init__(self, session_id: str, now: float):
+        self.session_id = session_id
+        self.created = now
+        self.last_seen = now
+        self.salary = None
+        self.budget = None
+        self.bedrooms = None
+        self.boroughs = []
+        self.turns = deque(maxlen=MAX_TURNS)
+
+    def remember(self, message: str, boroughs=()):
+        """Fold the facts in a new user message into the summary."""
+        facts = extract_facts(message)
+        self.salary = facts.get("salary", self.salary)
+        self.budget = facts.get("budget", self.budget)
+        self.bedrooms = facts.get("bedrooms", self.bedrooms)
+        for b in boroughs:
+            if b in self.boroughs:
+                self.boroughs.remove(b)
+            self.boroughs.append(b)
+        del self.boroughs[:-MAX_BOROUGHS]
+
+    def add_turn(self, user: str, assistant: str):
+        self.turns.append((user[:MAX_TURN_CHARS], assistant[:MAX_TURN_CHARS]))
+
+    def facts(self) -> tuple:
+        """Hashable view of the summary (part of the reply cache key)."""
+        return (self.salary, self.budget, self.bedrooms, tuple(self.boroughs))
+
+    def render(self) -> str:
+        """Summary + recent turns as prompt text ("" for a fresh session)."""
+        known = []
+        if self.salary is not None:
+            known.append(f"- Salary: £{self.salary:,.0f} per year")
+        if self.budget is not None:
+            known.append(f"- Max property price / budget: £{self.budget:,.0f}")
+        if self.bedrooms is not None:
+            known.append(f"- Bedrooms needed: {self.bedrooms if self.bedrooms else 'studio'}")
+        if self.boroughs:
+            known.append(f"- Boroughs of interest: {', '.join(self.boroughs)}")
+
+        parts = []
+        if known:
+            parts.append("KNOWN FACTS ABOUT THE USER (treat as fact, do not ask again):\n" + "\n".join(known))
+        if self.turns:
+            lines = []
+            for user, assistant in self.turns:
+                lines.append(f"User: {user}")
+                lines.append(f"Assistant: {assistant}")
+            parts.append("RECENT CONVERSATION:\n" + "\n".join(lines))
+        return "\n\n".join(parts)
+
+    def size_bytes(self) -> int:
+        return (SESSION_OVERHEAD_BYTES + len(self.session_id) + sum(len(u) + len(a) for u, a in self.turns)
+                + sum(len(b) for b in self.boroughs))
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "created": self.created,
+            "last_seen": self.last_seen,
+            "salary": self.salary,
+            "budget": self.budget,
+            "bedrooms": self.bedrooms,
+            "boroughs": self.boroughs,
+            "turns": [list(t) for t in self.turns],
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "ChatSession":
+        session = cls(d["session_id"], d["created"])
+        session.last_seen = d["last_seen"]
+        session.salary = d["salary"]
+        session.budget = d["budget"]
+        session.bedrooms = d["bedrooms"]
+        session.boroughs = list(d["boroughs"])
+        session.turns.extend(tuple(t) for t in d["turns"])
+        return session
+
+
+class SessionStore:
+    """LRU + TTL store of chat sessions, capped by count and by approximate memory."""
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 1800.0, max_bytes: int = 5_000_000, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._sessions = OrderedDict()
+        self._bytes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def get(self, session_id: str = None) -> ChatSession:
+        """Return the live session for `session_id`, or a new one if unknown/expired/malformed."""
+        session_id = valid_session_id(session_id)
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = ChatSession(session_id or uuid.uuid4().hex, now)
+                self._sessions[session.session_id] = session
+                self._account(session)
+                self.created += 1
+            session.last_seen = now
+            self._sessions.move_to_end(session.session_id)
+            self._enforce_caps(keep=session.session_id)
+            return session
+
+    def save(self, session: ChatSession):
+        """Re-account a session's memory after it changed."""
+        with self._lock:
+            if session.session_id in self._sessions:
+                self._account(session)
+                self._enforce_caps(keep=session.session_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._total_bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+    def _account(self, session: ChatSession):
+        size = session.size_bytes()
+        self._total_bytes += size - self._bytes.get(session.session_id, 0)
+        self._bytes[session.session_id] = size
+
+    def _remove(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._total_bytes -= self._bytes.pop(session_id, 0)
+
+    def _expire(self, now: float):
+        # Sessions are in last-seen order, so expired ones are at the front
+        while self._sessions:
+            sid, session = next(iter(self._sessions.items()))
+            if now - session.last_seen < self.ttl:
+                break
+            self._remove(sid)
+            self.expired += 1
+
+    def _enforce_caps(self, keep: str):
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._total_bytes > self.max_bytes):
+            sid = next(iter(self._sessions))
+            if sid == keep:
+                break
+            self._remove(sid)
+            self.evicted += 1
+
+
+class SharedSessionStore:
+    """
+    Chat sessions in SQLite in the shared cache (sessions.sqlite, next to forecasts.sqlite), so a
+    follow-up message finds its session whichever worker it lands on. Same interface and caps as
+    SessionStore; last_seen is wall-clock time, since workers don't share a monotonic clock.
+    The created/expired/evicted counters are this worker's.
+    """
+
+    def __init__(self, folder: Path, max_sessions: int = 1000, ttl: float = 1800.0, max_bytes: int = 5_000_000,
+                 clock=time.time):
+        self.path = folder / "sessions.sqlite"
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._local = threading.local()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        folder.mkdir(parents=True, exist_ok=True)
+        with file_lock(folder / "sessions.lock"):
+            conn = self._conn()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, payload TEXT NOT NULL, bytes INTEGER NOT NULL, last_seen REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit; read-modify-write sequences take the write lock with BEGIN IMMEDIATE
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return conn
+
+    def get(self, session_id: str = None) -> ChatSession:
+        """Return the live session for `session_id`, or a new one if unknown/expired/malformed."""
+        session_id = valid_session_id(session_id)
+        now = self._clock()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.expired += conn.execute("DELETE FROM sessions WHERE last_seen < ?", (now - self.ttl,)).rowcount
+            row = conn.execute("SELECT payload FROM sessions WHERE session_id = ?", (session_id,)).fetchone() if session_id else None
+            if row is not None:
+                session = ChatSession.from_dict(json.loads(row[0]))
+            else:
+                session = ChatSession(session_id or uuid.uuid4().hex, now)
+                self.created += 1
+            session.last_seen = now
+            self._put(conn, session)
+            self._enforce_caps(conn, keep=session.session_id)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return session
+
+    def save(self, session: ChatSession):
+        """Write a session back after it changed (unless it was dropped in the meantime)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session.session_id,)).fetchone():
+                self._put(conn, session)
+                self._enforce_caps(conn, keep=session.session_id)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> dict:
+        count, total = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions").fetchone()
+        return {
+            "sessions": count,
+            "bytes": total,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "shared": True,
+        }
+
+    @staticmethod
+    def _put(conn: sqlite3.Connection, session: ChatSession):
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, payload, bytes, last_seen) VALUES (?, ?, ?, ?)",
+            (session.session_id, json.dumps(session.to_dict()), session.size_bytes(), session.last_seen),
+        )
+
+    def _enforce_caps(self, conn: sqlite3.Connection, keep: str):
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions").fetchone()
+        if count <= self.max_sessions and total <= self.max_bytes:
+            return
+        drop = []
+        for sid, size in conn.execute("SELECT session_id, bytes FROM sessions ORDER BY last_seen"):
+            if count <= 1 or (count <= self.max_sessions and total <= self.max_bytes):
+                break
+            if sid == keep:
+                continue
+            drop.append(sid)
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM sessions WHERE session_id = ?", [(sid,) for sid in drop])
+        self.evicted += len(drop)
@@ -1,218 +1,23 @@
-import google.generativeai as genai
-import pandas as pd
-import numpy as np
 import os
-from pathlib import Path
+import threading
+import time
 from dotenv import load_dotenv
-from forecast_model import prep_prophet_df, fit_forecast_prophet
+from reconcile import london_forecast
+from chat_context import ChatContextIndex, estimate_tokens
+from response_cache import ResponseCache
+from chat_sessions import SessionStore, SharedSessionStore
+from shared_store import shared_dir
+from llm_client import LLMError, client_from_env
+from data_store import load_dataset
+from rental_data import load_rents
+from metrics import CHAT_CACHE, DATA_LOAD
+from rate_limit import note_expensive
+from tracing import traced
 
 # Load environment variables
 load_dotenv()
 
-class ChatbotService:
-    def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
-            print("WARNING: GEMINI_API_KEY not found in environment variables.")
-        else:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-
-        self.context = ""
-        self._load_data()
-
-    def _load_data(self):
-        """Loads and prepares the data context for the chatbot, including forecasts + rental dataset."""
-        try:
-            base_dir = Path(__file__).resolve().parent
-
-            # ---- MAIN MERGED DATA ----
-            data_path = base_dir / "data" / "merged_final.xlsx"
-            df = pd.read_excel(data_path, sheet_name="merged_annual_long")
-
-            # Historical clean
-            df["year"] = pd.to_numeric(df["year"], errors="coerce")
-            df["house_price"] = pd.to_numeric(df["house_price"], errors="coerce")
-            df["annual_income"] = pd.to_numeric(df["annual_income"], errors="coerce")
-            df = df.dropna(subset=["year", "house_price", "annual_income"]).copy()
-            df["year"] = df["year"].astype(int)
-
-            df_sorted = df.sort_values(["Area", "year"])
-            min_year = df["year"].min()
-            max_year = df["year"].max()
-
-            self.context = f"HISTORICAL DATA ({min_year}-{max_year}):\n"
-            self.context += df_sorted[["year", "Area", "house_price", "annual_income"]].to_string(index=False)
-
-            # Forecast
-            self.context += "\n\nFORECAST DATA (London Average for next 4 years based on Prophet):\n"
-            self.context += self._generate_london_forecast(df)
-
-            # ---- RENTAL DATA ----
-            rental_text = self._load_rental_context(base_dir)
-            self.context += "\n\n" + rental_text
-
-            print(f"Loaded data from {data_path}, generated forecasts, and loaded rental context.")
-
-        except Exception as e:
-            print(f"Error loading chatbot data: {e}")
-            import traceback
-            traceback.print_exc()
-            self.context = "Data not available at the moment."
-
-    def _load_rental_context(self, base_dir: Path) -> str:
-        """
-        Loads borough rental prices and returns a compact text block for model context.
-        NOW CORRECTLY HANDLES THE EXACT EXCEL STRUCTURE FROM THE IMAGE.
-        """
-        # La ruta correcta ahora que lo moviste a la carpeta data/
-        rental_path = base_dir / "data" / "rental_price_per_borough.xlsx"
-        
-        if not rental_path.exists():
-            error_msg = f"RENTAL PRICES BY BOROUGH: File not found at {rental_path}"
-            print(error_msg)
-            # Intentar buscar en otras ubicaciones
-            alt_paths = [
-                base_dir / "rental_price_per_borough.xlsx",
-                base_dir.parent / "rental_price_per_borough.xlsx",
-            ]
-            for alt in alt_paths:
-                if alt.exists():
-                    rental_path = alt
-                    print(f"✓ Found at alternative location: {rental_path}")
-                    break
-            else:
-                return error_msg
-
-        try:
-            # Leer el archivo Excel
-            print(f"📂 Attempting to read: {rental_path}")
-            rent_df = pd.read_excel(rental_path, header=0)  # header=0 para asegurar que la primera fila es el header
-            
-            print(f"✓ Loaded rental data: {rent_df.shape[0]} rows, {rent_df.shape[1]} columns")
-            print(f"📋 Raw columns found: {list(rent_df.columns)}")
-
-            # Limpiar nombres de columnas (quitar espacios extra, etc.)
-            rent_df.columns = rent_df.columns.str.strip()
-            
-            print(f"📋 Cleaned columns: {list(rent_df.columns)}")
-
-            # Verificar si las columnas esperadas existen (basado en tu imagen)
-            expected_cols = {
-                'Area code': 'area_code',
-                'Area name': 'borough',
-                'Rental price one bed': 'rent_1bed',
-                'Rental price two bed': 'rent_2bed',
-                'Rental price three bed': 'rent_3bed',
-                'Rental price four or more bed': 'rent_4plus_bed',
-                'Rental price': 'rent_avg'
-            }
-            
-            # Identificar qué columnas realmente existen
-            cols_found = {}
-            cols_missing = []
-            
-            for expected_col, new_name in expected_cols.items():
-                if expected_col in rent_df.columns:
-                    cols_found[expected_col] = new_name
-                    print(f"  ✓ Found: {expected_col}")
-                else:
-                    cols_missing.append(expected_col)
-                    print(f"  ✗ Missing: {expected_col}")
-            
-            if 'Area name' not in cols_found:
-                return f"ERROR: Critical column 'Area name' not found. Available columns: {list(rent_df.columns)}"
-            
-            # Seleccionar solo las columnas que existen
-            cols_to_use = list(cols_found.keys())
-            rent_df = rent_df[cols_to_use].copy()
-            
-            # Renombrar columnas
-            rent_df = rent_df.rename(columns=cols_found)
-            
-            print(f"✓ Selected {len(cols_to_use)} columns: {list(rent_df.columns)}")
-
-            # Convertir columnas de precios a numérico
-            price_cols = [col for col in rent_df.columns if col.startswith('rent_')]
-            for col in price_cols:
-                rent_df[col] = pd.to_numeric(rent_df[col], errors='coerce')
-                print(f"  → Converted {col} to numeric")
-            
-            # Eliminar filas sin nombre de borough
-            before_rows = len(rent_df)
-            rent_df = rent_df.dropna(subset=['borough'])
-            after_rows = len(rent_df)
-            print(f"✓ Cleaned data: {before_rows} → {after_rows} rows (removed {before_rows - after_rows} empty)")
-            
-            # Ordenar por borough alfabéticamente
-            rent_df = rent_df.sort_values('borough').reset_index(drop=True)
-
-            # Crear el contexto de texto para el modelo
-            text = "=" * 100 + "\n"
-            text += "RENTAL PRICES BY BOROUGH (Monthly Prices in £)\n"
-            text += "=" * 100 + "\n\n"
-            
-            # Formatear cada fila de manera legible
-            for idx, row in rent_df.iterrows():
-                text += f"{row['borough']}:\n"
-                
-                if 'rent_1bed' in row and pd.notna(row['rent_1bed']):
-                    text += f"  • 1 bed: £{int(row['rent_1bed'])}\n"
-                if 'rent_2bed' in row and pd.notna(row['rent_2bed']):
-                    text += f"  • 2 bed: £{int(row['rent_2bed'])}\n"
-                if 'rent_3bed' in row and pd.notna(row['rent_3bed']):
-                    text += f"  • 3 bed: £{int(row['rent_3bed'])}\n"
-                if 'rent_4plus_bed' in row and pd.notna(row['rent_4plus_bed']):
-                    text += f"  • 4+ bed: £{int(row['rent_4plus_bed'])}\n"
-                if 'rent_avg' in row and pd.notna(row['rent_avg']):
-                    text += f"  • Average: £{int(row['rent_avg'])}\n"
-                
-                text += "\n"
-            
-            text += "=" * 100 + "\n"
-            text += f"Total boroughs: {len(rent_df)}\n"
-            text += f"Data source: {rental_path.name}\n"
-            text += "=" * 100
-            
-            print(f"✓ Successfully formatted rental context with {len(rent_df)} boroughs")
-            return text
-
-        except Exception as e:
-            error_msg = f"ERROR loading rental data from {rental_path}:\n{str(e)}"
-            print(error_msg)
-            import traceback
-            traceback.print_exc()
-            return error_msg
-
-    def _generate_london_forecast(self, df: pd.DataFrame) -> str:
-        """Generates a text summary of London-wide forecasts."""
-        try:
-            yearly = (
-                df.groupby("year", as_index=False)
-                .agg(house_price=("house_price", "mean"))
-                .sort_values("year")
-            )
-
-            hp_ts = prep_prophet_df(yearly, "house_price")
-            fc = fit_forecast_prophet(hp_ts, years_ahead=3)
-
-            last_hist_year = yearly["year"].max()
-            fc["year"] = fc["ds"].dt.year
-            future_fc = fc[fc["year"] > last_hist_year].copy()
-
-            summary = ""
-            for _, row in future_fc.iterrows():
-                summary += f"Year {row['year']}: Predicted Mean House Price £{row['yhat']:,.0f}\n"
-
-            return summary
-        except Exception as e:
-            return f"Could not generate forecast: {e}"
-
-    def get_response(self, user_message: str) -> str:
-        if not self.api_key:
-            return "Error: Gemini API Key is missing. Please configure the backend."
-
-        system_prompt = """
+SYSTEM_PROMPT = """
 You are an expert assistant specialized in housing affordability in London and nearby commuter areas.
 
 PRIMARY BEHAVIOR (CRITICAL)
@@ -279,11 +84,179 @@ DEFAULT OUTPUT SHAPE
 DATA CONTEXT:
 """
 
-        full_prompt = f"{system_prompt}\n{self.context}\n\nUSER QUESTION: {user_message}"
+class ChatbotService:
+    def __init__(self, data=None, rents=None, llm=None, lazy: bool = False):
+        """
+        With `lazy=True` only the caches are set up; call `init_llm()` and `load_data()` later
+        (the app does this from its startup stages).
+        """
+        self.llm = llm
+        similarity = os.getenv("CHAT_CACHE_SIMILARITY")
+        self.cache = ResponseCache(
+            max_entries=int(os.getenv("CHAT_CACHE_SIZE", "256")),
+            ttl=float(os.getenv("CHAT_CACHE_TTL", "3600")),
+            similarity=float(similarity) if similarity else None,
+        )
+
+        # In the shared cache when there is one, so every worker sees every session
+        limits = {
+            "max_sessions": int(os.getenv("CHAT_SESSIONS_MAX", "1000")),
+            "ttl": float(os.getenv("CHAT_SESSION_TTL", "1800")),
+            "max_bytes": int(os.getenv("CHAT_SESSIONS_MAX_BYTES", str(5_000_000))),
+        }
+        folder = shared_dir()
+        self.sessions = SharedSessionStore(folder, **limits) if folder is not None else SessionStore(**limits)
+
+        self.index = None
+        self.full_context_chars = 0
+        self._data = None
+        self._forecast_ready = False
+        self._forecast_lock = threading.Lock()
+        if not lazy:
+            if self.llm is None:
+                self.init_llm()
+            self._load_data(data, rents)
+
+    def init_llm(self):
+        self.llm = client_from_env()
+        if self.llm is None:
+            print("WARNING: GEMINI_API_KEY not found in environment variables (set LLM_BACKEND=mock to run offline).")
+        return self.llm
+
+    def load_data(self, data, rents):
+        """
+        Builds the retrieval index over the shared dataset and rents (None when the rent_load
+        stage failed: the index is built without them). No Prophet fits: the London forecast is
+        added by `load_forecast()`, from the forecast_warmup stage or the first chat.
+        """
+        df = data.df
+        start = time.perf_counter()
+
+        # ---- RENTAL DATA ----
+        rent_entries = rents.entries() if rents is not None else {}
+
+        self.index = ChatContextIndex(df, rent_entries)
+        self._data = data
+        self._forecast_ready = False
+
+        # Size of the old "send everything" context, kept for comparison in prompt stats
+        full_history = df.sort_values(["Area", "year"])[["year", "Area", "house_price", "annual_income"]].to_string(index=False)
+        self.full_context_chars = (
+            len(SYSTEM_PROMPT) + len(full_history)
+            + sum(len(text) + 1 for text, _ in rent_entries.values())
+        )
+
+        DATA_LOAD.set(time.perf_counter() - start, stage="chat_context")
+        print(f"Chatbot context ready: {len(data.boroughs)} boroughs, {len(rent_entries)} rental entries.")
 
+    def _load_data(self, data, rents):
+        try:
+            if data is None:
+                data = load_dataset()
+            if rents is None:
+                rents = load_rents(data)
+            self.load_data(data, rents)
+        except Exception as e:
+            print(f"Error loading chatbot data: {e}")
+            import traceback
+            traceback.print_exc()
+            self.index = None
+
+    def load_forecast(self):
+        """Add the London forecast to the index, once (it fits every borough unless they are cached)."""
+        if self._forecast_ready or self.index is None:
+            return
+        with self._forecast_lock:
+            if self._forecast_ready:
+                return
+            forecast_text = self._generate_london_forecast(self._data)
+            self.index.set_forecast(forecast_text)
+            self.full_context_chars += len(forecast_text)
+            self._forecast_ready = True
+
+    def _generate_london_forecast(self, data) -> str:
+        """Generates a text summary of London-wide forecasts (the same reconciled forecast as /api/overview-forecast)."""
         try:
-            response = self.model.generate_content(full_prompt)
-            return response.text
+            fc = london_forecast(data, "house_price", 6)
+
+            last_hist_year = data.years[-1]
+            future_fc = fc[fc["year"] > last_hist_year].head(3)
+
+            summary = ""
+            for _, row in future_fc.iterrows():
+                summary += f"Year {row['year']}: Predicted Mean House Price £{row['yhat']:,.0f}\n"
+
+            return summary
         except Exception as e:
+            return f"Could not generate forecast: {e}"
+
+    @traced("chat_prompt")
+    def build_prompt(self, user_message: str, session=None) -> tuple:
+        """Assemble the prompt for one question and return (prompt, size stats)."""
+        if self.index is not None:
+            context, info = self.index.build(user_message, extra_boroughs=session.boroughs if session else ())
+        else:
+            context, info = "Data not available at the moment.", {}
+
+        history = session.render() if session is not None else ""
+        if history:
+            context = f"{context}\n\n{history}"
+
+        prompt = f"{SYSTEM_PROMPT}\n{context}\n\nUSER QUESTION: {user_message}"
+        stats = {
+            "chars": len(prompt),
+            "tokens_est": estimate_tokens(prompt),
+            "context_chars": len(context),
+            "history_chars": len(history),
+            "full_context_chars": self.full_context_chars,
+            "matched": info,
+        }
+        return prompt, stats
+
+    def respond(self, user_message: str, session=None) -> tuple:
+        """
+        Return (reply text, prompt stats) for a user message.
+        With a session, its summary and recent turns go into the prompt and the turn is recorded.
+        """
+        self.load_forecast()  # normally done by the forecast warm-up; else the first chat waits for it
+        version = self.index.version if self.index is not None else ""
+        mentioned = self.index.detect(user_message)["boroughs"] if self.index is not None else []
+        if session is not None:
+            session.remember(user_message, mentioned)
+            self.sessions.save(session)  # keep the facts even if the LLM call below fails
+
+        # Replies only depend on the message + known facts until the conversation has history
+        cacheable = session is None or not session.turns
+        signature = tuple(mentioned) + (session.facts() if session is not None else ())
+        cached = self.cache.get(user_message, version, signature) if cacheable else None
+        if cacheable:
+            CHAT_CACHE.inc(result="hit" if cached is not None else "miss")
+        if cached is not None:
+            self._record_turn(session, user_message, cached)
+            return cached, {"cached": True}
+
+        prompt, stats = self.build_prompt(user_message, session)
+        stats["cached"] = False
+
+        if self.llm is None:
+            return "Error: Gemini API Key is missing. Please configure the backend.", stats
+
+        try:
+            note_expensive()
+            text = self.llm.generate(prompt)
+            if cacheable:
+                self.cache.put(user_message, version, text, signature)
+            self._record_turn(session, user_message, text)
+            return text, stats
+        except LLMError as e:
             print(f"Error generating response: {e}")
-            return "I apologize, but I am having trouble processing your request right now. Please contact us — we'll be happy to help."
\ No newline at end of file
+            return "I apologize, but I am having trouble processing your request right now. Please contact us — we'll be happy to help.", stats
+
+    def _record_turn(self, session, user_message: str, reply: str):
+        if session is not None:
+            session.add_turn(user_message, reply)
+            self.sessions.save(session)
+
+    def get_response(self, user_message: str) -> str:
+        text, _ = self.respond(user_message)
+        return text
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import re
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from fastapi import HTTPException
+from metrics import DATA_LOAD
+from tracing import traced
+from shared_store import load_snapshot, save_arrays, open_array
+
+# Dataset loading shared by the API endpoints: long table + dense year x borough matrices
+#
+# Kept compact so a worker can hold much larger (e.g. UK-wide) tables: Area is categorical
+# (int8/int16 codes into the sorted borough names), year is int16 and values are float32. The
+# table is sorted by (Area, year), so `rows(borough)` is a slice view instead of a filtered copy.
+# Computations that need the precision upcast their (small) inputs to float64.
+
+BASE_DIR = Path(__file__).resolve().parent
+DATA_FILE = BASE_DIR / "data" / "merged_final.xlsx"
+DATA_SHEET = "merged_annual_long"
+
+METRICS = ("house_price", "annual_income")
+COLUMNS = ("year", "house_price", "annual_income")
+DTYPES = {"year": np.int16, "house_price": np.float32, "annual_income": np.float32}
+SNAPSHOT_FORMAT = 2  # bump when the snapshot layout or dtypes change
+
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """(year, Area, metrics...) with the compact dtypes, sorted by Area then year."""
+    boroughs = sorted(df["Area"].unique().tolist())
+    out = pd.DataFrame({
+        "year": df["year"].to_numpy(dtype=DTYPES["year"]),
+        "Area": pd.Categorical(df["Area"], categories=boroughs),
+        **{m: df[m].to_numpy(dtype=DTYPES[m]) for m in METRICS},
+    })
+    return out.sort_values(["Area", "year"], kind="stable", ignore_index=True)
+
+
+def _mapped(arr) -> bool:
+    """True if `arr` is (a view of) a memory-mapped file, i.e. shared with the other workers."""
+    while arr is not None:
+        if isinstance(arr, np.memmap):
+            return True
+        arr = getattr(arr, "base", None)
+    return False
+
+
+def normalize_area(s) -> str:
+    """Normalize borough names so datasets from different sources match (same rules as data/clean.py)."""
+    if pd.isna(s):
+        return ""
+    s = str(s).lower().strip()
+    s = s.replace("&", "and")
+    s = re.sub(r"[’']", "", s)
+    s = re.sub(r"[^a-z0-9\s]", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+
+class Dataset:
+    """
+    The cleaned long table (compact dtypes, see `compact`) plus, for each metric, a
+    (years x boroughs) float32 matrix with NaN where a borough has no value for a year.
+    `version` changes with the file contents. `matrices` can be passed in already built
+    (e.g. memory-mapped from the shared snapshot).
+    """
+
+    def __init__(self, df: pd.DataFrame, version: str, matrices: dict = None):
+        if not isinstance(df["Area"].dtype, pd.CategoricalDtype):
+            df = compact(df)
+        self.df = df
+        self.version = version
+        self.boroughs = df["Area"].cat.categories.tolist()
+        self.borough_map = {b.lower(): b for b in self.boroughs}  # exact lookup (case-insensitive)
+        self.years = np.unique(df["year"].to_numpy()).astype(int)
+
+        self._col = {b: i for i, b in enumerate(self.boroughs)}
+        codes = df["Area"].cat.codes.to_numpy()
+        bounds = np.searchsorted(codes, np.arange(len(self.boroughs) + 1))
+        self._rows = {b: slice(bounds[i], bounds[i + 1]) for i, b in enumerate(self.boroughs)}
+        self.matrices = matrices
+        if matrices is not None:
+            return
+        rows = np.searchsorted(self.years, df["year"].to_numpy())
+        self.matrices = {}
+        for metric in METRICS:
+            m = np.full((len(self.years), len(self.boroughs)), np.nan, dtype=DTYPES[metric])
+            m[rows, codes] = df[metric].to_numpy()
+            self.matrices[metric] = m
+
+    @traced("resolve_borough")
+    def resolve(self, borough: str) -> str:
+        """Exact (case-insensitive) match first, then the shortest borough containing the text."""
+        key = borough.strip().lower()
+        if not key:
+            raise HTTPException(status_code=400, detail="Empty borough")
+
+        if key in self.borough_map:
+            return self.borough_map[key]
+
+        matches = [b for b in self.boroughs if key in b.lower()]
+        if not matches:
+            raise HTTPException(status_code=404, detail="Borough not found")
+        # If multiple matches, choose the shortest (often the most specific)
+        return sorted(matches, key=len)[0]
+
+    @traced("resolve_boroughs")
+    def resolve_many(self, names) -> tuple:
+        """
+        Resolve several names with the same rules as `resolve` without raising.
+        Returns (unique resolved boroughs in request order, names that matched nothing).
+        """
+        lowered = [b.lower() for b in self.boroughs]
+        resolved, unresolved = [], []
+        for name in names:
+            key = name.strip().lower()
+            if not key:
+                continue
+            bname = self.borough_map.get(key)
+            if bname is None:
+                matches = [b for b, low in zip(self.boroughs, lowered) if key in low]
+                bname = min(matches, key=len) if matches else None
+            if bname is None:
+                unresolved.append(name.strip())
+            elif bname not in resolved:
+                resolved.append(bname)
+        return resolved, unresolved
+
+    def column(self, borough: str) -> int:
+        return self._col[borough]
+
+    @traced("slice_rows")
+    def rows(self, borough: str) -> pd.DataFrame:
+        """The borough's rows, sorted by year (a slice of the table, not a copy; don't modify it)."""
+        return self.df.iloc[self._rows[borough]]
+
+    def memory_report(self) -> dict:
+        """Bytes held per column and matrix, and whether they are memory-mapped from the shared snapshot."""
+        columns = {}
+        for c in self.df.columns:
+            s = self.df[c]
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                arrays = (s.cat.codes.to_numpy(), s.cat.categories.to_numpy())
+                nbytes = int(s.memory_usage(index=False, deep=True))
+            else:
+                arrays = (s.to_numpy(),)
+                nbytes = int(arrays[0].nbytes)
+            columns[c] = {"dtype": str(s.dtype), "bytes": nbytes, "mapped": _mapped(arrays[0])}
+        matrices = {
+            m: {"dtype": str(a.dtype), "shape": list(a.shape), "bytes": int(a.nbytes), "mapped": _mapped(a)}
+            for m, a in self.matrices.items()
+        }
+        total = sum(c["bytes"] for c in columns.values()) + sum(m["bytes"] for m in matrices.values())
+        mapped = sum(e["bytes"] for e in (*columns.values(), *matrices.values()) if e["mapped"])
+        return {
+            "rows": len(self.df),
+            "boroughs": len(self.boroughs),
+            "years": len(self.years),
+            "columns": columns,
+            "matrices": matrices,
+            "bytes": total,
+            "private_bytes": total - mapped,
+        }
+
+    def save(self, folder: Path):
+        """Write the long table columns and the matrices as .npy files (see `Dataset.open`)."""
+        (folder / "boroughs.json").write_text(json.dumps(self.boroughs))
+        arrays = {c: self.df[c].to_numpy() for c in COLUMNS}
+        arrays["area"] = self.df["Area"].cat.codes.to_numpy()
+        arrays.update({f"matrix_{m}": self.matrices[m] for m in METRICS})
+        save_arrays(folder, arrays)
+
+    @classmethod
+    def open(cls, folder: Path, version: str) -> "Dataset":
+        boroughs = json.loads((folder / "boroughs.json").read_text())
+        df = pd.DataFrame({c: open_array(folder, c) for c in COLUMNS}, copy=False)
+        df.insert(1, "Area", pd.Categorical.from_codes(open_array(folder, "area"), categories=boroughs))
+        matrices = {m: open_array(folder, f"matrix_{m}") for m in METRICS}
+        return cls(df, version, matrices)
+
+
+def file_version(path: Path) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def read_dataset(path: Path = DATA_FILE, sheet: str = DATA_SHEET, version: str = None) -> Dataset:
+    """Parse the workbook (slow: a second or more of openpyxl)."""
+    df = pd.read_excel(path, sheet_name=sheet)
+
+    df["year"] = pd.to_numeric(df["year"], errors="coerce")
+    df["Area"] = df["Area"].astype(str).str.strip()
+    df["house_price"] = pd.to_numeric(df["house_price"], errors="coerce")
+    df["annual_income"] = pd.to_numeric(df["annual_income"], errors="coerce")
+
+    df = df.dropna(subset=["year", "Area", "house_price", "annual_income"])
+
+    return Dataset(compact(df), version or file_version(path))
+
+
+def load_dataset(path: Path = DATA_FILE, sheet: str = DATA_SHEET) -> Dataset:
+    """
+    Load the dataset through the shared snapshot: only the first worker for a given file
+    version parses the workbook, the others memory-map the arrays it saved.
+    """
+    start = time.perf_counter()
+    version = file_version(path)
+    data = load_snapshot(
+        "dataset", f"{version}-v{SNAPSHOT_FORMAT}",
+        build=lambda: read_dataset(path, sheet, version),
+        write=lambda folder, built: built.save(folder),
+        read=lambda folder: Dataset.open(folder, version),
+    )
+    DATA_LOAD.set(time.perf_counter() - start, stage="dataset")
+    return data
+
+
+def json_matrix(m: np.ndarray, decimals: int = 0) -> list:
+    """Round for JSON output, with null where the value is NaN/inf."""
+    finite = np.isfinite(m)
+    out = np.round(np.where(finite, m, 0), decimals)
+    out = (out.astype(np.int64) if decimals == 0 else out).astype(object)
+    out[~finite] = None
+    return out.tolist()
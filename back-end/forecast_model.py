@@ -1,15 +1,34 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
 import pandas as pd
 import numpy as np
 from prophet import Prophet
 from fastapi import HTTPException
+from metrics import PROPHET_FIT, PROPHET_PREDICT, FORECAST_CACHE, JOINT_FIT
+from shared_store import get_forecast_store
+from singleflight import SingleFlight
+from rate_limit import note_expensive
+from joint_model import forecast_joint
+from tracing import span
 
 #Prophet model 
 
+INTERVAL_WIDTH = 0.80
+Z80 = 1.2815515655446004  # normal quantile for the 80% interval: sd = (upper - lower) / (2 * Z80)
+N_CHANGEPOINTS = 25
+CHANGEPOINT_PRIOR_SCALE = 0.25  # More responsive to trend changes (improved from 0.1)
+CHANGEPOINT_RANGE = 0.9  # Allow changepoints in 90% of history
+DEFAULT_SETTINGS = {"changepoint_prior_scale": CHANGEPOINT_PRIOR_SCALE, "changepoint_range": CHANGEPOINT_RANGE}
+
 def prep_prophet_df(d: pd.DataFrame, value_col: str) -> pd.DataFrame:
     """Prepare data for Prophet with validation and outlier handling."""
     out = d[["year", value_col]].copy()
     out["ds"] = pd.to_datetime(out["year"].astype(str) + "-01-01")
-    out["y"] = pd.to_numeric(out[value_col], errors="coerce")
+    out["y"] = pd.to_numeric(out[value_col], errors="coerce").astype(float)  # float32 in the dataset
     out = out.dropna(subset=["ds", "y"]).sort_values("ds")
     
     # Validate positive values for log transform
@@ -26,24 +45,42 @@ def prep_prophet_df(d: pd.DataFrame, value_col: str) -> pd.DataFrame:
     return out[["ds", "y"]]
 
 
-def fit_forecast_prophet(df_ts: pd.DataFrame, years_ahead: int = 6):
-    """Fit Prophet model with improved configuration for housing data."""
+def fit_prophet_model(df_ts: pd.DataFrame, init: dict = None, settings: dict = None) -> Prophet:
+    """
+    Fit Prophet model with improved configuration for housing data (warm-started from `init` if
+    given). `settings` overrides DEFAULT_SETTINGS, e.g. a series' tuned settings (`series_settings`).
+    """
     if len(df_ts) < 8:
         raise HTTPException(status_code=400, detail="Not enough data points for forecasting")
 
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
     m = Prophet(
         yearly_seasonality=False,
         weekly_seasonality=False,
         daily_seasonality=False,
-        changepoint_prior_scale=0.25,  # More responsive to trend changes (improved from 0.1)
-        changepoint_range=0.9,  # Allow changepoints in 90% of history
-        interval_width=0.80
+        n_changepoints=N_CHANGEPOINTS,
+        changepoint_prior_scale=settings["changepoint_prior_scale"],
+        changepoint_range=settings["changepoint_range"],
+        interval_width=INTERVAL_WIDTH
     )
-    m.fit(df_ts)
+    start = "warm" if init else "cold"
+    with PROPHET_FIT.time(start=start), span("prophet_fit", start=start, points=len(df_ts)):
+        if init:
+            m.fit(df_ts, init=init)
+        else:
+            m.fit(df_ts)
+    return m
+
+
+def fit_forecast_prophet(df_ts: pd.DataFrame, years_ahead: int = 6, init: dict = None, settings: dict = None):
+    return predict_prophet(fit_prophet_model(df_ts, init, settings), years_ahead)
+
 
+def predict_prophet(m: Prophet, years_ahead: int) -> pd.DataFrame:
     # freq='YS' = Year Start (01-01)
     future = m.make_future_dataframe(periods=years_ahead, freq="YS")
-    fc = m.predict(future)
+    with PROPHET_PREDICT.time(), span("prophet_predict", years_ahead=years_ahead):
+        fc = m.predict(future)
 
     # Convert back from log scale to original scale
     fc["yhat"] = np.exp(fc["yhat"])
@@ -51,3 +88,319 @@ def fit_forecast_prophet(df_ts: pd.DataFrame, years_ahead: int = 6):
     fc["yhat_upper"] = np.exp(fc["yhat_upper"])
 
     return fc[["ds", "yhat", "yhat_lower", "yhat_upper"]]
+
+
+# Warm starts
+# -------------------------
+# When a refresh only appends years, the previous fit's parameters are a good starting point for
+# the optimizer. Parameters are stored per (series, metric) together with the history they came from.
+
+def model_params(m: Prophet) -> dict:
+    """Fitted MAP parameters as plain floats/lists (JSON-friendly)."""
+    flat = {name: np.asarray(m.params[name], dtype=float).reshape(-1) for name in ("k", "m", "sigma_obs", "delta", "beta")}
+    return {name: (float(v[0]) if name in ("k", "m", "sigma_obs") else v.tolist()) for name, v in flat.items()}
+
+
+def n_changepoints(n_points: int, changepoint_range: float = CHANGEPOINT_RANGE) -> int:
+    """Changepoint count Prophet will use for a history of `n_points` (mirrors Prophet.set_changepoints)."""
+    hist_size = int(np.floor(n_points * changepoint_range))
+    return max(min(N_CHANGEPOINTS, hist_size - 1), 0)
+
+
+def warm_start_init(params: dict, n_points: int, changepoint_range: float = CHANGEPOINT_RANGE) -> dict:
+    """
+    `init=` for Prophet.fit from stored parameters. A longer history gets more changepoints:
+    the old rate changes are kept and the new ones start at zero. Prophet ignores any init
+    whose shape does not match, so a mismatch degrades to its default start.
+    """
+    delta = np.zeros(n_changepoints(n_points, changepoint_range))
+    old = np.asarray(params["delta"], dtype=float)[: len(delta)]
+    delta[: len(old)] = old
+    return {
+        "k": params["k"],
+        "m": params["m"],
+        "sigma_obs": params["sigma_obs"],
+        "delta": delta,
+        "beta": np.asarray(params["beta"], dtype=float),
+    }
+
+
+def history_points(df_ts: pd.DataFrame) -> list:
+    return [[int(year), round(float(y), 9)] for year, y in zip(df_ts["ds"].dt.year, df_ts["y"])]
+
+
+def appended_only(old: list, new: list) -> bool:
+    """True when `new` is `old` plus zero or more later points (nothing earlier changed)."""
+    return len(new) >= len(old) and new[: len(old)] == old
+
+
+_params = {}  # (series, metric) -> stored fit, used when the shared store is off
+_fit_stats = {"cold": 0, "warm": 0, "refit": 0, "fit_ms": {"cold": 0.0, "warm": 0.0, "refit": 0.0}, "saved_ms": 0.0}
+_fit_stats_lock = threading.Lock()
+
+
+def fit_stats() -> dict:
+    """
+    Fits done by this worker by start type: cold (no earlier fit), warm (history only gained
+    years) or refit (history changed retroactively). `saved_ms` sums, over warm fits, the
+    series' last full-fit time minus the warm fit time.
+    """
+    with _fit_stats_lock:
+        stats = {k: (dict(v) if isinstance(v, dict) else v) for k, v in _fit_stats.items()}
+    warm = stats["warm"]
+    stats["avg_fit_ms"] = {k: round(stats["fit_ms"][k] / n, 1) if (n := stats[k]) else None for k in ("cold", "warm", "refit")}
+    stats["saved_ms"] = round(stats["saved_ms"], 1)
+    stats["fit_ms"] = {k: round(v, 1) for k, v in stats["fit_ms"].items()}
+    stats["warm_share"] = round(warm / max(stats["cold"] + warm + stats["refit"], 1), 3)
+    stats["in_flight"] = _in_flight.in_flight()
+    return stats
+
+
+def _record_fit(kind: str, fit_ms: float, saved_ms: float = 0.0):
+    with _fit_stats_lock:
+        _fit_stats[kind] += 1
+        _fit_stats["fit_ms"][kind] += fit_ms
+        _fit_stats["saved_ms"] += saved_ms
+
+
+def fit_series(series: str, df_ts: pd.DataFrame, value_col: str, years_ahead: int, settings: dict = None) -> pd.DataFrame:
+    """Fit one series, warm-starting from its stored parameters when the history only gained years."""
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    store = get_forecast_store()
+    prev = store.get_params(series, value_col) if store is not None else _params.get((series, value_col))
+    history = history_points(df_ts)
+
+    kind, init = "cold", None
+    if prev is not None:
+        if appended_only(prev["history"], history):
+            kind, init = "warm", warm_start_init(prev["params"], len(history), settings["changepoint_range"])
+        else:
+            kind = "refit"
+
+    start = time.perf_counter()
+    m = fit_prophet_model(df_ts, init, settings)
+    fit_ms = (time.perf_counter() - start) * 1000
+
+    cold_fit_ms = prev["cold_fit_ms"] if kind == "warm" else fit_ms
+    _record_fit(kind, fit_ms, cold_fit_ms - fit_ms if kind == "warm" else 0.0)
+    entry = {"history": history, "params": model_params(m), "cold_fit_ms": cold_fit_ms}
+    if store is not None:
+        store.put_params(series, value_col, entry)
+    else:
+        _params[(series, value_col)] = entry
+    return predict_prophet(m, years_ahead)
+
+
+# Tuned settings
+# -------------------------
+# tune_prophet.py grid-searches the changepoint settings per series with rolling-origin CV and
+# writes the winners to PROPHET_PARAMS_FILE. The API loads that file once at startup (the
+# model_params stage); series it does not list, or a missing file, use DEFAULT_SETTINGS.
+PARAMS_FORMAT = 1
+PROPHET_PARAMS_FILE = Path(os.getenv("PROPHET_PARAMS_FILE", Path(__file__).resolve().parent / "data" / "prophet_params.json"))
+_tuned = {"version": None, "data_version": None, "series": {}}
+
+
+def load_tuned_settings(path: Path = PROPHET_PARAMS_FILE, data_version: str = None) -> dict:
+    """Use the tuned settings in `path` from now on; returns what was loaded (see `tuned_report`)."""
+    global _tuned
+    if not path.exists():
+        print(f"No tuned Prophet settings at {path}, using defaults")
+        _tuned = {"version": None, "data_version": None, "series": {}}
+        return tuned_report()
+
+    config = json.loads(path.read_text())
+    if config.get("format") != PARAMS_FORMAT:
+        raise ValueError(f"{path}: format {config.get('format')}, expected {PARAMS_FORMAT}")
+    series = {
+        (name, metric): {k: float(entry[k]) for k in DEFAULT_SETTINGS}
+        for name, metrics in config["series"].items()
+        for metric, entry in metrics.items()
+    }
+    _tuned = {"version": config["version"], "data_version": config.get("data_version"), "series": series}
+    if data_version and config.get("data_version") != data_version:
+        print(f"Tuned Prophet settings {config['version']} were tuned on data {config.get('data_version')}, "
+              f"not the loaded {data_version}; rerun tune_prophet.py")
+    print(f"Loaded tuned Prophet settings {config['version']} for {len(series)} series")
+    return tuned_report(data_version)
+
+
+def series_settings(series: str, metric: str) -> dict:
+    return _tuned["series"].get((series, metric), DEFAULT_SETTINGS)
+
+
+def tuned_report(data_version: str = None) -> dict:
+    tuned = _tuned
+    report = {"version": tuned["version"], "series": len(tuned["series"]), "tuned_on": tuned["data_version"]}
+    if data_version is not None and tuned["version"] is not None:
+        report["stale"] = tuned["data_version"] != data_version
+    return report
+
+
+def _settings_tag(settings: dict) -> str:
+    """Short label for the cache key, so forecasts from different settings are kept apart."""
+    return f"cps={settings['changepoint_prior_scale']:g},cr={settings['changepoint_range']:g}"
+
+
+# Forecast cache
+# -------------------------
+# Fits are deterministic for a given series, horizon, data version and settings, so each one is done once:
+# an in-process LRU in front of the forecast table every worker shares (shared_store.py).
+# Concurrent misses on the same (engine, series, horizon, version) in a worker are coalesced
+# into one computation (result "coalesced"); across workers the store's fit lock does the same.
+FORECAST_CACHE_SIZE = 256
+_forecast_cache = OrderedDict()
+_forecast_cache_lock = threading.Lock()
+_in_flight = SingleFlight()
+
+
+def _fit(series: str, d: pd.DataFrame, value_col: str, years_ahead: int) -> pd.DataFrame:
+    FORECAST_CACHE.inc(result="miss")
+    note_expensive()
+    settings = series_settings(series, value_col)
+    with span("prep_prophet_df"):
+        df_ts = prep_prophet_df(d, value_col)
+    fc = fit_series(series, df_ts, value_col, years_ahead, settings)
+    fc["year"] = fc["ds"].dt.year
+    return fc.sort_values("year").reset_index(drop=True)
+
+
+def forecast_series(series: str, d: pd.DataFrame, value_col: str, years_ahead: int, version: str) -> pd.DataFrame:
+    """
+    Cached Prophet forecast of `value_col` for one series (a borough name, or "London" for the mean).
+    Returns ds, year, yhat, yhat_lower, yhat_upper; treat the result as read-only.
+    On a miss the shared store is checked next, and only one worker fits a given key at a time.
+    """
+    key = (series, value_col, years_ahead, version, _settings_tag(series_settings(series, value_col)))
+    with span("forecast_series", series=series, metric=value_col) as attrs:
+        with _forecast_cache_lock:
+            fc = _forecast_cache.get(key)
+            if fc is not None:
+                _forecast_cache.move_to_end(key)
+                FORECAST_CACHE.inc(result="hit")
+                attrs["cache"] = "hit"
+                return fc
+
+        fc, shared = _in_flight.do(("prophet",) + key, lambda: _load_or_fit(key, d))
+        if shared:
+            FORECAST_CACHE.inc(result="coalesced")
+        attrs["cache"] = "coalesced" if shared else "loaded"
+        return fc
+
+
+def _load_or_fit(key: tuple, d: pd.DataFrame) -> pd.DataFrame:
+    """Shared store, else fit; then fill the in-process cache. Runs once per key at a time."""
+    series, value_col, years_ahead, version, _ = key
+    with _forecast_cache_lock:
+        fc = _forecast_cache.get(key)
+    if fc is not None:  # filled by a call that finished after our cache check
+        FORECAST_CACHE.inc(result="hit")
+        return fc
+
+    store = get_forecast_store()
+    fc = store.get(key) if store is not None else None
+    if fc is not None:
+        FORECAST_CACHE.inc(result="shared_hit")
+    elif store is None:
+        fc = _fit(series, d, value_col, years_ahead)
+    else:
+        with store.fit_lock(key):
+            fc = store.get(key)  # another worker may have fitted it while we waited
+            if fc is not None:
+                FORECAST_CACHE.inc(result="shared_hit")
+            else:
+                fc = _fit(series, d, value_col, years_ahead)
+                store.put(key, version, fc)
+
+    with _forecast_cache_lock:
+        _forecast_cache[key] = fc
+        while len(_forecast_cache) > FORECAST_CACHE_SIZE:
+            _forecast_cache.popitem(last=False)
+    return fc
+
+
+# Engines
+# -------------------------
+# prophet: one Prophet fit per series (cached above). joint: all boroughs of a metric, plus the
+# London mean, in one batched fit (joint_model.py); a few ms, so it is only cached in-process.
+ENGINES = ("prophet", "joint")
+DEFAULT_ENGINE = os.getenv("FORECAST_ENGINE", "prophet")
+_joint_cache = OrderedDict()
+_joint_cache_lock = threading.Lock()
+
+
+def joint_forecasts(data, value_col: str, years_ahead: int) -> dict:
+    """{borough or "London": forecast frame} from one joint fit of every borough series."""
+    key = (value_col, years_ahead, data.version)
+    with _joint_cache_lock:
+        out = _joint_cache.get(key)
+        if out is not None:
+            _joint_cache.move_to_end(key)
+            FORECAST_CACHE.inc(result="hit")
+            return out
+
+    out, shared = _in_flight.do(("joint",) + key, lambda: _joint_fit(data, value_col, years_ahead))
+    if shared:
+        FORECAST_CACHE.inc(result="coalesced")
+    return out
+
+
+def _joint_fit(data, value_col: str, years_ahead: int) -> dict:
+    key = (value_col, years_ahead, data.version)
+    with _joint_cache_lock:
+        out = _joint_cache.get(key)
+    if out is not None:  # filled by a call that finished after our cache check
+        FORECAST_CACHE.inc(result="hit")
+        return out
+
+    FORECAST_CACHE.inc(result="miss")
+    note_expensive()
+    values = np.asarray(data.matrices[value_col], dtype=float)
+    london = np.nanmean(values, axis=1)
+    with JOINT_FIT.time(metric=value_col), span("joint_fit", metric=value_col):
+        res = forecast_joint(data.years, np.column_stack([values, london]), years_ahead, interval=INTERVAL_WIDTH)
+
+    ds = pd.to_datetime([f"{y}-01-01" for y in res["years"]])
+    out = {}
+    for j, name in enumerate(list(data.boroughs) + ["London"]):
+        if res["valid"][j]:
+            out[name] = pd.DataFrame({
+                "ds": ds, "year": res["years"], "yhat": res["yhat"][j],
+                "yhat_lower": res["yhat_lower"][j], "yhat_upper": res["yhat_upper"][j],
+            })
+
+    with _joint_cache_lock:
+        _joint_cache[key] = out
+        while len(_joint_cache) > 16:
+            _joint_cache.popitem(last=False)
+    return out
+
+
+def borough_forecast(data, borough: str, value_col: str, years_ahead: int, engine: str = None) -> pd.DataFrame:
+    """Forecast for one borough of the dataset with the chosen engine (same frame as `forecast_series`)."""
+    if (engine or DEFAULT_ENGINE) == "joint":
+        fc = joint_forecasts(data, value_col, years_ahead).get(borough)
+        if fc is None:
+            raise HTTPException(status_code=400, detail="Not enough data points for forecasting")
+        return fc
+    return forecast_series(borough, data.rows(borough), value_col, years_ahead, data.version)
+
+
+def cache_report() -> dict:
+    """Entries and bytes held by this worker's forecast caches."""
+    def frames_bytes(frames):
+        # Same numeric columns in every frame: rows x row width (DataFrame.memory_usage per frame is slow)
+        if not frames:
+            return 0
+        width = sum(dt.itemsize for dt in frames[0].dtypes)
+        return int(sum(len(fc) for fc in frames) * width)
+
+    with _forecast_cache_lock:
+        prophet = list(_forecast_cache.values())
+    with _joint_cache_lock:
+        joint = [fc for fits in _joint_cache.values() for fc in fits.values()]
+    return {
+        "prophet": {"entries": len(prophet), "bytes": frames_bytes(prophet)},
+        "joint": {"entries": len(joint), "bytes": frames_bytes(joint)},
+    }
+
@@ -0,0 +1,114 @@
+from statistics import NormalDist
+import numpy as np
+
+# Joint trend engine: every series of a metric fitted in one batched NumPy solve
+#
+# Same trend shape as the Prophet setup (log values, piecewise-linear trend with changepoints in
+# the first 90% of history, no seasonality), but hierarchical: rate changes of the city-wide
+# mean series get a weak ridge (CITY_RIDGE), and each series' rate changes are shrunk towards
+# the city-wide ones (SHRINKAGE). Intervals follow Prophet's recipe (future rate changes drawn
+# at the historical frequency and size, plus observation noise).
+#
+# The strengths are fixed: picking them per fit on a holdout of the last years chased the 2016
+# turn in house prices and did worse on backtests (benchmarks/engines.py) than these values.
+
+CITY_RIDGE = 0.003
+SHRINKAGE = 0.1
+SAMPLES = 1000
+MIN_POINTS = 8
+
+
+def n_changepoints(n_points: int, n_changepoints: int = 25, changepoint_range: float = 0.9) -> int:
+    hist_size = int(np.floor(n_points * changepoint_range))
+    return max(min(n_changepoints, hist_size - 1), 0)
+
+
+def design(t: np.ndarray, changepoints: np.ndarray) -> np.ndarray:
+    """[1, t, (t - s_c)+ for each changepoint] rows for the (scaled) times `t`."""
+    return np.column_stack([np.ones_like(t), t, np.maximum(t[:, None] - changepoints[None, :], 0)])
+
+
+def _solve(X: np.ndarray, Y: np.ndarray, mask: np.ndarray, shrinkage: float, prior: np.ndarray) -> np.ndarray:
+    """
+    Batched ridge fit of all series at once. X (T, p), Y and mask (T, n); rate changes are pulled
+    towards `prior` (p,) with weight `shrinkage`. Returns coefficients (n, p).
+    """
+    p = X.shape[1]
+    ridge = np.full(p, shrinkage)
+    ridge[:2] = 1e-6  # level and base growth are left (almost) free
+    W = mask.T.astype(float)  # (n, T)
+    A = np.einsum("nt,tp,tq->npq", W, X, X) + np.diag(ridge)[None]
+    b = np.einsum("nt,tp,tn->np", W, X, np.where(mask, Y, 0)) + (ridge * prior)[None]
+    return np.linalg.solve(A, b[..., None])[..., 0]
+
+
+def _fit(X: np.ndarray, Y: np.ndarray, mask: np.ndarray, shrinkage: float) -> np.ndarray:
+    """City-wide rate changes from the mean series first, then every series shrunk towards them."""
+    rows = mask.any(axis=1)
+    mean = np.where(mask, Y, 0).sum(axis=1) / np.maximum(mask.sum(axis=1), 1)
+    city = _solve(X[rows], mean[rows, None], np.ones((rows.sum(), 1), dtype=bool), CITY_RIDGE, np.zeros(X.shape[1]))[0]
+    prior = np.concatenate([[0.0, 0.0], city[2:]])
+    return _solve(X, Y, mask, shrinkage, prior)
+
+
+def _changepoint_index(n_points: int) -> np.ndarray:
+    """Evenly spaced changepoint rows in the first 90% of history (Prophet's placement)."""
+    n_cp = n_changepoints(n_points)
+    hist_size = int(np.floor(n_points * 0.9))
+    return np.linspace(0, hist_size - 1, n_cp + 1).round().astype(int)[1:]
+
+
+def forecast_joint(years: np.ndarray, values: np.ndarray, years_ahead: int, interval: float = 0.80,
+                   shrinkage: float = SHRINKAGE, seed: int = 0) -> dict:
+    """
+    Fit every column of `values` (years x series, positive, NaN = missing) in one go and forecast
+    `years_ahead` years. Returns {"years", "yhat", "yhat_lower", "yhat_upper", "valid"};
+    the matrices are (series, history + future years) on the original scale. Series with fewer than
+    MIN_POINTS values are marked invalid and left NaN.
+    """
+    years = np.asarray(years)
+    values = np.asarray(values, dtype=float)
+    Y = np.log(np.where(values > 0, values, np.nan))
+    mask = ~np.isnan(Y)
+    valid = mask.sum(axis=0) >= MIN_POINTS
+    mask &= valid[None, :]
+    T, n = Y.shape
+
+    span = float(years[-1] - years[0])
+    t = (years - years[0]) / span
+    cps = t[_changepoint_index(T)]
+    coef = _fit(design(t, cps), Y, mask, shrinkage)  # (n, p)
+
+    future_years = np.arange(years[-1] + 1, years[-1] + years_ahead + 1)
+    all_years = np.concatenate([years, future_years])
+    t_all = (all_years - years[0]) / span
+    yhat = (design(t_all, cps) @ coef.T).T  # (n, T + H)
+
+    # Observation noise per series
+    resid = np.where(mask, Y - yhat[:, :T].T, 0)
+    dof = np.maximum(mask.sum(axis=0) - 2, 1)
+    sigma = np.sqrt((resid ** 2).sum(axis=0) / dof)
+
+    # Trend uncertainty: future rate changes as often and as large as the historical ones
+    rng = np.random.default_rng(seed)
+    dt = 1.0 / span
+    p_change = len(cps) / (T - 1) if len(cps) else 0.0
+    scale = np.mean(np.abs(coef[:, 2:]), axis=1) if len(cps) else np.zeros(n)
+    changes = (rng.random((SAMPLES, n, years_ahead)) < p_change) * rng.laplace(0, 1, (SAMPLES, n, years_ahead)) * scale[None, :, None]
+    drift = np.cumsum(np.cumsum(changes, axis=2) * dt, axis=2)
+    noise = rng.standard_normal((SAMPLES, n, years_ahead)) * sigma[None, :, None]
+    sims = yhat[None, :, T:] + drift + noise
+    q = (1 - interval) / 2
+    lo_f, hi_f = np.quantile(sims, [q, 1 - q], axis=0)
+
+    # History years only carry observation noise (as in Prophet)
+    z = NormalDist().inv_cdf(0.5 + interval / 2)
+    lower = np.concatenate([yhat[:, :T] - z * sigma[:, None], lo_f], axis=1)
+    upper = np.concatenate([yhat[:, :T] + z * sigma[:, None], hi_f], axis=1)
+
+    invalid = ~valid
+    out = {name: np.exp(m) for name, m in (("yhat", yhat), ("yhat_lower", lower), ("yhat_upper", upper))}
+    for m in out.values():
+        m[invalid] = np.nan
+    return {"years": all_years, **out, "valid": valid}
+
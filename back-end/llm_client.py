@@ -0,0 +1,295 @@
+import os
+import random
+import threading
+import time
+import httpx
+from metrics import LLM_ERRORS, LLM_LATENCY
+from tracing import span, current_request_id
+
+# LLM access for the chatbot: swappable backends behind deadlines, a concurrency cap,
+# retries and a circuit breaker
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The model call failed."""
+
+
+class LLMTimeout(LLMError):
+    """The call did not finish before its deadline."""
+
+
+class LLMUnavailable(LLMError):
+    """Rejected without calling upstream (circuit open or no free concurrency slot)."""
+
+
+class _Retryable(LLMError):
+    pass
+
+
+class GeminiBackend:
+    """Gemini generateContent over REST, sharing one pooled keep-alive HTTP client."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, model: str = "gemini-2.5-flash", max_connections: int = 10):
+        self.model = model
+        self._client = httpx.Client(
+            base_url=GEMINI_BASE_URL,
+            headers={"x-goog-api-key": api_key},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        request_id = current_request_id()
+        try:
+            r = self._client.post(
+                f"/v1beta/models/{self.model}:generateContent",
+                json={"contents": [{"parts": [{"text": prompt}]}]},
+                headers={"x-request-id": request_id} if request_id else None,
+                timeout=timeout,
+            )
+        except httpx.TimeoutException as e:
+            raise LLMTimeout(f"Gemini call timed out after {timeout:.1f}s") from e
+        except httpx.TransportError as e:
+            raise _Retryable(f"Gemini transport error: {e}") from e
+        except httpx.HTTPError as e:
+            raise LLMError(f"Gemini request failed: {e}") from e
+
+        if r.status_code in RETRYABLE_STATUS:
+            raise _Retryable(f"Gemini returned {r.status_code}")
+        if r.status_code != 200:
+            raise LLMError(f"Gemini returned {r.status_code}: {r.text[:200]}")
+
+        try:
+            parts = r.json()["candidates"][0]["content"]["parts"]
+        except (KeyError, IndexError, ValueError) as e:
+            raise LLMError("Unexpected Gemini response shape") from e
+        return "".join(p.get("text", "") for p in parts)
+
+    def close(self):
+        self._client.close()
+
+
+class MockBackend:
+    """Offline backend with configurable latency/failures, for local runs and load tests."""
+
+    name = "mock"
+
+    def __init__(self, latency: float = 0.3, jitter: float = 0.0, failure_rate: float = 0.0, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        self.calls += 1
+        delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+        if delay > timeout:
+            time.sleep(timeout)
+            raise LLMTimeout(f"mock call timed out after {timeout:.1f}s")
+        time.sleep(delay)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise _Retryable("mock failure")
+        return f"[mock] prompt of {len(prompt)} chars (~{(len(prompt) + 3) // 4} tokens)"
+
+    def close(self):
+        pass
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures; lets one trial call through after `reset_timeout`."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def cancel(self):
+        """An allowed call never reached upstream; free the half-open trial."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+
+class LLMClient:
+    """
+    Wraps a backend with a per-call deadline, a semaphore on concurrent upstream calls,
+    retries with exponential backoff (within the deadline) and a circuit breaker.
+    """
+
+    def __init__(self, backend, timeout: float = 20.0, max_concurrency: int = 4, retries: int = 1,
+                 backoff: float = 0.5, breaker: CircuitBreaker = None):
+        self.backend = backend
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def generate(self, prompt: str, timeout: float = None) -> str:
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            with span("llm", backend=self.backend.name, prompt_chars=len(prompt)):
+                return self._generate(prompt, timeout)
+        except LLMUnavailable:
+            outcome = "rejected"
+            LLM_ERRORS.inc(backend=self.backend.name, kind="rejected")
+            raise
+        except LLMTimeout:
+            outcome = "timeout"
+            LLM_ERRORS.inc(backend=self.backend.name, kind="timeout")
+            raise
+        except LLMError:
+            outcome = "error"
+            LLM_ERRORS.inc(backend=self.backend.name, kind="error")
+            raise
+        finally:
+            LLM_LATENCY.observe(time.perf_counter() - start, backend=self.backend.name, outcome=outcome)
+
+    def _generate(self, prompt: str, timeout: float = None) -> str:
+        deadline = time.monotonic() + (timeout or self.timeout)
+
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise LLMUnavailable("LLM circuit is open")
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._count("rejected")
+            self.breaker.cancel()
+            raise LLMUnavailable("No free LLM slot before the deadline")
+
+        self._count("in_flight", 1)
+        try:
+            attempt = 0
+            while True:
+                self._count("calls")
+                try:
+                    with span("llm_call", attempt=attempt):
+                        text = self.backend.generate(prompt, max(0.0, deadline - time.monotonic()))
+                    self.breaker.record_success()
+                    return text
+                except LLMTimeout:
+                    self._count("timeouts")
+                    self._count("errors")
+                    self.breaker.record_failure()
+                    raise
+                except _Retryable as e:
+                    self._count("errors")
+                    self.breaker.record_failure()
+                    wait = self.backoff * (2 ** attempt)
+                    if attempt >= self.retries or time.monotonic() + wait >= deadline or not self.breaker.allow():
+                        raise LLMError(str(e)) from e
+                    time.sleep(wait)
+                    attempt += 1
+                except LLMError:
+                    self._count("errors")
+                    self.breaker.record_failure()
+                    raise
+                except Exception as e:
+                    # A backend bug must still settle the breaker (a half-open trial would stay taken)
+                    self._count("errors")
+                    self.breaker.record_failure()
+                    raise LLMError(f"{self.backend.name} backend failed: {type(e).__name__}: {e}") from e
+        finally:
+            self._count("in_flight", -1)
+            self._slots.release()
+
+    def _count(self, name: str, delta: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.backend.name,
+                "timeout_seconds": self.timeout,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+                "circuit": self.breaker.state,
+            }
+
+    def close(self):
+        self.backend.close()
+
+
+def client_from_env():
+    """
+    Build the LLM client from environment settings, or None if no backend is configured.
+
+    LLM_BACKEND=gemini (default when GEMINI_API_KEY is set) or mock; LLM_TIMEOUT,
+    LLM_MAX_CONCURRENCY, LLM_RETRIES; LLM_MOCK_LATENCY_MS / LLM_MOCK_JITTER_MS / LLM_MOCK_FAILURE_RATE.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    kind = os.getenv("LLM_BACKEND", "gemini" if api_key else "").lower()
+
+    if kind == "mock":
+        backend = MockBackend(
+            latency=float(os.getenv("LLM_MOCK_LATENCY_MS", "300")) / 1000,
+            jitter=float(os.getenv("LLM_MOCK_JITTER_MS", "0")) / 1000,
+            failure_rate=float(os.getenv("LLM_MOCK_FAILURE_RATE", "0")),
+        )
+    elif kind == "gemini" and api_key:
+        max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+        backend = GeminiBackend(api_key, os.getenv("GEMINI_MODEL", "gemini-2.5-flash"), max_connections=max_concurrency)
+    else:
+        return None
+
+    return LLMClient(
+        backend,
+        timeout=float(os.getenv("LLM_TIMEOUT", "20")),
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+        retries=int(os.getenv("LLM_RETRIES", "1")),
+    )
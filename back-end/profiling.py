@@ -0,0 +1,160 @@
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from starlette.concurrency import run_in_threadpool
+from metrics import HTTP_IN_FLIGHT
+
+# Opt-in request profiling: PROFILING_ENABLED=1 plus a PROFILE_TOKEN secret installs the
+# middleware, and a request carrying "X-Profile: <token>" is sampled into a folded-stack file
+# (flamegraph.pl / speedscope). Profiles show other requests' routes and query strings, so the
+# header and /api/debug/profiles need the token. When disabled nothing is installed, so normal
+# requests pay nothing.
+
+PROFILE_HEADER = b"x-profile"
+IDLE_LEAVES = {"wait", "select", "poll", "_wait_for_tstate_lock"}
+
+
+def profiling_enabled() -> bool:
+    if os.getenv("PROFILING_ENABLED", "").lower() not in ("1", "true", "yes"):
+        return False
+    if not os.getenv("PROFILE_TOKEN"):
+        print("WARNING: PROFILING_ENABLED is set but PROFILE_TOKEN is not; profiling stays off.")
+        return False
+    return True
+
+
+def profile_authorized(value) -> bool:
+    """Whether an X-Profile header value (str or bytes) carries PROFILE_TOKEN."""
+    token = os.getenv("PROFILE_TOKEN")
+    if not token or value is None:
+        return False
+    if isinstance(value, str):
+        value = value.encode("latin-1")
+    return hmac.compare_digest(value.strip(), token.encode())
+
+
+class StackSampler:
+    """Samples the Python stacks of all busy threads every `interval` seconds on a background thread."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for tid, frame in sys._current_frames().items():
+                if tid == me or frame.f_code.co_name in IDLE_LEAVES:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_qualname} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that samples requests sent with the X-Profile header and writes
+    <profile_dir>/<time>-<route>.folded plus index.json listing the most recent captures.
+    Stacks of other requests running at the same time are included too; `in_flight` in the
+    index shows how many there were.
+    """
+
+    def __init__(self, app, profile_dir: str = None, interval_ms: float = None, keep: int = None):
+        self.app = app
+        self.profile_dir = Path(profile_dir or os.getenv("PROFILE_DIR", "profiles"))
+        self.interval = (interval_ms or float(os.getenv("PROFILE_INTERVAL_MS", "5"))) / 1000
+        self.keep = keep or int(os.getenv("PROFILE_KEEP", "20"))
+        self._index_lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 1_000_000:06d}-{_slug(scope['path'])}.folded"
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", name.encode())]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.value()
+        sampler = StackSampler(self.interval)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            # Joining the sampler and writing the files block, so they run off the event loop
+            await run_in_threadpool(self._finish, name, scope, status["code"], elapsed, sampler, in_flight)
+
+    def _finish(self, name: str, scope, status: int, elapsed: float, sampler: StackSampler, in_flight: int):
+        sampler.stop()
+        self._save(name, scope, status, elapsed, sampler, in_flight)
+
+    def _save(self, name: str, scope, status: int, elapsed: float, sampler: StackSampler, in_flight: int):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        (self.profile_dir / name).write_text(sampler.folded())
+
+        entry = {
+            "file": name,
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode(),
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 1),
+            "samples": sampler.samples,
+            "interval_ms": self.interval * 1000,
+            "in_flight": in_flight,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with self._index_lock:
+            index = read_index(self.profile_dir)
+            index.insert(0, entry)
+            for old in index[self.keep:]:
+                (self.profile_dir / old["file"]).unlink(missing_ok=True)
+            (self.profile_dir / "index.json").write_text(json.dumps(index[: self.keep], indent=2))
+
+
+def read_index(profile_dir: Path) -> list:
+    try:
+        return json.loads((profile_dir / "index.json").read_text())
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def _wants_profile(scope) -> bool:
+    for key, value in scope.get("headers", ()):
+        if key == PROFILE_HEADER:
+            return profile_authorized(value)
+    return False
+
+
+def _slug(path: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9]+", "-", path).strip("-")[:60] or "root"
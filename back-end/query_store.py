@@ -0,0 +1,182 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import numpy as np
+from fastapi import HTTPException
+from data_store import Dataset, METRICS
+from metrics import DATA_LOAD
+from shared_store import load_snapshot, shared_dir
+from tracing import traced
+
+# SQLite copy of the cleaned long table, for the endpoints that read it row-wise and for ad-hoc
+# filter/aggregate queries (/api/query). One file per data version, written by the first worker
+# into the shared cache and opened read-only by all of them (an in-memory database when the
+# shared cache is off).
+#
+# Column names, aggregates and orderings only ever come from the whitelists below; every value
+# a client sends is a bound parameter. Statements are constant strings per query shape, so
+# sqlite3's per-connection statement cache prepares each one once.
+
+QUERY_METRICS = METRICS + ("ratio",)
+AGGREGATES = {"avg": "AVG", "min": "MIN", "max": "MAX", "sum": "SUM", "count": "COUNT"}
+GROUP_BY = {"area": "area", "year": "year"}
+ORDER = {"asc": "ASC", "desc": "DESC"}
+MAX_ROWS = 1000
+SCHEMA_VERSION = 1  # bump when SCHEMA changes
+
+SCHEMA = (
+    "CREATE TABLE observations ("
+    "area TEXT NOT NULL, year INTEGER NOT NULL, house_price REAL, annual_income REAL, ratio REAL, "
+    "PRIMARY KEY (area, year)) WITHOUT ROWID",
+    "CREATE INDEX observations_year_area ON observations (year, area)",
+)
+
+QUERIES = {
+    "series": "SELECT year, house_price, annual_income FROM observations WHERE area = ? ORDER BY year",
+}
+
+
+def write_db(conn: sqlite3.Connection, data: Dataset):
+    df = data.df
+    price = df["house_price"].to_numpy(dtype=float)
+    income = df["annual_income"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(income > 0, price / income, np.nan)
+    rows = zip(df["Area"].astype(str), df["year"].astype(int).tolist(), price.tolist(), income.tolist(), ratio.tolist())
+    for stmt in SCHEMA:
+        conn.execute(stmt)
+    # NaN -> NULL so aggregates skip missing values
+    conn.executemany(
+        "INSERT INTO observations VALUES (?, ?, ?, ?, ?)",
+        ([a, y, *(None if v != v else v for v in vals)] for a, y, *vals in rows),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+
+
+def _write_file(path: Path, data: Dataset):
+    conn = sqlite3.connect(path)
+    try:
+        write_db(conn, data)
+    finally:
+        conn.close()
+
+
+class QueryStore:
+    """Read-only connections (one per thread) to the database at `uri`."""
+
+    def __init__(self, uri: str, keepalive: sqlite3.Connection = None):
+        self.uri = uri
+        self._keepalive = keepalive  # holds an in-memory database open
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.uri, uri=True, cached_statements=256)
+        return conn
+
+    @traced("sql")
+    def execute(self, sql: str, params=()) -> list:
+        return self._conn().execute(sql, params).fetchall()
+
+    # Prepared queries behind the existing endpoints
+
+    def series(self, area: str) -> dict:
+        rows = self.execute(QUERIES["series"], (area,))
+        years, price, income = zip(*rows) if rows else ((), (), ())
+        return {"years": list(years), "house_price": np.array(price, dtype=float), "annual_income": np.array(income, dtype=float)}
+
+    # Ad-hoc queries (/api/query)
+
+    def filter(self, metric: str, agg: str = None, group_by: str = None, areas=None, from_year: int = None,
+               to_year: int = None, min_value: float = None, max_value: float = None, order: str = "asc",
+               limit: int = 100) -> tuple:
+        """
+        Rows (area, year, value) of `metric` matching the filters, or `agg` of them - overall or per
+        area/year. Value filters apply to the rows before aggregation. Returns (columns, rows, sql).
+        """
+        column = _pick(QUERY_METRICS, metric, "metric")
+        where, params = [f"{column} IS NOT NULL"], []
+        if areas:
+            where.append(f"area IN ({', '.join('?' * len(areas))})")
+            params.extend(areas)
+        for clause, value in (("year >= ?", from_year), ("year <= ?", to_year),
+                              (f"{column} >= ?", min_value), (f"{column} <= ?", max_value)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+
+        direction = ORDER[_pick(ORDER, order, "order")]
+        if agg is None:
+            if group_by is not None:
+                raise HTTPException(status_code=400, detail="group_by needs agg")
+            columns = ["area", "year", metric]
+            select, tail = f"area, year, {column}", [f"ORDER BY {column} {direction}, area, year"]
+        else:
+            func = AGGREGATES[_pick(AGGREGATES, agg, "agg")]
+            value = f"{func}({column})"
+            if group_by is None:
+                columns, select, tail = [f"{agg}_{metric}", "rows"], f"{value}, COUNT(*)", []
+            else:
+                key = GROUP_BY[_pick(GROUP_BY, group_by, "group_by")]
+                columns = [group_by, f"{agg}_{metric}", "rows"]
+                select, tail = f"{key}, {value}, COUNT(*)", [f"GROUP BY {key} ORDER BY 2 {direction}, 1"]
+
+        sql = " ".join([f"SELECT {select} FROM observations WHERE {' AND '.join(where)}", *tail, "LIMIT ?"])
+        return columns, self.execute(sql, params + [min(limit, MAX_ROWS)]), sql
+
+    def change(self, metric: str, from_year: int, to_year: int, min_change_pct: float = None,
+               max_change_pct: float = None, order: str = "desc", limit: int = 100) -> tuple:
+        """Per area: `metric` in both years and its change, optionally filtered by % change."""
+        column = _pick(QUERY_METRICS, metric, "metric")
+        direction = ORDER[_pick(ORDER, order, "order")]
+        where, params = [], [to_year, from_year]
+        for clause, value in (("change_pct >= ?", min_change_pct), ("change_pct <= ?", max_change_pct)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        sql = (
+            f"SELECT * FROM (SELECT a.area, a.{column} AS from_value, b.{column} AS to_value, "
+            f"b.{column} - a.{column} AS change, (b.{column} / a.{column} - 1) * 100 AS change_pct "
+            "FROM observations a JOIN observations b ON b.area = a.area AND b.year = ? "
+            f"WHERE a.year = ? AND a.{column} IS NOT NULL AND b.{column} IS NOT NULL AND a.{column} != 0)"
+            + (f" WHERE {' AND '.join(where)}" if where else "")
+            + f" ORDER BY change_pct {direction}, area LIMIT ?"
+        )
+        columns = ["area", "from_value", "to_value", "change", "change_pct"]
+        return columns, self.execute(sql, params + [min(limit, MAX_ROWS)]), sql
+
+
+def _pick(allowed, value: str, name: str) -> str:
+    if value not in allowed:
+        raise HTTPException(status_code=400, detail=f"{name} must be one of {', '.join(allowed)}")
+    return value
+
+
+_memory_stores = {}
+_memory_lock = threading.Lock()
+
+
+def load_query_store(data: Dataset) -> QueryStore:
+    """The SQLite copy of `data`: a shared snapshot file, or a per-process in-memory database."""
+    start = time.perf_counter()
+    version = f"{data.version}-v{SCHEMA_VERSION}"
+    if shared_dir() is None:
+        with _memory_lock:
+            store = _memory_stores.get(version)
+            if store is None:
+                uri = f"file:query-{version}?mode=memory&cache=shared"
+                conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                write_db(conn, data)
+                store = _memory_stores[version] = QueryStore(uri, keepalive=conn)
+    else:
+        store = load_snapshot(
+            "query", version,
+            build=lambda: data,
+            write=lambda folder, built: _write_file(folder / "dataset.sqlite", built),
+            read=lambda folder: QueryStore(f"{(folder / 'dataset.sqlite').resolve().as_uri()}?mode=ro"),
+        )
+    DATA_LOAD.set(time.perf_counter() - start, stage="query_store")
+    return store
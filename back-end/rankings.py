@@ -0,0 +1,94 @@
+import threading
+import numpy as np
+from data_store import Dataset, json_matrix
+
+# Cross-borough affordability rankings from the dense year x borough matrices
+
+
+class RankingTable:
+    """
+    Price-to-income ratio per (year, borough) with everything derived from it precomputed:
+    rank 1 = most affordable (lowest ratio) within the year, percentile = share of boroughs
+    with a ratio at or below this one, and year-over-year change. NaN where there is no data.
+    """
+
+    def __init__(self, data: Dataset):
+        self.version = data.version
+        self.years = data.years
+        self.boroughs = data.boroughs
+        self._year_row = {int(y): i for i, y in enumerate(self.years)}
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.ratio = data.matrices["house_price"].astype(float) / data.matrices["annual_income"]
+        self.ratio[~np.isfinite(self.ratio)] = np.nan
+
+        valid = ~np.isnan(self.ratio)
+        n_valid = valid.sum(axis=1, keepdims=True)
+
+        # Ascending order per year, NaNs sorted last
+        self.order = np.argsort(np.where(valid, self.ratio, np.inf), axis=1, kind="stable")
+        ranks = np.empty_like(self.order)
+        np.put_along_axis(ranks, self.order, np.arange(1, len(self.boroughs) + 1)[None, :], axis=1)
+        self.rank = np.where(valid, ranks, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.percentile = np.where(valid, self.rank / n_valid * 100, np.nan)
+
+        self.yoy_delta = np.full_like(self.ratio, np.nan)
+        self.yoy_delta[1:] = self.ratio[1:] - self.ratio[:-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.yoy_pct = np.full_like(self.ratio, np.nan)
+            self.yoy_pct[1:] = self.yoy_delta[1:] / self.ratio[:-1] * 100
+        self.n_valid = n_valid[:, 0]
+        self._payload = None
+
+    def matrices(self) -> dict:
+        """All matrices as JSON-ready lists (serialized once, then reused)."""
+        if self._payload is None:
+            self._payload = {
+                "years": self.years.tolist(),
+                "boroughs": self.boroughs,
+                "ratio": json_matrix(self.ratio, 2),
+                "rank": json_matrix(self.rank),
+                "percentile": json_matrix(self.percentile, 1),
+                "yoy_delta": json_matrix(self.yoy_delta, 2),
+                "yoy_pct": json_matrix(self.yoy_pct, 1),
+            }
+        return self._payload
+
+    def row(self, year: int):
+        """Row index of `year`, or None if the year is not in the data."""
+        return self._year_row.get(int(year))
+
+    def top_bottom(self, year: int, n: int) -> tuple:
+        """(most affordable n, least affordable n) as lists of row dicts for one year."""
+        i = self._year_row[int(year)]
+        ranked = self.order[i, : self.n_valid[i]]
+        return [self._entry(i, j) for j in ranked[:n]], [self._entry(i, j) for j in ranked[::-1][:n]]
+
+    def _entry(self, i: int, j: int) -> dict:
+        def num(x, decimals):
+            return None if np.isnan(x) else round(float(x), decimals)
+
+        return {
+            "borough": self.boroughs[j],
+            "ratio": num(self.ratio[i, j], 2),
+            "rank": int(self.rank[i, j]),
+            "percentile": num(self.percentile[i, j], 1),
+            "yoy_delta": num(self.yoy_delta[i, j], 2),
+            "yoy_pct": num(self.yoy_pct[i, j], 1),
+        }
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_ranking_table(data: Dataset) -> RankingTable:
+    """Build the ranking table once per data version."""
+    with _tables_lock:
+        table = _tables.get(data.version)
+        if table is None:
+            table = RankingTable(data)
+            _tables.clear()
+            _tables[data.version] = table
+        return table
@@ -0,0 +1,147 @@
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, Request
+from metrics import RATE_LIMITED
+
+# Per-client token buckets for the expensive routes (in-process, so per worker)
+#
+# Each (client, route) pair has a bucket holding up to `burst` tokens that refills at `rate`
+# tokens a second. A request needs `cost` tokens to be admitted, else it gets a 429 with
+# Retry-After. If it then did expensive work - a forecast fit or an LLM call instead of a cache
+# hit, see `note_expensive` - `miss_cost` more is charged after the fact. That can take the bucket
+# below zero, so the client waits longer before its next request.
+
+DEFAULT_LIMITS = {
+    "/api/forecast": {"rate": 0.5, "burst": 20, "cost": 1, "miss_cost": 4},
+    "/api/overview-forecast": {"rate": 0.5, "burst": 20, "cost": 1, "miss_cost": 10},
+    "/api/affordability": {"rate": 0.5, "burst": 20, "cost": 1, "miss_cost": 10},  # source=forecast fits every borough
+    "/api/scenarios": {"rate": 0.5, "burst": 20, "cost": 1, "miss_cost": 4},
+    "/api/chat": {"rate": 0.2, "burst": 10, "cost": 1, "miss_cost": 2},
+}
+MAX_CLIENTS = 10_000  # buckets kept (least recently used dropped first)
+
+_expensive = contextvars.ContextVar("rate_limit_expensive", default=None)
+
+
+def load_limits() -> dict:
+    """
+    DEFAULT_LIMITS with the RATE_LIMITS env var (JSON) merged in per route, e.g.
+    '{"/api/forecast": {"rate": 1}, "/api/compare": {"rate": 0.2, "burst": 5}, "/api/chat": null}'
+    (null removes a route's limit). RATE_LIMIT_ENABLED=0 turns limiting off.
+    """
+    if os.getenv("RATE_LIMIT_ENABLED", "1") == "0":
+        return {}
+    limits = {route: dict(cfg) for route, cfg in DEFAULT_LIMITS.items()}
+    for route, cfg in json.loads(os.getenv("RATE_LIMITS") or "{}").items():
+        if cfg is None:
+            limits.pop(route, None)
+        else:
+            limits[route] = {"rate": 1.0, "burst": 10, "cost": 1, "miss_cost": 0, **limits.get(route, {}), **cfg}
+    return limits
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost: float, now: float) -> float:
+        """Take `cost` tokens and return 0, or return the seconds until they are available."""
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def charge(self, cost: float, now: float):
+        self._refill(now)
+        self.tokens -= cost
+
+
+class RateLimiter:
+    def __init__(self, limits: dict, max_clients: int = MAX_CLIENTS):
+        self.limits = limits
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, client: str, route: str, now: float) -> TokenBucket:
+        key = (client, route)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            cfg = self.limits[route]
+            bucket = self._buckets[key] = TokenBucket(cfg["rate"], cfg["burst"], now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def admit(self, client: str, route: str) -> float:
+        """0 if the request may go ahead (its cost is taken), else the seconds to wait."""
+        now = time.monotonic()
+        with self._lock:
+            return self._bucket(client, route, now).take(self.limits[route]["cost"], now)
+
+    def charge(self, client: str, route: str, cost: float):
+        now = time.monotonic()
+        with self._lock:
+            self._bucket(client, route, now).charge(cost, now)
+
+
+limiter = RateLimiter(load_limits())
+
+
+def client_id(request: Request) -> str:
+    """The client's address; the first X-Forwarded-For hop when RATE_LIMIT_TRUST_PROXY=1."""
+    if os.getenv("RATE_LIMIT_TRUST_PROXY") == "1":
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def note_expensive():
+    """Mark the current request as having done expensive work (billed as its route's miss_cost)."""
+    work = _expensive.get()
+    if work is not None:
+        work.append(1)
+
+
+async def rate_limit(request: Request):
+    """App-wide dependency: admits or rejects requests to the limited routes (a no-op for others)."""
+    route = getattr(request.scope.get("route"), "path", None)
+    if route not in limiter.limits:
+        yield
+        return
+
+    client = client_id(request)
+    wait = limiter.admit(client, route)
+    if wait > 0:
+        RATE_LIMITED.inc(route=route)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please retry later",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+    # Set here, in the request's task, so the endpoint's worker thread sees the same list
+    work = []
+    _expensive.set(work)
+    try:
+        yield
+    finally:
+        miss_cost = limiter.limits[route].get("miss_cost", 0)
+        if work and miss_cost:
+            limiter.charge(client, route, miss_cost)
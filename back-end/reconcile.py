@@ -0,0 +1,149 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from data_store import Dataset
+from forecast_model import forecast_series, borough_forecast, joint_forecasts, DEFAULT_ENGINE, Z80
+
+# London forecast built from the borough forecasts (hierarchical reconciliation)
+#
+# London is the mean of the boroughs, so with S = [w; I] (w = 1/n per borough) any coherent set
+# of forecasts is S @ b for borough forecasts b. Methods:
+#   bottom_up - London = w @ borough forecasts; no London model is fitted
+#   mint      - MinT: combine the London model with the boroughs, b = (S'W⁻¹S)⁻¹ S'W⁻¹ ŷ, where
+#               W = D R D uses each series' forecast sd (from its 80% band) and the shrunk
+#               correlation R of in-sample residuals
+#   direct    - the London model on its own (previous behaviour, not coherent with the boroughs)
+
+METHODS = ("bottom_up", "mint", "direct")
+DEFAULT_METHOD = os.getenv("OVERVIEW_RECONCILIATION", "bottom_up")
+
+_reconciled = {}
+_reconciled_lock = threading.Lock()
+
+
+def london_mean(data: Dataset) -> pd.DataFrame:
+    """Mean per year across all boroughs (the London series), from the year x borough matrices."""
+    return pd.DataFrame({
+        "year": data.years,
+        **{m: np.nanmean(np.asarray(data.matrices[m], dtype=float), axis=1) for m in ("house_price", "annual_income")},
+    })
+
+
+def borough_forecasts(data: Dataset, metric: str, years_ahead: int, engine: str = None) -> list:
+    """Cached per-borough forecasts, in `data.boroughs` order (fits the ones not cached yet)."""
+    return [borough_forecast(data, b, metric, years_ahead, engine) for b in data.boroughs]
+
+
+def _london_base(data: Dataset, metric: str, years_ahead: int, engine: str) -> pd.DataFrame:
+    """The London series forecast on its own (used by direct and mint)."""
+    if engine == "joint":
+        return joint_forecasts(data, metric, years_ahead)["London"]
+    return forecast_series("London", london_mean(data), metric, years_ahead, data.version)
+
+
+def _stack(forecasts: list, years: np.ndarray) -> tuple:
+    """(series, years) matrices of yhat and sd (from the 80% band), NaN where a series has no year."""
+    yhat = np.full((len(forecasts), len(years)), np.nan)
+    sd = np.full_like(yhat, np.nan)
+    for i, fc in enumerate(forecasts):
+        idx = np.searchsorted(years, fc["year"].to_numpy())
+        yhat[i, idx] = fc["yhat"].to_numpy()
+        sd[i, idx] = (fc["yhat_upper"].to_numpy() - fc["yhat_lower"].to_numpy()) / (2 * Z80)
+    return yhat, np.maximum(sd, 1e-9)
+
+
+def shrunk_correlation(resid: np.ndarray) -> np.ndarray:
+    """
+    Correlation of residuals (observations x series) shrunk towards the identity with the
+    Schäfer-Strimmer intensity, so it stays invertible with more series than observations.
+    """
+    resid = resid[~np.isnan(resid).any(axis=1)]
+    n, k = resid.shape
+    if n < 3:
+        return np.eye(k)
+    std = resid.std(axis=0)
+    z = (resid - resid.mean(axis=0)) / np.where(std > 0, std, 1)
+    w = z[:, :, None] * z[:, None, :]  # (n, k, k)
+    r = w.mean(axis=0) * n / (n - 1)
+    var_r = w.var(axis=0) * n ** 2 / (n - 1) ** 3
+    off = ~np.eye(k, dtype=bool)
+    denom = (r[off] ** 2).sum()
+    lam = 1.0 if denom == 0 else float(np.clip(var_r[off].sum() / denom, 0, 1))
+    out = (1 - lam) * r
+    np.fill_diagonal(out, 1.0)
+    return out
+
+
+def reconcile(yhat: np.ndarray, sd: np.ndarray, corr: np.ndarray, method: str) -> tuple:
+    """
+    Reconcile one period. `yhat`/`sd`/`corr` cover [London, boroughs...] for mint and the boroughs
+    only for bottom_up. Returns (London mean, London sd, reconciled borough means).
+    """
+    if method == "bottom_up":
+        n = len(yhat)
+        w = np.full(n, 1 / n)
+        cov = corr * np.outer(sd, sd)
+        return float(w @ yhat), float(np.sqrt(w @ cov @ w)), yhat
+
+    n = len(yhat) - 1
+    w = np.full(n, 1 / n)
+    S = np.vstack([w, np.eye(n)])
+    W = corr * np.outer(sd, sd)
+    Winv_S = np.linalg.solve(W, S)
+    P = np.linalg.inv(S.T @ Winv_S)  # covariance of the reconciled borough forecasts
+    bottom = P @ (Winv_S.T @ yhat)
+    return float(w @ bottom), float(np.sqrt(max(w @ P @ w, 0))), bottom
+
+
+def _frame(years: np.ndarray, mean: np.ndarray, sd: np.ndarray) -> pd.DataFrame:
+    fc = pd.DataFrame({"year": years, "yhat": mean})
+    fc["ds"] = pd.to_datetime(fc["year"].astype(str) + "-01-01")
+    fc["yhat_lower"] = np.maximum(mean - Z80 * sd, 0)
+    fc["yhat_upper"] = mean + Z80 * sd
+    return fc[["ds", "year", "yhat", "yhat_lower", "yhat_upper"]]
+
+
+def london_forecast(data: Dataset, metric: str, years_ahead: int, method: str = None, engine: str = None) -> pd.DataFrame:
+    """
+    London forecast of `metric` (ds, year, yhat, yhat_lower, yhat_upper; history years included, like
+    `forecast_series`), reconciled from the cached borough forecasts of `engine`. Cached per data version.
+    """
+    method = method or DEFAULT_METHOD
+    engine = engine or DEFAULT_ENGINE
+    if method not in METHODS:
+        raise ValueError(f"unknown reconciliation method {method!r}")
+    key = (metric, years_ahead, method, engine, data.version)
+    with _reconciled_lock:
+        if key in _reconciled:
+            return _reconciled[key]
+
+    if method == "direct":
+        fc = _london_base(data, metric, years_ahead, engine)
+    else:
+        forecasts = borough_forecasts(data, metric, years_ahead, engine)
+        actual = data.matrices[metric]  # (years, boroughs)
+        if method == "mint":
+            forecasts = [_london_base(data, metric, years_ahead, engine)] + forecasts
+            actual = np.column_stack([np.nanmean(actual, axis=1), actual])
+
+        years = np.unique(np.concatenate([fc["year"].to_numpy() for fc in forecasts]))
+        yhat, sd = _stack(forecasts, years)
+
+        # In-sample residuals (actual - fitted) over the history years
+        hist = np.searchsorted(years, data.years)
+        corr = shrunk_correlation(actual - yhat[:, hist].T)
+
+        mean = np.empty(len(years))
+        spread = np.empty(len(years))
+        for t in range(len(years)):
+            ok = ~np.isnan(yhat[:, t])
+            step = "bottom_up" if method == "mint" and not ok[0] else method  # no London value that year
+            mean[t], spread[t], _ = reconcile(yhat[ok, t], sd[ok, t], corr[np.ix_(ok, ok)], step)
+        fc = _frame(years, mean, spread)
+
+    with _reconciled_lock:
+        _reconciled[key] = fc
+        if len(_reconciled) > 64:
+            _reconciled.pop(next(iter(_reconciled)))
+    return fc
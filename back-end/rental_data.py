@@ -0,0 +1,145 @@
+import json
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from data_store import BASE_DIR, Dataset, file_version, normalize_area
+from metrics import DATA_LOAD
+from shared_store import load_snapshot
+
+# Borough rents, aligned with the main dataset's boroughs
+
+RENTAL_FILE = BASE_DIR / "data" / "rental_price_per_borough.xlsx"
+
+RENT_COLUMNS = {
+    "Area code": "area_code",
+    "Area name": "borough",
+    "Rental price one bed": "rent_1bed",
+    "Rental price two bed": "rent_2bed",
+    "Rental price three bed": "rent_3bed",
+    "Rental price four or more bed": "rent_4plus_bed",
+    "Rental price": "rent_avg",
+}
+BEDROOMS = ("1", "2", "3", "4+")
+BEDROOM_COLUMNS = ("rent_1bed", "rent_2bed", "rent_3bed", "rent_4plus_bed")
+BEDROOM_LABELS = ("1 bed", "2 bed", "3 bed", "4+ bed")
+
+
+class RentTable:
+    """
+    Monthly rents indexed by the main dataset's borough names (same order as `Dataset.boroughs`).
+    `rents` is a (boroughs x bedrooms) float32 matrix and `avg` the overall rent, NaN where missing.
+    """
+
+    def __init__(self, rent_df: pd.DataFrame, data: Dataset, source: str = ""):
+        self.source = source
+        self.boroughs = data.boroughs
+        by_norm = {normalize_area(b): b for b in self.boroughs}
+
+        rent_df = rent_df.copy()
+        rent_df["borough"] = rent_df["borough"].map(lambda name: by_norm.get(normalize_area(name)))
+        self.unmatched = int(rent_df["borough"].isna().sum())
+        rent_df = rent_df.dropna(subset=["borough"]).drop_duplicates("borough").set_index("borough")
+        self.frame = rent_df.reindex(self.boroughs)
+        self.frame.index = pd.CategoricalIndex(self.frame.index, categories=self.boroughs, name="borough")
+
+        self.rents = np.ascontiguousarray(self.frame[list(BEDROOM_COLUMNS)].to_numpy(dtype=np.float32))
+        self.avg = self.frame["rent_avg"].to_numpy(dtype=np.float32)
+        self.available = ~np.isnan(self.avg)
+
+    def rows(self, boroughs=None) -> list:
+        """JSON rows for the given boroughs (default all boroughs with rent data)."""
+        cols = [self.boroughs.index(b) for b in boroughs] if boroughs else np.flatnonzero(self.available)
+        out = []
+        for j in cols:
+            row = {"borough": self.boroughs[j], "area_code": self.frame["area_code"].iloc[j]}
+            for bed, value in zip(BEDROOMS, self.rents[j]):
+                row[bed] = None if np.isnan(value) else int(value)
+            row["average"] = None if np.isnan(self.avg[j]) else int(self.avg[j])
+            out.append(row)
+        return out
+
+    def entries(self) -> dict:
+        """{borough: (compact text line, average rent)} for the chatbot context."""
+        out = {}
+        for j in np.flatnonzero(self.available):
+            prices = [f"{label} £{int(v):,}" for label, v in zip(BEDROOM_LABELS, self.rents[j]) if not np.isnan(v)]
+            prices.append(f"avg £{int(self.avg[j]):,}")
+            out[self.boroughs[j]] = (f"{self.boroughs[j]}: " + ", ".join(prices), float(self.avg[j]))
+        return out
+
+
+def rent_vs_buy(rents: np.ndarray, avg_rent: np.ndarray, house_price: np.ndarray, monthly_income: np.ndarray,
+                deposit: float = 0.1, term_years: int = 25, annual_rate: float = 0.045) -> dict:
+    """
+    Compare renting with a repayment mortgage for every (borough, bedroom) cell at once.
+
+    There are no prices per bedroom count, so the house price for a bedroom count is the borough's
+    average price scaled by that bedroom count's rent relative to the average rent.
+    `house_price` and `monthly_income` are per borough (1-D); the result matrices are (boroughs x bedrooms).
+    """
+    house_price = np.asarray(house_price, dtype=float)  # float32 in the dataset matrices
+    monthly_income = np.asarray(monthly_income, dtype=float)
+    r = annual_rate / 12
+    n = term_years * 12
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price = house_price[:, None] * rents / avg_rent[:, None]
+        payment = price * (1 - deposit) * r / (1 - (1 + r) ** -n)
+        income = monthly_income[:, None]
+        rent_burden = rents / income
+        mortgage_burden = payment / income
+    return {
+        "house_price": price,
+        "mortgage_payment": payment,
+        "deposit": price * deposit,
+        "rent_burden": rent_burden,
+        "mortgage_burden": mortgage_burden,
+        "buy_minus_rent": payment - rents,
+    }
+
+
+def read_rents(path: Path = RENTAL_FILE):
+    """Parse the rental workbook into the RENT_COLUMNS frame; None if 'Area name' is missing."""
+    rent_df = pd.read_excel(path, header=0)
+    rent_df.columns = rent_df.columns.str.strip()
+    if "Area name" not in rent_df.columns:
+        print(f"WARNING: 'Area name' column missing in {path.name}; columns: {list(rent_df.columns)}")
+        return None
+
+    rent_df = rent_df[[c for c in RENT_COLUMNS if c in rent_df.columns]].rename(columns=RENT_COLUMNS)
+    for col in RENT_COLUMNS.values():
+        if col == "borough":
+            continue
+        if col not in rent_df.columns:
+            rent_df[col] = np.nan if col != "area_code" else None
+        elif col != "area_code":
+            rent_df[col] = pd.to_numeric(rent_df[col], errors="coerce")
+    return rent_df.dropna(subset=["borough"])
+
+
+def _write_rents(folder: Path, rent_df):
+    payload = None if rent_df is None else rent_df.to_dict(orient="list")
+    (folder / "rents.json").write_text(json.dumps(payload))
+
+
+def _read_rents(folder: Path):
+    payload = json.loads((folder / "rents.json").read_text())
+    return None if payload is None else pd.DataFrame(payload)
+
+
+def load_rents(data: Dataset, path: Path = RENTAL_FILE):
+    """Read the rental workbook once (shared across workers); None if the file or its 'Area name' column is missing."""
+    if not path.exists():
+        print(f"WARNING: rental data not found at {path}")
+        return None
+
+    start = time.perf_counter()
+    rent_df = load_snapshot("rents", file_version(path), lambda: read_rents(path), _write_rents, _read_rents)
+    if rent_df is None:
+        return None
+
+    table = RentTable(rent_df, data, source=path.name)
+    DATA_LOAD.set(time.perf_counter() - start, stage="rents")
+    if table.unmatched:
+        print(f"WARNING: {table.unmatched} rental rows did not match a borough in the dataset")
+    return table
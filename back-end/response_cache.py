@@ -0,0 +1,136 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Bounded TTL cache for chatbot replies, keyed on a normalized message + context version
+
+NUMBER_RE = re.compile(r"(\d+(?:\.\d+)?)\s*([km])\b")
+FILLER_WORDS = {"please", "pls", "thanks", "thank", "you", "hi", "hello", "hey", "a", "an", "the"}
+
+
+def normalize_message(message: str) -> str:
+    """Canonical form of a chat message: lowercase, no punctuation, '50k'/'£50,000' -> '50000'."""
+    s = message.lower().replace("£", " ")
+    s = re.sub(r"(?<=\d),(?=\d{3}\b)", "", s)
+    s = NUMBER_RE.sub(lambda m: str(int(float(m.group(1)) * (1_000 if m.group(2) == "k" else 1_000_000))), s)
+    s = re.sub(r"[^a-z0-9.\s]", " ", s)
+    s = re.sub(r"(?<!\d)\.|\.(?!\d)", " ", s)
+    words = [w for w in s.split() if w not in FILLER_WORDS]
+    return " ".join(words)
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of chatbot replies.
+
+    Entries are keyed on (context version, signature, normalized message). The signature holds
+    the facts a reply depends on (boroughs, numbers) so similarity matching never crosses them.
+    With `similarity` set (0-1), a miss falls back to the closest entry by word overlap.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0, similarity: float = None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (response, expires_at, words)
+        self._buckets = {}  # (version, signature) -> set of keys, for similarity scans
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _key(self, message: str, version: str, signature: tuple) -> tuple:
+        norm = normalize_message(message)
+        numbers = tuple(sorted(set(re.findall(r"\d+(?:\.\d+)?", norm))))
+        return (version, tuple(signature) + numbers, norm)
+
+    def get(self, message: str, version: str, signature: tuple = ()):
+        """Return a cached reply or None."""
+        key = self._key(message, version, signature)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            if self.similarity is not None:
+                match = self._closest(key, now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.similar_hits += 1
+                    return self._entries[match][0]
+
+            self.misses += 1
+            return None
+
+    def put(self, message: str, version: str, response: str, signature: tuple = ()):
+        key = self._key(message, version, signature)
+        words = frozenset(key[2].split())
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (response, self._clock() + self.ttl, words)
+            self._buckets.setdefault(key[:2], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "similarity": self.similarity,
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round((self.hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+    def _closest(self, key: tuple, now: float):
+        words = frozenset(key[2].split())
+        best, best_score = None, self.similarity
+        for other in list(self._buckets.get(key[:2], ())):
+            _, expires_at, other_words = self._entries[other]
+            if expires_at <= now:
+                self._drop(other)
+                self.expirations += 1
+                continue
+            score = _jaccard(words, other_words)
+            if score >= best_score:
+                best, best_score = other, score
+        return best
+
+    def _drop(self, key: tuple):
+        self._entries.pop(key, None)
+        bucket = self._buckets.get(key[:2])
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[key[:2]]
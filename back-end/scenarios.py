@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from affordability import months_to_buy
+from forecast_model import Z80
+from rate_limit import note_expensive
+
+# Monte Carlo affordability scenarios drawn around the Prophet forecasts
+
+BATCH_PATHS = 500
+SCENARIO_CACHE_SIZE = 64
+
+_results = OrderedDict()
+_results_lock = threading.Lock()
+
+
+def log_params(forecasts: list, last_year: int, horizon: int) -> tuple:
+    """
+    Stack per-borough forecasts into (boroughs, horizon) arrays of log-scale mean and sd.
+    Prophet is fit on log values, so the 80% band maps back to a normal sd in log space.
+    """
+    mu = np.empty((len(forecasts), horizon))
+    sd = np.empty((len(forecasts), horizon))
+    for j, fc in enumerate(forecasts):
+        fut = fc[fc["year"] > last_year].iloc[:horizon]
+        mu[j] = np.log(fut["yhat"].to_numpy())
+        sd[j] = (np.log(fut["yhat_upper"].to_numpy()) - np.log(fut["yhat_lower"].to_numpy())) / (2 * Z80)
+    return mu, np.maximum(sd, 0.0)
+
+
+def simulate(mu_price, sd_price, mu_income, sd_income, last_income, *, paths: int = 2000, seed: int = 42,
+             annual_rate: float = 0.045, rate_sd: float = 0.0, income_growth: float = 0.0, rho: float = 0.5,
+             salary: float = None, max_years: int = 25, budget_ms: float = 500.0) -> dict:
+    """
+    Draw joint price/income paths per borough and return the share of paths where buying is affordable
+    (repayable within `max_years` at 30% of monthly income) in each year, and by each year.
+
+    Paths are random walks in log space scaled so each year keeps its forecast sd; income shocks are
+    correlated with price shocks by `rho`. Each path draws one interest rate ~ N(annual_rate, rate_sd).
+    `income_growth` adds extra yearly growth on top of the income forecast. With `salary`, the buyer
+    earns that salary today and it grows in line with the borough's simulated income; otherwise the
+    buyer earns the borough's income. Work is done in batches of seeded draws and stops early once
+    `budget_ms` is spent, so the number of paths actually used is reported.
+    """
+    n_boroughs, horizon = mu_price.shape
+    t = np.arange(1, horizon + 1)
+    growth = (1 + income_growth) ** t
+    mix = np.sqrt(max(0.0, 1 - rho ** 2))
+
+    hits = np.zeros((n_boroughs, horizon))
+    hits_by = np.zeros((n_boroughs, horizon))
+    done = 0
+    batch = 0
+    start = time.perf_counter()
+    while done < paths:
+        n = min(BATCH_PATHS, paths - done)
+        rng = np.random.default_rng([seed, batch])
+
+        shocks = rng.standard_normal((2, n, n_boroughs, horizon))
+        walk = np.cumsum(shocks, axis=3) / np.sqrt(t)  # each year still ~ N(0, 1)
+        z_price = walk[0]
+        z_income = rho * z_price + mix * walk[1]
+
+        price = np.exp(mu_price + sd_price * z_price)
+        income = np.exp(mu_income + sd_income * z_income) * growth
+        if salary:
+            income = salary * income / last_income[:, None]
+
+        rate = np.clip(annual_rate + rate_sd * rng.standard_normal((n, 1, 1)), 0.001, None) / 12
+        ok = months_to_buy(price, income / 12, monthly_rate=rate) <= max_years * 12
+
+        hits += ok.sum(axis=0)
+        hits_by += np.logical_or.accumulate(ok, axis=2).sum(axis=0)
+        done += n
+        batch += 1
+        if (time.perf_counter() - start) * 1000 > budget_ms:
+            break
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return {
+        "p_affordable": hits / done,
+        "p_affordable_by": hits_by / done,
+        "paths": done,
+        "elapsed_ms": elapsed_ms,
+        "within_budget": done >= paths,
+    }
+
+
+def cached_simulation(key: tuple, run) -> dict:
+    """Memoize `run()` under `key`; with a fixed seed the same inputs give the same curves."""
+    with _results_lock:
+        hit = _results.get(key)
+        if hit is not None:
+            _results.move_to_end(key)
+            return hit
+
+    note_expensive()
+    result = run()
+    # Runs cut short by the budget depend on machine load, so only full runs are reused
+    if result["within_budget"]:
+        with _results_lock:
+            _results[key] = result
+            while len(_results) > SCENARIO_CACHE_SIZE:
+                _results.popitem(last=False)
+    return result
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from tracing import traced
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, fine for a single dev worker
+    fcntl = None
+
+# Store shared by all uvicorn workers on one machine: parsed data snapshots (.npy files the
+# workers memory-map) and a SQLite table of forecast results, so N workers parse the Excel
+# files once and fit each forecast once. SHARED_CACHE_DIR="" turns it off.
+
+SHARED_DIR = os.getenv("SHARED_CACHE_DIR", str(Path(__file__).resolve().parent / "cache"))
+
+
+def shared_dir():
+    return Path(SHARED_DIR) if SHARED_DIR else None
+
+
+@contextmanager
+def file_lock(path: Path):
+    """Exclusive lock across processes (and threads, each open() gets its own lock)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_snapshot(name: str, version: str, build, write, read):
+    """
+    Return `read(dir)` for the snapshot <name>-<version>. The first worker to get here runs
+    `build()` and `write(tmp_dir, obj)` under a lock and renames the folder into place;
+    the others wait for the lock and then read what it wrote. Older versions are removed.
+    """
+    root = shared_dir()
+    if root is None:
+        return build()
+
+    target = root / f"{name}-{version}"
+    if target.exists():
+        return read(target)
+
+    with file_lock(root / f"{name}.lock"):
+        if not target.exists():
+            start = time.perf_counter()
+            tmp = root / f"{name}-{version}.tmp"
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir(parents=True)
+            write(tmp, build())
+            os.replace(tmp, target)
+            # Workers still mapping an old version keep their open files (POSIX unlink semantics)
+            for old in root.glob(f"{name}-*"):
+                if old != target:
+                    shutil.rmtree(old, ignore_errors=True)
+            print(f"Wrote shared snapshot {target.name} in {time.perf_counter() - start:.2f}s")
+    return read(target)
+
+
+def save_arrays(folder: Path, arrays: dict):
+    for key, arr in arrays.items():
+        np.save(folder / f"{key}.npy", np.ascontiguousarray(arr))
+
+
+def open_array(folder: Path, key: str) -> np.ndarray:
+    """Read-only memory map: every worker shares the same page-cache pages."""
+    return np.load(folder / f"{key}.npy", mmap_mode="r")
+
+
+class ForecastStore:
+    """
+    Forecast results in SQLite (WAL mode, so readers never block each other), keyed by the
+    same tuple as the in-process cache, plus the last fitted Prophet parameters per series.
+    `fit_lock(key)` makes a worker that misses wait while another worker fits the same series
+    instead of fitting it again.
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = folder
+        self.path = folder / "forecasts.sqlite"
+        self._local = threading.local()
+        folder.mkdir(parents=True, exist_ok=True)
+        with file_lock(folder / "forecasts.lock"):
+            conn = self._conn()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS forecasts ("
+                "key TEXT PRIMARY KEY, version TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            # Last fitted parameters per series, kept across data versions for warm starts
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fit_params ("
+                "series TEXT NOT NULL, metric TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (series, metric))"
+            )
+            conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+        return conn
+
+    @staticmethod
+    def _key(key: tuple) -> str:
+        return json.dumps(key)
+
+    @traced("forecast_store_get")
+    def get(self, key: tuple):
+        row = self._conn().execute("SELECT payload FROM forecasts WHERE key = ?", (self._key(key),)).fetchone()
+        if row is None:
+            return None
+        cols = json.loads(row[0])
+        fc = pd.DataFrame(cols)
+        fc["ds"] = pd.to_datetime(fc["year"].astype(str) + "-01-01")
+        return fc[["ds", "year", "yhat", "yhat_lower", "yhat_upper"]]
+
+    def put(self, key: tuple, version: str, fc: pd.DataFrame):
+        payload = json.dumps({c: fc[c].tolist() for c in ("year", "yhat", "yhat_lower", "yhat_upper")})
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO forecasts (key, version, payload, created) VALUES (?, ?, ?, ?)",
+            (self._key(key), version, payload, time.time()),
+        )
+        conn.commit()
+
+    def get_params(self, series: str, metric: str):
+        row = self._conn().execute(
+            "SELECT payload FROM fit_params WHERE series = ? AND metric = ?", (series, metric)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_params(self, series: str, metric: str, entry: dict):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO fit_params (series, metric, payload, created) VALUES (?, ?, ?, ?)",
+            (series, metric, json.dumps(entry), time.time()),
+        )
+        conn.commit()
+
+    def prune(self, version: str) -> int:
+        """Drop forecasts computed from other data versions."""
+        conn = self._conn()
+        n = conn.execute("DELETE FROM forecasts WHERE version != ?", (version,)).rowcount
+        conn.commit()
+        return n
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM forecasts").fetchone()[0]
+
+    @contextmanager
+    def fit_lock(self, key: tuple):
+        digest = hashlib.sha1(self._key(key).encode()).hexdigest()[:16]
+        with file_lock(self.folder / "locks" / f"{digest}.lock"):
+            yield
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_forecast_store():
+    """The process-wide ForecastStore, or None when the shared cache is off."""
+    global _store
+    root = shared_dir()
+    if root is None:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = ForecastStore(root)
+        return _store
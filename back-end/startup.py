@@ -0,0 +1,68 @@
+import threading
+import time
+import traceback
+from metrics import REGISTRY
+
+# Startup stages run from the app lifespan; their state backs /healthz and /readyz
+
+STARTUP_STAGE = REGISTRY.gauge("startup_stage_seconds", "Duration of each startup stage.", ("stage", "status"))
+
+
+class Startup:
+    """
+    Ordered startup stages with status (pending, running, ok, failed), timing and error.
+    A failed required stage aborts startup; a failed optional one leaves the app degraded but ready.
+    """
+
+    def __init__(self, stages: dict):
+        # stages: {name: required}
+        self.started = time.time()
+        self.stages = {
+            name: {"stage": name, "required": required, "status": "pending", "duration_ms": None, "error": None}
+            for name, required in stages.items()
+        }
+        self._lock = threading.Lock()
+
+    def run(self, name: str, fn):
+        stage = self.stages[name]
+        with self._lock:
+            stage["status"] = "running"
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            self._finish(stage, "failed", start, f"{type(e).__name__}: {e}")
+            print(f"ERROR: startup stage '{name}' failed: {e}")
+            traceback.print_exc()
+            if stage["required"]:
+                raise
+            return None
+        self._finish(stage, "ok", start)
+        print(f"Startup stage '{name}' done in {stage['duration_ms']:.0f} ms")
+        return result
+
+    def _finish(self, stage: dict, status: str, start: float, error: str = None):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            stage.update(status=status, duration_ms=round(elapsed * 1000, 1), error=error)
+        STARTUP_STAGE.set(elapsed, stage=stage["stage"], status=status)
+
+    @property
+    def ready(self) -> bool:
+        """Every stage has finished and no required stage failed."""
+        with self._lock:
+            return all(
+                s["status"] == "ok" or (s["status"] == "failed" and not s["required"])
+                for s in self.stages.values()
+            )
+
+    def report(self) -> dict:
+        ready = self.ready
+        with self._lock:
+            stages = [dict(s) for s in self.stages.values()]
+        return {
+            "ready": ready,
+            "degraded": any(s["status"] == "failed" for s in stages),
+            "uptime_s": round(time.time() - self.started, 1),
+            "stages": stages,
+        }
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# The tests import the back-end modules directly, with the shared cache off
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("SHARED_CACHE_DIR", "")
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from affordability import FEE_SHARE, MONTHLY_RATE, months_to_buy
+
+
+def test_months_to_buy_matches_the_annuity_formula():
+    price, salary = 300_000, 5_000
+    fee = salary * FEE_SHARE
+    expected = -np.log(1 - price * MONTHLY_RATE / fee) / np.log(1 + MONTHLY_RATE)
+    assert months_to_buy(price, salary) == pytest.approx(expected)
+
+
+def test_months_to_buy_is_inf_when_the_fee_does_not_cover_interest():
+    fee = 1_000 * FEE_SHARE
+    at_limit = fee / MONTHLY_RATE  # x == 1
+    months = months_to_buy([at_limit, at_limit * 2, at_limit * 0.5], 1_000)
+    assert np.isinf(months[0]) and np.isinf(months[1])
+    assert np.isfinite(months[2])
+
+
+def test_months_to_buy_broadcasts_and_keeps_nan():
+    months = months_to_buy(np.array([[200_000], [np.nan]]), np.array([3_000, 6_000]))
+    assert months.shape == (2, 2)
+    assert months[0, 0] > months[0, 1]
+    assert np.isnan(months[1]).all()
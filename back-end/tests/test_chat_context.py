@@ -0,0 +1,32 @@
+import pandas as pd
+from chat_context import ChatContextIndex
+
+DF = pd.DataFrame({
+    "Area": ["Camden", "Camden", "Hackney", "Hackney"],
+    "year": [2021, 2022, 2021, 2022],
+    "house_price": [800_000.0, 820_000.0, 600_000.0, 610_000.0],
+    "annual_income": [50_000.0, 52_000.0, 40_000.0, 41_000.0],
+})
+RENTS = {"Camden": ("Camden: 1-bed £2,000", 2000.0), "Hackney": ("Hackney: 1-bed £1,800", 1800.0)}
+
+
+def test_detect_boroughs_years_and_metrics():
+    info = ChatContextIndex(DF, RENTS).detect("What did a flat in Camden cost in 2021?")
+    assert info == {"boroughs": ["Camden"], "years": [2021], "metrics": ["house_price"]}
+
+
+def test_let_me_know_does_not_pull_in_rents():
+    index = ChatContextIndex(DF, RENTS)
+    assert "rent" not in index.detect("Let me know the average price")["metrics"]
+    assert "rent" in index.detect("Are there lettings agents with cheap 1 bed flats?")["metrics"]
+
+    context, _ = index.build("Let me know the average price")
+    assert "£2,000" not in context
+
+
+def test_forecast_changes_the_version():
+    index = ChatContextIndex(DF, RENTS)
+    before = index.version
+    index.set_forecast("Year 2023: Predicted Mean House Price £700,000\n")
+    assert index.version != before
+    assert "FORECAST" in index.build("prices?")[0]
@@ -0,0 +1,74 @@
+from chat_sessions import SessionStore, extract_facts, valid_session_id
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_valid_session_id():
+    sid = "0123456789abcdef0123456789abcdef"
+    assert valid_session_id(sid) == sid
+    assert valid_session_id(sid.upper()) is None
+    assert valid_session_id(sid[:-1]) is None
+    assert valid_session_id("../../" + sid[6:]) is None
+    assert valid_session_id("") is None
+    assert valid_session_id(None) is None
+
+
+def test_malformed_id_starts_a_new_session():
+    store = SessionStore()
+    session = store.get("not-an-id")
+    assert valid_session_id(session.session_id) == session.session_id
+    assert store.get(session.session_id) is session
+
+
+def test_extract_facts():
+    facts = extract_facts("I earn £55k and want a 2 bed, budget up to 400,000")
+    assert facts == {"salary": 55_000, "budget": 400_000, "bedrooms": 2}
+
+
+def test_sessions_expire_after_ttl():
+    clock = Clock()
+    store = SessionStore(ttl=60, clock=clock)
+    session = store.get()
+
+    clock.now = 59
+    assert store.get(session.session_id) is session
+    clock.now = 119
+    assert store.get(session.session_id) is not session
+    assert store.stats()["expired"] == 1
+
+
+def test_least_recently_used_session_is_evicted():
+    store = SessionStore(max_sessions=2)
+    a, b = store.get(), store.get()
+    store.get(a.session_id)
+    store.get()
+
+    assert store.stats()["sessions"] == 2
+    assert store.stats()["evicted"] == 1
+    assert store.get(a.session_id) is a
+    assert store.get(b.session_id) is not b
+
+
+def test_memory_cap_evicts_but_keeps_the_current_session():
+    store = SessionStore(max_bytes=1500)
+    old = store.get()
+    current = store.get()
+    current.add_turn("x" * 400, "y" * 400)
+    store.save(current)
+
+    assert store.stats()["sessions"] == 1
+    assert store.get(current.session_id) is current
+    assert store.get(old.session_id) is not old
+
+
+def test_size_counts_the_session_id():
+    store = SessionStore()
+    session = store.get()
+    assert store.stats()["bytes"] == session.size_bytes()
+    assert session.size_bytes() > len(session.session_id)
@@ -0,0 +1,55 @@
+import pytest
+from rate_limit import DEFAULT_LIMITS, RateLimiter, TokenBucket, load_limits
+
+
+def test_bucket_starts_full_and_refills_at_rate():
+    bucket = TokenBucket(rate=0.5, burst=2, now=0)
+    assert bucket.take(1, now=0) == 0
+    assert bucket.take(1, now=0) == 0
+    assert bucket.take(1, now=0) == pytest.approx(2.0)  # 1 token at 0.5/s
+
+    assert bucket.take(1, now=2) == 0
+    assert bucket.take(1, now=100) == 0
+    assert bucket.tokens == pytest.approx(1)  # refill stops at burst
+
+
+def test_charge_can_go_into_debt():
+    bucket = TokenBucket(rate=1, burst=5, now=0)
+    bucket.take(1, now=0)
+    bucket.charge(10, now=0)
+
+    assert bucket.tokens == pytest.approx(-6)
+    assert bucket.take(1, now=0) == pytest.approx(7)
+    assert bucket.take(1, now=7) == 0
+
+
+def test_limiter_miss_cost_delays_the_next_request():
+    limiter = RateLimiter({"/r": {"rate": 0.001, "burst": 5, "cost": 1, "miss_cost": 4}})
+    assert limiter.admit("a", "/r") == 0
+    limiter.charge("a", "/r", 4)
+
+    assert limiter.admit("a", "/r") > 0
+    assert limiter.admit("b", "/r") == 0  # buckets are per client
+
+
+def test_limiter_drops_least_recently_used_clients():
+    limiter = RateLimiter({"/r": {"rate": 0.001, "burst": 1, "cost": 1}}, max_clients=2)
+    limiter.admit("a", "/r")
+    limiter.admit("b", "/r")
+    limiter.admit("c", "/r")
+
+    assert limiter.admit("a", "/r") == 0  # a's empty bucket was dropped, so it starts full again
+    assert limiter.admit("c", "/r") > 0
+
+
+def test_load_limits_merges_overrides(monkeypatch):
+    monkeypatch.delenv("RATE_LIMIT_ENABLED", raising=False)
+    monkeypatch.setenv("RATE_LIMITS", '{"/api/forecast": {"rate": 2}, "/api/chat": null, "/api/compare": {"burst": 3}}')
+    limits = load_limits()
+
+    assert limits["/api/forecast"] == {**DEFAULT_LIMITS["/api/forecast"], "rate": 2}
+    assert "/api/chat" not in limits
+    assert limits["/api/compare"] == {"rate": 1.0, "burst": 3, "cost": 1, "miss_cost": 0}
+
+    monkeypatch.setenv("RATE_LIMIT_ENABLED", "0")
+    assert load_limits() == {}
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from reconcile import reconcile, shrunk_correlation
+
+
+def test_bottom_up_is_the_mean_of_the_boroughs():
+    yhat = np.array([100.0, 200.0, 300.0, 400.0])
+    sd = np.array([10.0, 10.0, 10.0, 10.0])
+
+    mean, london_sd, bottom = reconcile(yhat, sd, np.eye(4), "bottom_up")
+    assert mean == pytest.approx(250)
+    assert london_sd == pytest.approx(5)  # independent: 10 / sqrt(4)
+    assert bottom is yhat
+
+    _, correlated_sd, _ = reconcile(yhat, sd, np.ones((4, 4)), "bottom_up")
+    assert correlated_sd == pytest.approx(10)
+
+
+def test_mint_keeps_forecasts_that_are_already_coherent():
+    boroughs = np.array([100.0, 200.0, 300.0])
+    yhat = np.concatenate([[boroughs.mean()], boroughs])
+    sd = np.full(4, 10.0)
+
+    mean, _, bottom = reconcile(yhat, sd, np.eye(4), "mint")
+    assert mean == pytest.approx(200)
+    assert bottom == pytest.approx(boroughs)
+
+
+def test_mint_is_coherent_and_pulled_towards_the_london_model():
+    boroughs = np.array([100.0, 200.0, 300.0])
+    yhat = np.concatenate([[260.0], boroughs])
+    sd = np.full(4, 10.0)
+
+    mean, london_sd, bottom = reconcile(yhat, sd, np.eye(4), "mint")
+    assert mean == pytest.approx(bottom.mean())
+    assert 200 < mean < 260
+    _, bottom_up_sd, _ = reconcile(boroughs, sd[1:], np.eye(3), "bottom_up")
+    assert london_sd < bottom_up_sd  # the London model adds information
+
+
+def test_shrunk_correlation_is_a_valid_correlation_matrix():
+    rng = np.random.default_rng(0)
+    common = rng.normal(size=(6, 1))
+    resid = common + 0.5 * rng.normal(size=(6, 10))  # more series than observations
+    corr = shrunk_correlation(resid)
+
+    assert corr.shape == (10, 10)
+    assert np.allclose(np.diag(corr), 1)
+    assert np.allclose(corr, corr.T)
+    assert np.linalg.eigvalsh(corr).min() > 0
+
+
+def test_shrunk_correlation_needs_three_observations():
+    assert np.array_equal(shrunk_correlation(np.ones((2, 3))), np.eye(3))
@@ -0,0 +1,66 @@
+from response_cache import ResponseCache, normalize_message
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalize_message_treats_amount_spellings_alike():
+    assert normalize_message("Can I afford £50,000?") == normalize_message("can i afford 50k")
+    assert normalize_message("Hi, what about 1.2m please") == "what about 1200000"
+
+
+def test_hit_and_miss_by_version_and_signature():
+    cache = ResponseCache()
+    cache.put("Prices in Camden?", "v1", "reply", ("Camden",))
+
+    assert cache.get("prices in camden", "v1", ("Camden",)) == "reply"
+    assert cache.get("prices in camden", "v2", ("Camden",)) is None
+    assert cache.get("prices in camden", "v1", ("Hackney",)) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_entries_expire_after_ttl():
+    clock = Clock()
+    cache = ResponseCache(ttl=10, clock=clock)
+    cache.put("question", "v1", "reply")
+
+    clock.now = 9.9
+    assert cache.get("question", "v1") == "reply"
+    clock.now = 10
+    assert cache.get("question", "v1") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put("first", "v1", "1")
+    cache.put("second", "v1", "2")
+    cache.get("first", "v1")
+    cache.put("third", "v1", "3")
+
+    assert cache.get("second", "v1") is None
+    assert cache.get("first", "v1") == "1"
+    assert cache.get("third", "v1") == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_similar_messages_share_a_reply_only_with_the_same_numbers():
+    cache = ResponseCache(similarity=0.6)
+    cache.put("is camden affordable on my 50k salary", "v1", "reply", ("Camden",))
+
+    assert cache.get("is camden affordable with my 50k salary", "v1", ("Camden",)) == "reply"
+    assert cache.get("is camden affordable with my 60k salary", "v1", ("Camden",)) is None
+    assert cache.get("what are the best schools", "v1", ("Camden",)) is None
+    assert cache.stats()["similar_hits"] == 1
+
+
+def test_no_similarity_matching_by_default():
+    cache = ResponseCache()
+    cache.put("is camden affordable on my 50k salary", "v1", "reply")
+    assert cache.get("is camden affordable with my 50k salary", "v1") is None
@@ -0,0 +1,108 @@
+import threading
+import time
+import pandas as pd
+import pytest
+import forecast_model
+from singleflight import SingleFlight
+
+CALLERS = 8
+
+
+def run_together(fn, n: int = CALLERS) -> list:
+    """Call `fn` from `n` threads released at once; returns each thread's (result, error)."""
+    barrier = threading.Barrier(n)
+    out = [None] * n
+
+    def worker(i):
+        barrier.wait()
+        try:
+            out[i] = (fn(), None)
+        except Exception as e:
+            out[i] = (None, e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    return out
+
+
+class SlowCounter:
+    """Counts its calls and holds each one long enough for every caller to join it."""
+
+    def __init__(self, result=None, error: Exception = None, delay: float = 0.3):
+        self.calls = 0
+        self.result = result if result is not None else object()
+        self.error = error
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_do_runs_once_for_concurrent_callers():
+    flight, fn = SingleFlight(), SlowCounter()
+    out = run_together(lambda: flight.do("key", fn))
+
+    assert fn.calls == 1
+    assert all(error is None for _, error in out)
+    assert all(result is fn.result for (result, _), _ in out)
+    assert sorted(shared for (_, shared), _ in out) == [False] + [True] * (CALLERS - 1)
+    assert flight.in_flight() == 0
+
+
+def test_do_passes_leader_error_to_followers():
+    flight, fn = SingleFlight(), SlowCounter(error=ValueError("fit failed"))
+    out = run_together(lambda: flight.do("key", fn))
+
+    assert fn.calls == 1
+    assert all(result is None for result, _ in out)
+    assert all(error is fn.error for _, error in out)
+    assert flight.in_flight() == 0
+
+
+def test_do_keeps_nothing_after_the_call():
+    flight, fn = SingleFlight(), SlowCounter(delay=0)
+    flight.do("key", fn)
+    flight.do("key", fn)
+    assert fn.calls == 2
+
+
+@pytest.fixture
+def counted_fit(monkeypatch):
+    """forecast_model with `_fit` replaced by a slow counter and empty caches."""
+    fc = pd.DataFrame({"ds": pd.to_datetime(["2030-01-01"]), "year": [2030], "yhat": [1.0],
+                       "yhat_lower": [0.5], "yhat_upper": [1.5]})
+    fit = SlowCounter(result=fc)
+    monkeypatch.setattr(forecast_model, "_fit", fit)
+    monkeypatch.setattr(forecast_model, "get_forecast_store", lambda: None)
+    monkeypatch.setattr(forecast_model, "_forecast_cache", forecast_model.OrderedDict())
+    return fit
+
+
+def test_forecast_series_fits_once_for_concurrent_callers(counted_fit):
+    out = run_together(lambda: forecast_model.forecast_series("Camden", None, "house_price", 5, "v1"))
+
+    assert counted_fit.calls == 1
+    assert all(error is None for _, error in out)
+    assert all(result is counted_fit.result for result, _ in out)
+
+    # later calls are cache hits
+    forecast_model.forecast_series("Camden", None, "house_price", 5, "v1")
+    assert counted_fit.calls == 1
+
+
+def test_forecast_series_passes_fit_error_to_followers(counted_fit):
+    counted_fit.error = RuntimeError("optimizer failed")
+    out = run_together(lambda: forecast_model.forecast_series("Camden", None, "house_price", 5, "v1"))
+
+    assert counted_fit.calls == 1
+    assert all(error is counted_fit.error for _, error in out)
+    assert len(forecast_model._forecast_cache) == 0
@@ -0,0 +1,327 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from fastapi.routing import APIRoute
+
+# Request tracing. Every request gets an ID - the caller's X-Request-ID, or a new one - that is
+# echoed on the response and passed on to upstream LLM calls. A sample of requests
+# (TRACE_SAMPLE_RATE, default 1%; with TRACE_DEBUG=1, also any request sent with "X-Trace: 1") records timed
+# spans around the stages that can be slow: borough resolution, data slicing, Prophet prep, fit
+# and predict, SQL queries, serialization and LLM calls. Finished traces go to a ring buffer
+# (/api/debug/traces, only registered with TRACE_DEBUG=1) and, with TRACE_FILE set, are appended
+# to a JSON lines file by a writer thread.
+#
+# Outside a sampled request a span costs one contextvar lookup. TRACING_ENABLED=0 installs nothing.
+
+REQUEST_ID_HEADER = b"x-request-id"
+TRACE_HEADER = b"x-trace"
+UNTRACED = ("/api/debug", "/healthz", "/readyz", "/metrics", "/static")
+MAX_SPANS = 1000  # per trace; later spans are counted in `dropped_spans`
+FILE_QUEUE_SIZE = 1000  # traces waiting for the writer thread; more are dropped from the file
+_VALID_ID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_trace = contextvars.ContextVar("trace", default=None)
+_parent = contextvars.ContextVar("trace_parent", default=None)
+
+
+def tracing_enabled() -> bool:
+    return os.getenv("TRACING_ENABLED", "1").lower() not in ("0", "false", "no")
+
+
+def trace_debug_enabled() -> bool:
+    """Whether callers may force a trace with X-Trace and read traces from /api/debug/traces."""
+    return os.getenv("TRACE_DEBUG", "").lower() in ("1", "true", "yes")
+
+
+def current_request_id():
+    """ID of the request being handled (None outside a request)."""
+    return _request_id.get()
+
+
+class Trace:
+    def __init__(self, request_id: str, method: str, path: str, query: str):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.query = query
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.endpoint_end = None  # set when the endpoint function returns (see TracedRoute)
+        self.spans = []
+        self.dropped = 0
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def add(self, span_id: int, name: str, parent, start: float, end: float, attrs: dict, error: str = None):
+        entry = {
+            "id": span_id,
+            "parent": parent,
+            "name": name,
+            "start_ms": round((start - self.start) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+        }
+        if attrs:
+            entry["attrs"] = attrs
+        if error:
+            entry["error"] = error
+        with self._lock:
+            if len(self.spans) < MAX_SPANS:
+                self.spans.append(entry)
+            else:
+                self.dropped += 1
+
+    def to_dict(self, route: str, status: int) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "route": route,
+            "status": status,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "spans": spans,
+            "dropped_spans": self.dropped,
+        }
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time the block as a span of the current trace (a no-op when the request is not sampled).
+    Yields the attribute dict, so the block can add results, e.g. `attrs["cache"] = "hit"`.
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield attrs
+        return
+
+    span_id = trace.next_id()
+    parent = _parent.get()
+    token = _parent.set(span_id)
+    error = None
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        end = time.perf_counter()
+        _parent.reset(token)
+        trace.add(span_id, name, parent, start, end, attrs, error)
+
+
+def traced(name: str):
+    """Decorator form of `span` for a whole function."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _trace.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class TraceExporter:
+    """
+    The last `size` traces in memory, and optionally every trace appended to a JSON lines file.
+    `export` is called on the event loop, so file writes are queued to a writer thread.
+    """
+
+    def __init__(self, size: int = 200, path: Path = None):
+        self.path = path
+        self._buffer = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.file_dropped = 0
+        self._queue = queue.Queue(maxsize=FILE_QUEUE_SIZE)
+        self._writer = None
+
+    def export(self, trace: dict):
+        with self._lock:
+            self._buffer.append(trace)
+            self.exported += 1
+            if self.path is None:
+                return
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+                self._writer.start()
+            try:
+                self._queue.put_nowait(trace)
+            except queue.Full:
+                self.file_dropped += 1
+
+    def _write_loop(self):
+        while True:
+            trace = self._queue.get()
+            if trace is None:
+                return
+            try:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(trace) + "\n")
+                    while not self._queue.empty():  # write a backlog with one open
+                        trace = self._queue.get_nowait()
+                        if trace is None:
+                            return
+                        f.write(json.dumps(trace) + "\n")
+            except OSError as e:
+                print(f"Trace file write failed: {e}")
+
+    def close(self, timeout: float = 5):
+        """Write out the queued traces and stop the writer thread."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join(timeout)
+
+    def recent(self, limit: int = 50, route: str = None, min_ms: float = None) -> list:
+        """Newest first, optionally only one route template and/or traces of at least `min_ms`."""
+        with self._lock:
+            traces = list(self._buffer)
+        out = []
+        for t in reversed(traces):
+            if (route is None or t["route"] == route) and (min_ms is None or t["duration_ms"] >= min_ms):
+                out.append(t)
+                if len(out) >= limit:
+                    break
+        return out
+
+    def get(self, request_id: str):
+        with self._lock:
+            return next((t for t in reversed(self._buffer) if t["request_id"] == request_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"buffered": len(self._buffer), "capacity": self._buffer.maxlen, "exported": self.exported,
+                    "file": str(self.path) if self.path else None, "file_dropped": self.file_dropped}
+
+
+exporter = TraceExporter(
+    int(os.getenv("TRACE_BUFFER", "200")),
+    Path(os.environ["TRACE_FILE"]) if os.getenv("TRACE_FILE") else None,
+)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that assigns the request ID (returned as X-Request-ID) and, for sampled
+    requests, collects the trace and hands it to the exporter when the response is done.
+    X-Trace is ignored unless `allow_forced` (default: TRACE_DEBUG=1).
+    """
+
+    def __init__(self, app, sample_rate: float = None, allow_forced: bool = None):
+        self.app = app
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+        self.allow_forced = allow_forced if allow_forced is not None else trace_debug_enabled()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id, forced = _read_headers(scope)
+        request_id = request_id or uuid.uuid4().hex
+        forced = forced and self.allow_forced
+        trace = None
+        if not scope["path"].startswith(UNTRACED) and (forced or random.random() < self.sample_rate):
+            trace = Trace(request_id, scope["method"], scope["path"], scope.get("query_string", b"").decode())
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER, request_id.encode())]
+            await send(message)
+
+        id_token = _request_id.set(request_id)
+        trace_token = _trace.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(trace_token)
+            _request_id.reset(id_token)
+            if trace is not None:
+                route = getattr(scope.get("route"), "path", "unmatched")
+                exporter.export(trace.to_dict(route, status["code"]))
+
+
+class TracedRoute(APIRoute):
+    """
+    Route class adding an `endpoint` span around the path function and a `serialize` span
+    for what follows it: response validation, JSON encoding and building the response.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _traced_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            trace = _trace.get()
+            response = await handler(request)
+            if trace is not None and trace.endpoint_end is not None:
+                trace.add(trace.next_id(), "serialize", None, trace.endpoint_end, time.perf_counter(), {})
+            return response
+
+        return traced_handler
+
+
+def _traced_endpoint(fn):
+    # Same sync/async kind as `fn`, so FastAPI still runs sync endpoints in its thread pool
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            trace = _trace.get()
+            if trace is None:
+                return await fn(*args, **kwargs)
+            with span("endpoint"):
+                result = await fn(*args, **kwargs)
+            trace.endpoint_end = time.perf_counter()
+            return result
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = _trace.get()
+            if trace is None:
+                return fn(*args, **kwargs)
+            with span("endpoint"):
+                result = fn(*args, **kwargs)
+            trace.endpoint_end = time.perf_counter()
+            return result
+    return wrapper
+
+
+def _read_headers(scope) -> tuple:
+    """(valid X-Request-ID or None, whether X-Trace forces sampling)."""
+    request_id, forced = None, False
+    for key, value in scope.get("headers", ()):
+        if key == REQUEST_ID_HEADER:
+            candidate = value.decode("latin-1").strip()
+            request_id = candidate if _VALID_ID.match(candidate) else None
+        elif key == TRACE_HEADER:
+            forced = value.strip() not in (b"", b"0", b"false")
+    return request_id, forced
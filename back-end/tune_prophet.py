@@ -0,0 +1,148 @@
+"""
+Prophet tuning job: grid-searches the changepoint settings of every series (each borough and the
+London mean, per metric) with rolling-origin cross-validation, in parallel across cores, and
+writes the best settings to the file the API loads at startup (forecast_model.PROPHET_PARAMS_FILE).
+
+    python tune_prophet.py [--workers 4] [--horizon 3] [--folds 5] [--boroughs Camden,Hackney] [--out FILE]
+
+Rolling origin: for each of the last `--folds` cutoffs, fit on the years before it and score the
+next `--horizon` years (MAPE on the original scale). A series keeps DEFAULT_SETTINGS unless the
+best grid point beats them by MIN_GAIN. Restart the API to pick up a new file.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault("SHARED_CACHE_DIR", "")
+
+from data_store import load_dataset, METRICS
+from forecast_model import prep_prophet_df, fit_prophet_model, DEFAULT_SETTINGS, PARAMS_FORMAT, PROPHET_PARAMS_FILE
+from reconcile import london_mean
+
+GRID = {
+    "changepoint_prior_scale": (0.01, 0.05, 0.1, 0.25, 0.5),
+    # no 0.95: with 20-odd yearly points it puts a changepoint on the last year, LBFGS fails and
+    # Prophet falls back to Newton (~6 s a fit)
+    "changepoint_range": (0.7, 0.8, 0.9),
+}
+MIN_GAIN = 0.05  # relative CV error improvement needed to move a series off the defaults
+MIN_TRAIN = 8  # fit_prophet_model's minimum history
+
+
+def grid() -> list:
+    return [dict(zip(GRID, values)) for values in product(*GRID.values())]
+
+
+def cv_mape(df_ts: pd.DataFrame, settings: dict, horizon: int, folds: int) -> float:
+    """Mean absolute % error of `horizon`-year forecasts from the last `folds` origins (NaN if none fit)."""
+    errors = []
+    for origin in range(len(df_ts) - horizon, len(df_ts) - horizon - folds, -1):
+        if origin < MIN_TRAIN:
+            break
+        m = fit_prophet_model(df_ts.iloc[:origin], settings=settings)
+        m.uncertainty_samples = 0  # only yhat is scored
+        test = df_ts.iloc[origin: origin + horizon]
+        pred = m.predict(test[["ds"]])["yhat"].to_numpy()
+        errors.extend(np.abs(np.exp(pred - test["y"].to_numpy()) - 1))
+    return float(np.mean(errors) * 100) if errors else float("nan")
+
+
+def tune_series(series: str, metric: str, d: pd.DataFrame, horizon: int, folds: int) -> dict:
+    """CV error of every grid point for one series, and the settings to use."""
+    df_ts = prep_prophet_df(d, metric)
+    scores = [(settings, cv_mape(df_ts, settings, horizon, folds)) for settings in grid()]
+    scored = [(s, e) for s, e in scores if not np.isnan(e)]
+    if not scored:
+        return {"series": series, "metric": metric, "fits": 0}
+
+    default_mape = next(e for s, e in scored if s == DEFAULT_SETTINGS)
+    best, best_mape = min(scored, key=lambda se: se[1])
+    if best_mape > default_mape * (1 - MIN_GAIN):
+        best, best_mape = DEFAULT_SETTINGS, default_mape
+    return {
+        "series": series,
+        "metric": metric,
+        "fits": len(scores) * min(folds, max(len(df_ts) - horizon - MIN_TRAIN + 1, 0)),
+        "settings": {**best, "cv_mape": round(best_mape, 3), "default_mape": round(default_mape, 3)},
+    }
+
+
+def _quiet():
+    logging.getLogger("cmdstanpy").disabled = True
+
+
+def write_config(path: Path, results: list, data_version: str, horizon: int, folds: int) -> dict:
+    """Write the settings file atomically. `version` is a hash of the settings, so it only changes with them."""
+    series = {}
+    for r in sorted(results, key=lambda r: (r["series"], r["metric"])):
+        if "settings" in r:
+            series.setdefault(r["series"], {})[r["metric"]] = r["settings"]
+    chosen = {name: {m: {k: v[k] for k in DEFAULT_SETTINGS} for m, v in metrics.items()} for name, metrics in series.items()}
+    config = {
+        "format": PARAMS_FORMAT,
+        "version": hashlib.sha1(json.dumps(chosen, sort_keys=True).encode()).hexdigest()[:12],
+        "data_version": data_version,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cv": {"horizon": horizon, "folds": folds, "min_gain": MIN_GAIN},
+        "grid": GRID,
+        "defaults": DEFAULT_SETTINGS,
+        "series": series,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(config, indent=2) + "\n")
+    tmp.replace(path)
+    return config
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes (default: one per core)")
+    parser.add_argument("--horizon", type=int, default=3, help="Years scored after each cutoff")
+    parser.add_argument("--folds", type=int, default=5, help="Cutoffs, one year apart, ending `horizon` years before the last")
+    parser.add_argument("--boroughs", help="Comma-separated boroughs (default all); London is always tuned")
+    parser.add_argument("--out", type=Path, default=PROPHET_PARAMS_FILE, help="Settings file to write")
+    args = parser.parse_args()
+
+    data = load_dataset()
+    names = [data.resolve(b) for b in args.boroughs.split(",")] if args.boroughs else list(data.boroughs)
+    frames = {name: data.rows(name) for name in names}
+    frames["London"] = london_mean(data)
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_quiet) as pool:
+        futures = [
+            pool.submit(tune_series, name, metric, d, args.horizon, args.folds)
+            for name, d in frames.items() for metric in METRICS
+        ]
+        for i, future in enumerate(as_completed(futures), 1):
+            r = future.result()
+            results.append(r)
+            s = r.get("settings")
+            detail = (f"cps {s['changepoint_prior_scale']:<5g} cr {s['changepoint_range']:<5g} "
+                      f"mape {s['cv_mape']:6.2f}% (default {s['default_mape']:.2f}%)") if s else "not enough data"
+            print(f"[{i}/{len(futures)}] {r['series']:24} {r['metric']:14} {detail}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    config = write_config(args.out, results, data.version, args.horizon, args.folds)
+    tuned = [r["settings"] for r in results if "settings" in r]
+    moved = sum(any(s[k] != v for k, v in DEFAULT_SETTINGS.items()) for s in tuned)
+    print(f"{len(tuned)} series, {sum(r['fits'] for r in results)} fits in {elapsed:.1f}s on {args.workers} workers")
+    print(f"{moved} series moved off the defaults; mean CV MAPE {np.mean([s['default_mape'] for s in tuned]):.2f}% "
+          f"-> {np.mean([s['cv_mape'] for s in tuned]):.2f}%")
+    print(f"Wrote {args.out} (version {config['version']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,6 +26,7 @@ export class ChatbotComponent {
   ]);
   inputMessage = signal('');
   isLoading = signal(false);
+  private sessionId: string | null = null;
 
   toggleChat() {
     this.isOpen.set(!this.isOpen());
@@ -48,8 +49,12 @@ export class ChatbotComponent {
 
     try {
       const response = await firstValueFrom(
-        this.http.post<{response: string}>('http://localhost:8000/api/chat', { message: userText })
+        this.http.post<{response: string, session_id: string}>('http://localhost:8000/api/chat', {
+          message: userText,
+          session_id: this.sessionId
+        })
       );
+      this.sessionId = response.session_id;
 
       this.messages.update(msgs => [...msgs, {
         text: response.response,